@@ -0,0 +1,224 @@
+#Command line entry point gathering the scripts of the repository as subcommands:
+#
+#  python argbase.py eval pred.json ref.json [pred2.json ref2.json ...]
+#  python argbase.py view data.json [data2.json ...]
+#  python argbase.py import brat_dir [brat_dir2 ...] --outdir json_dir
+#  python argbase.py merge json_dir out.json [json_dir2 out2.json ...]
+#  python argbase.py split json_dir dev.dat test.dat
+#
+#Only argparse is imported at startup, each subcommand imports the modules it
+#needs when it runs: evaluating small shards never loads numpy, nltk or
+#multiprocessing. Each subcommand accepts many inputs, processed by a single
+#invocation, so that the startup cost is paid once for all the shards.
+
+import os
+import sys
+
+
+def group(items,arity,what):
+    """
+    Groups a flat list of command line arguments into tuples
+    Args:
+       items (list) : the arguments
+       arity (int)  : the size of a tuple
+       what (str)   : a description of the tuples for error messages
+    Returns:
+       list of tuples
+    """
+    if not items or len(items) % arity:
+        raise Exception(f'Expected a list of {what}, got {len(items)} arguments. aborting.')
+    return [ tuple(items[i:i+arity]) for i in range(0,len(items),arity) ]
+
+
+def read_dataset(path,stream=False,selection=None):
+    """
+    Reads a dataset as evaluate.py and view_data.py do
+    Args:
+       path (str)        : json, json-lines, shard index or columnar corpus
+       stream (bool)     : whether the documents are read one at a time
+       selection (slice) : the selected document numbers, or None
+    Returns:
+       list or iterator of documents
+    """
+    from dataset_io import iter_documents,load_dataset,select_documents
+    if selection is not None:
+        return select_documents(path,selection)
+    return iter_documents(path) if stream else load_dataset(path)
+
+
+def eval_pair(pair,alpha=0.5,backend='python',stream=False,selection=None,jobs=1,breakdown=False):
+    """
+    Evaluates a pred/ref file pair, errors are returned rather than raised
+    Returns:
+       (results,error). The results of evaluate.eval_views or None, and the error message or None
+    """
+    from evaluate import eval_views
+    pred_file,ref_file = pair
+    try:
+        preds = read_dataset(pred_file,stream,selection)
+        refs  = read_dataset(ref_file,stream,selection)
+        return eval_views(preds,refs,alpha=alpha,backend=backend,jobs=jobs,breakdown=breakdown),None
+    except Exception as e:
+        return None,str(e)
+
+
+def run_eval(args):
+    """
+    Evaluates each pred/ref pair. With several pairs and jobs, the pairs
+    are spread over the processes, otherwise the documents of each pair are.
+    Returns:
+       int. the number of pairs that failed
+    """
+    import json
+    from functools import partial
+    from dataset_io import parse_selection
+    from evaluate import display_breakdown,display_results
+    pairs     = group(args.files,2,'pred_file ref_file pairs')
+    selection = parse_selection(args.doc,args.range)
+    jobs      = args.jobs if args.jobs > 0 else os.cpu_count()
+    evaluate  = partial(eval_pair,alpha=args.alpha,backend=args.backend,stream=args.stream,selection=selection,breakdown=args.breakdown)
+    pool      = None
+    if len(pairs) > 1 and jobs > 1:
+        import multiprocessing
+        pool    = multiprocessing.Pool(min(jobs,len(pairs)))
+        outputs = pool.imap(evaluate,pairs)
+    else:
+        outputs = map(partial(evaluate,jobs=jobs),pairs)
+
+    failed = 0
+    try:
+        for (pred_file,ref_file),(results,error) in zip(pairs,outputs):
+            if error is not None:
+                failed += 1
+                print('[error]',pred_file,ref_file,error)
+            elif args.json:
+                print(json.dumps({'pred':pred_file,'ref':ref_file,'results':results}))
+            else:
+                if len(pairs) > 1:
+                    print(f'==> {pred_file} {ref_file} <==')
+                display_results(results,args.alpha)
+                if args.breakdown:
+                    display_breakdown(results['breakdown'])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return failed
+
+
+def run_view(args):
+    """
+    Pretty prints each dataset, as view_data.py does
+    Returns:
+       int. 0
+    """
+    from dataset_io import parse_selection
+    from document import Corpus
+    from view_data import view_dataset,view_stats
+    selection = parse_selection(args.doc,args.range)
+    for path in args.files:
+        if len(args.files) > 1:
+            print(f'==> {path} <==')
+        corpus = Corpus.load(path,selection)
+        view_dataset(corpus)
+        print('-'*80)
+        view_stats(corpus)
+    return 0
+
+
+def run_import(args):
+    """
+    Converts each BRAT directory, as brat_import.py does
+    Returns:
+       int. the number of files that failed
+    """
+    from data.brat_import import convert_directory
+    failed = 0
+    for brat_dir in args.brat_dirs:
+        converted,skipped,errors = convert_directory(brat_dir,outdir=args.outdir,jobs=args.jobs,force=args.force)
+        for filename,error in errors:
+            print(error,filename)
+        print(f'{brat_dir}: {len(converted)} converted, {len(skipped)} unchanged, {len(errors)} failed',file=sys.stderr)
+        failed += len(errors)
+    return failed
+
+
+def run_merge(args):
+    """
+    Merges each json directory into its dataset file, as merge_data.py does
+    Returns:
+       int. 0
+    """
+    from data.merge_data import merge_dir
+    for json_dir,outfile in group(args.files,2,'json_dir outfile pairs'):
+        merge_dir(json_dir,outfile,fmt=args.format,shard_size=args.shard_size)
+    return 0
+
+
+def run_split(args):
+    """
+    Writes the split files of the essays, as make_aae_split.py does
+    Returns:
+       int. 0
+    """
+    from data.make_aae_split import make_split
+    make_split(args.json_dir,args.dev_conll,args.test_conll,args.outdir)
+    return 0
+
+
+def make_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+                    prog='python argbase.py',
+                    description='Argumentation base tools: evaluation, viewing, BRAT import, merging and splitting of datasets.')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    command = commands.add_parser('eval',help="evaluates prediction files against reference files")
+    command.add_argument('files',nargs='+',metavar='pred_file ref_file',help="one or more pred_file ref_file pairs")
+    command.add_argument('--alpha',default=0.5,type=float)
+    command.add_argument('--backend',default='python',choices=['python','numpy'],help="numpy vectorizes the scoring over all the documents")
+    command.add_argument('--stream',action='store_true',help="reads and scores the documents one at a time (json or json-lines files)")
+    command.add_argument('--jobs',default=1,type=int,help="number of processes, spread over the pairs when there are several (0 uses all cores)")
+    command.add_argument('--doc',default=None,type=int,help="evaluates a single document of each pair (the offsets are recorded in a <file>.idx sidecar on first use)")
+    command.add_argument('--range',default=None,metavar='A:B',help="evaluates the documents A to B (excluded) of each pair")
+    command.add_argument('--json',action='store_true',help="outputs one json line of results per pair")
+    command.add_argument('--breakdown',action='store_true',help="adds the per label scores and the span label confusion matrix")
+    command.set_defaults(run=run_eval)
+
+    command = commands.add_parser('view',help="pretty prints dataset files")
+    command.add_argument('files',nargs='+',metavar='data_file',help="json, json-lines or columnar corpus directory")
+    command.add_argument('--doc',default=None,type=int,help="prints a single document of each file (the offsets are recorded in a <file>.idx sidecar on first use)")
+    command.add_argument('--range',default=None,metavar='A:B',help="prints the documents A to B (excluded) of each file")
+    command.set_defaults(run=run_view)
+
+    command = commands.add_parser('import',help="converts BRAT directories to json files")
+    command.add_argument('brat_dirs',nargs='+',metavar='brat_dir')
+    command.add_argument('--outdir',default='.',help="output directory of the json files (default: current directory)")
+    command.add_argument('--jobs',default=0,type=int,help="number of processes (default: 0, all cores)")
+    command.add_argument('--force',action='store_true',help="converts all the files, even those unchanged since the last run")
+    command.set_defaults(run=run_import)
+
+    command = commands.add_parser('merge',help="merges directories of json files into dataset files")
+    command.add_argument('files',nargs='+',metavar='json_dir outfile',help="one or more json_dir outfile pairs")
+    command.add_argument('--format',default='json',choices=['json','jsonl'],help="a json list of documents or one document per line")
+    command.add_argument('--shard-size',default=None,type=int,help="splits each output into shards of this many documents")
+    command.set_defaults(run=run_merge)
+
+    command = commands.add_parser('split',help="computes the train/dev/test split of the essays")
+    command.add_argument('json_dir',help="directory of the essay json files")
+    command.add_argument('dev_conll',help="conll file of the reference dev set")
+    command.add_argument('test_conll',help="conll file of the reference test set")
+    command.add_argument('--outdir',default=None,help="directory of the split files (default: json_dir)")
+    command.set_defaults(run=run_split)
+    return parser
+
+
+if __name__ == '__main__':
+    args = make_parser().parse_args()
+    try:
+        failed = args.run(args)
+    except Exception as e:
+        print('[error]',e)
+        failed = 1
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,392 @@
+#Benchmarks of the evaluation and import paths on synthetic data.
+#The generator creates documents, noisy predictions and BRAT files with a
+#controlled size and density. Each stage reports its throughput and peak memory
+#and the results are saved as json, so that runs can be compared over time:
+#
+#  python benchmark.py --docs 1000 --output bench.json
+#  python benchmark.py --docs 1000 --compare bench.json
+
+import gc
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bio import encode_tokens
+from document import Corpus
+from evaluate import align_rels,align_spans,eval_dataset,get_rels,get_spans
+
+#modules the command line must not import to evaluate a small shard
+HEAVY_MODULES = ('numpy','nltk','multiprocessing')
+
+LABELS     = ('MajorClaim','Claim','Premise')
+REL_LABELS = ('supports','attacks')
+WORDS      = ('the','argument','is','not','convincing','because','students','should','learn',
+              'however','it','can','be','argued','that','technology','helps','people','.',',')
+
+
+def generate_document(rng,paragraphs=4,tokens=50,span_density=0.3,rel_density=0.5):
+    """
+    Generates a random document in the json dataset format
+    Args:
+       rng (random.Random) : the random generator
+       paragraphs (int)    : number of paragraphs
+       tokens (int)        : number of tokens per paragraph
+       span_density (float): probability that a span begins at a token outside spans
+       rel_density (float) : number of relations per span
+    Returns:
+       dict. a document with tokens, spans and rels
+    """
+    document = {'tokens':[ ],'spans':[ ],'rels':[ ]}
+    idx = 0
+    for _ in range(paragraphs):
+        document['tokens'].append([ {'idx':idx+pos,'str':rng.choice(WORDS)} for pos in range(tokens) ])
+        pos = 0
+        while pos < tokens:
+            if rng.random() < span_density:
+                end = min(pos + rng.randint(1,12),tokens) - 1
+                document['spans'].append({'name':rng.choice(LABELS),'start':idx+pos,'end':idx+end})
+                pos = end + 2
+            else:
+                pos += 1
+        idx += tokens
+    spans = document['spans']
+    if len(spans) > 1:
+        for _ in range(int(rel_density * len(spans))):
+            src,tgt = rng.sample(spans,2)
+            document['rels'].append({'name':rng.choice(REL_LABELS),
+                                     'src':[src['start'],src['end']],'tgt':[tgt['start'],tgt['end']]})
+    tags = iter(encode_tokens(document['tokens'],spans))
+    for paragraph in document['tokens']:
+        for token in paragraph:
+            token['arg'] = next(tags)
+    return document
+
+
+def generate_prediction(rng,document,noise=0.2):
+    """
+    Generates a noisy prediction of a document: with probability noise,
+    each span is dropped, relabeled or has its boundaries shifted, and
+    each relation is dropped or relabeled. Spurious spans are added too.
+    Args:
+       rng (random.Random) : the random generator
+       document (dict)     : the reference document
+       noise (float)       : the probability of an error
+    Returns:
+       dict. the predicted document
+    """
+    ntokens = sum(len(paragraph) for paragraph in document['tokens'])
+    moved,spans = { },[ ]
+    for span in document['spans']:
+        start,end,name = span['start'],span['end'],span['name']
+        if rng.random() < noise:
+            error = rng.randrange(3)
+            if error == 0:
+                continue
+            if error == 1:
+                name = rng.choice(LABELS)
+            else:
+                start = min(max(0,start + rng.randint(-2,2)),ntokens-1)
+                end   = min(max(start,end + rng.randint(-2,2)),ntokens-1)
+        moved[(span['start'],span['end'])] = [start,end]
+        spans.append({'name':name,'start':start,'end':end})
+    for _ in range(int(noise * len(document['spans']))):
+        start = rng.randrange(ntokens)
+        spans.append({'name':rng.choice(LABELS),'start':start,'end':min(start + rng.randint(0,8),ntokens-1)})
+    rels = [ ]
+    for rel in document['rels']:
+        src,tgt = moved.get(tuple(rel['src'])),moved.get(tuple(rel['tgt']))
+        if src is None or tgt is None or rng.random() < noise / 2:
+            continue
+        name = rng.choice(REL_LABELS) if rng.random() < noise / 2 else rel['name']
+        rels.append({'name':name,'src':src,'tgt':tgt})
+    tokens = [ [ dict(token) for token in paragraph ] for paragraph in document['tokens'] ]
+    tags   = iter(encode_tokens(tokens,spans))
+    for paragraph in tokens:
+        for token in paragraph:
+            token['arg'] = next(tags)
+    return {'tokens':tokens,'spans':spans,'rels':rels}
+
+
+def generate_corpus(ndocs,paragraphs=4,tokens=50,span_density=0.3,rel_density=0.5,noise=0.2,seed=0):
+    """
+    Returns:
+       (refs,preds) two lists of documents
+    """
+    rng   = random.Random(seed)
+    refs  = [ generate_document(rng,paragraphs,tokens,span_density,rel_density) for _ in range(ndocs) ]
+    preds = [ generate_prediction(rng,ref,noise) for ref in refs ]
+    return refs,preds
+
+
+def write_brat(documents,dirname):
+    """
+    Writes documents as BRAT .txt/.ann pairs: tokens are separated by a
+    space and paragraphs by a newline
+    Returns:
+       list of the (txtfile,annfile) paths
+    """
+    paths = [ ]
+    for num,document in enumerate(documents):
+        text,offsets = [ ],{ }
+        pos = 0
+        for paragraph in document['tokens']:
+            for token in paragraph:
+                offsets[token['idx']] = (pos,pos+len(token['str']))
+                text.append(token['str'])
+                pos += len(token['str']) + 1
+            text[-1] += '\n'
+        text = ' '.join(text).replace('\n ','\n')
+        ids,lines = { },[ ]
+        for span in document['spans']:
+            ids[(span['start'],span['end'])] = f'T{len(ids)+1}'
+            start,end = offsets[span['start']][0],offsets[span['end']][1]
+            lines.append(f"{ids[(span['start'],span['end'])]}\t{span['name']} {start} {end}\t{text[start:end]}")
+        for rnum,rel in enumerate(document['rels']):
+            lines.append(f"R{rnum+1}\t{rel['name']} Arg1:{ids[tuple(rel['src'])]} Arg2:{ids[tuple(rel['tgt'])]}\t")
+        prefix = os.path.join(dirname,f'doc{num:06d}')
+        with open(prefix + '.txt','w') as outfile:
+            outfile.write(text)
+        with open(prefix + '.ann','w') as outfile:
+            outfile.write('\n'.join(lines) + '\n')
+        paths.append((prefix + '.txt',prefix + '.ann'))
+    return paths
+
+
+def whitespace_tokens(txtfile):
+    """
+    Tokenizes a generated BRAT text on whitespace, in the format of
+    brat_import.tokenize_text (without depending on NLTK)
+    """
+    with open(txtfile) as infile:
+        text = infile.read()
+    tokens,idx,pos = [ ],0,0
+    for line in text.split('\n'):
+        paragraph = [ ]
+        for word in line.split(' '):
+            if word:
+                paragraph.append((pos,pos+len(word),idx,word))
+                idx += 1
+            pos += len(word) + 1
+        if paragraph:
+            tokens.append(paragraph)
+    return tokens
+
+
+def measure(func,repeat=3,memory=True):
+    """
+    Runs a stage several times
+    Returns:
+       (seconds,peak) the best wall clock time and the peak of memory
+       allocated by the stage in bytes (None if not measured). Memory is
+       traced in a separate run, tracing slows down the execution
+    """
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds,elapsed)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds,peak
+
+
+def stages(refs,preds,workdir,alpha=0.5):
+    """
+    Returns:
+       dict mapping stage names to (function,number of documents,number of tokens)
+    """
+    ndocs   = len(refs)
+    ntokens = sum(len(paragraph) for document in refs for paragraph in document['tokens'])
+    pred_spans = [ get_spans(pred) for pred in preds ]
+    ref_spans  = [ get_spans(ref) for ref in refs ]
+    pred_rels  = [ get_rels(pred) for pred in preds ]
+    ref_rels   = [ get_rels(ref) for ref in refs ]
+
+    def run_align_spans():
+        for pspans,rspans in zip(pred_spans,ref_spans):
+            align_spans(pspans,rspans,alpha)
+
+    def run_align_rels():
+        for prels,rrels in zip(pred_rels,ref_rels):
+            align_rels(prels,rrels,alpha)
+
+    result = {'get_spans':(lambda: [ get_spans({'tokens':pred['tokens']}) for pred in preds ],ndocs,ntokens),
+              'align_spans':(run_align_spans,ndocs,ntokens),
+              'align_rels':(run_align_rels,ndocs,ntokens),
+              'eval_dataset':(lambda: eval_dataset(preds,refs,alpha=alpha),ndocs,ntokens)}
+    #documents already in memory as document.Document arrays, e.g. read from a columnar corpus
+    pred_corpus,ref_corpus = Corpus.from_dicts(preds),Corpus.from_dicts(refs)
+    result['eval_corpus'] = (lambda: eval_dataset(pred_corpus,ref_corpus,alpha=alpha),ndocs,ntokens)
+    try:
+        import numpy
+        result['eval_dataset_numpy'] = (lambda: eval_dataset(preds,refs,alpha=alpha,backend='numpy'),ndocs,ntokens)
+        result['eval_corpus_numpy'] = (lambda: eval_dataset(pred_corpus,ref_corpus,alpha=alpha,backend='numpy'),ndocs,ntokens)
+        from relation_graph import RelationGraph
+        result['relation_graph'] = (lambda: RelationGraph(refs).stats(),ndocs,ntokens)
+    except ImportError:
+        pass
+
+    brat_dir = os.path.join(workdir,'brat')
+    os.makedirs(brat_dir)
+    brat_files = write_brat(refs,brat_dir)
+    from data.brat_import import annotate_NER,char2tokens,read_annotations,tokenize_chunk,tokenize_text
+    brat_tokens = [ whitespace_tokens(txtfile) for txtfile,_ in brat_files ]
+
+    def run_char2tokens():
+        for tokens,(_,annfile) in zip(brat_tokens,brat_files):
+            annotate_NER(char2tokens(tokens,read_annotations(annfile)))
+    result['char2tokens'] = (run_char2tokens,ndocs,ntokens)
+
+    def run_tokenize():
+        tokenize_chunk.cache_clear()    #each run starts cold
+        for txtfile,_ in brat_files:
+            tokenize_text(txtfile,method='tweet')
+    if importlib.util.find_spec('nltk') is not None:
+        result['tokenize'] = (run_tokenize,ndocs,ntokens)
+
+    from data.merge_data import merge_dir
+    json_dir = os.path.join(workdir,'json')
+    os.makedirs(json_dir)
+    for num,document in enumerate(refs):
+        with open(os.path.join(json_dir,f'doc{num:06d}.json'),'w') as outfile:
+            outfile.write(json.dumps(document))
+    result['merge_dir'] = (lambda: merge_dir(json_dir,os.path.join(workdir,'merged.json')),ndocs,ntokens)
+
+    #cold start of the command line evaluating a single document
+    pred_file,ref_file = os.path.join(workdir,'pred1.json'),os.path.join(workdir,'ref1.json')
+    for path,document in ((pred_file,preds[0]),(ref_file,refs[0])):
+        with open(path,'w') as outfile:
+            outfile.write(json.dumps([document]))
+    command = startup_command(workdir)
+    result['cli_startup'] = (lambda: subprocess.run(command,check=True,stdout=subprocess.DEVNULL),
+                             1,sum(len(paragraph) for paragraph in refs[0]['tokens']))
+    return result
+
+
+def startup_command(workdir):
+    """
+    Returns:
+       list. the command line evaluating the single document files of the working directory
+    """
+    return [sys.executable,os.path.join(os.path.dirname(os.path.abspath(__file__)),'argbase.py'),'eval',
+            os.path.join(workdir,'pred1.json'),os.path.join(workdir,'ref1.json'),'--json']
+
+
+def heavy_imports(command):
+    """
+    Lists the heavy modules imported by a python command line
+    Args:
+       command (list): a command line, as returned by startup_command
+    Returns:
+       list of the HEAVY_MODULES imported by the command
+    """
+    output  = subprocess.run([command[0],'-X','importtime',*command[1:]],check=True,
+                             stdout=subprocess.DEVNULL,stderr=subprocess.PIPE,text=True).stderr
+    modules = { line.split('|')[-1].strip().split('.')[0] for line in output.splitlines() if line.startswith('import time:') }
+    return [ module for module in HEAVY_MODULES if module in modules ]
+
+
+def run_benchmarks(config,selected=None,repeat=3,memory=True):
+    """
+    Generates a synthetic corpus and measures each stage
+    Args:
+       config (dict)  : the arguments of generate_corpus
+       selected (list): the names of the stages to run, all by default
+       repeat (int)   : number of timed runs of each stage
+       memory (bool)  : whether the peak memory is measured
+    Returns:
+       dict. the configuration, the environment and the results of each stage
+    """
+    refs,preds = generate_corpus(**config)
+    workdir = tempfile.mkdtemp(prefix='argbench')
+    try:
+        results = { }
+        for name,(func,ndocs,ntokens) in stages(refs,preds,workdir).items():
+            if selected and name not in selected:
+                continue
+            seconds,peak = measure(func,repeat,memory)
+            results[name] = {'seconds':seconds,'docs_per_second':ndocs / seconds,
+                             'tokens_per_second':ntokens / seconds,'peak_memory':peak}
+            if name == 'cli_startup':
+                results[name]['heavy_imports'] = heavy_imports(startup_command(workdir))
+            print(f"{name:20}\t{seconds:10.4f} s\t{ndocs / seconds:12.1f} docs/s\t"
+                  + (f'{peak / 2**20:10.2f} MB' if peak is not None else ''),file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir)
+    return {'config':config,'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python':platform.python_version(),'machine':platform.machine(),
+            'results':results}
+
+
+def compare(current,previous,threshold=1.2):
+    """
+    Prints the time ratio of each stage between two runs and flags the
+    regressions, including a command line startup importing heavy modules
+    Args:
+       current,previous (dict): results of run_benchmarks
+       threshold (float)      : time ratio above which a stage is flagged
+    Returns:
+       list of the names of the stages that regressed
+    """
+    if current['config'] != previous['config']:
+        print('warning: the runs have different configurations',file=sys.stderr)
+    regressions = [ ]
+    for name,result in current['results'].items():
+        if name in previous['results']:
+            ratio = result['seconds'] / previous['results'][name]['seconds']
+            flag  = ''
+            if ratio > threshold:
+                regressions.append(name)
+                flag = '\tREGRESSION'
+            print(f'{name:20}\t{ratio:6.2f}x time{flag}',file=sys.stderr)
+        if result.get('heavy_imports'):
+            regressions.append(name)
+            print(f"{name:20}\timports {', '.join(result['heavy_imports'])}\tREGRESSION",file=sys.stderr)
+    return regressions
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+                    prog='python benchmark.py',
+                    description='Benchmarks the evaluation and import paths on synthetic data.')
+    parser.add_argument('--docs',default=200,type=int,help="number of documents")
+    parser.add_argument('--paragraphs',default=4,type=int,help="number of paragraphs per document")
+    parser.add_argument('--tokens',default=50,type=int,help="number of tokens per paragraph")
+    parser.add_argument('--span-density',default=0.3,type=float,help="probability that a span begins at a token outside spans")
+    parser.add_argument('--rel-density',default=0.5,type=float,help="number of relations per span")
+    parser.add_argument('--noise',default=0.2,type=float,help="probability of an error in the predictions")
+    parser.add_argument('--seed',default=0,type=int)
+    parser.add_argument('--stages',nargs='*',default=None,help="stages to run (default: all)")
+    parser.add_argument('--repeat',default=3,type=int,help="number of timed runs per stage")
+    parser.add_argument('--no-memory',action='store_true',help="skips the peak memory measures")
+    parser.add_argument('--output',default=None,help="saves the results to this json file")
+    parser.add_argument('--compare',default=None,help="compares the results with a previous json file")
+    args = parser.parse_args()
+
+    config  = {'ndocs':args.docs,'paragraphs':args.paragraphs,'tokens':args.tokens,
+               'span_density':args.span_density,'rel_density':args.rel_density,
+               'noise':args.noise,'seed':args.seed}
+    results = run_benchmarks(config,args.stages,args.repeat,not args.no_memory)
+    if args.output:
+        with open(args.output,'w') as outfile:
+            outfile.write(json.dumps(results,indent=2))
+    if args.compare:
+        with open(args.compare) as infile:
+            if compare(results,json.loads(infile.read())):
+                sys.exit(1)
@@ -0,0 +1,284 @@
+#Encoding and decoding of argument spans as BIO tags.
+#Tags are handled as integer ids: a tag table gives the kind (B, I or O) and the
+#label id of each tag id, so that a whole document is decoded or encoded with a
+#few array operations. NumPy is used when available, a pure python
+#implementation with the same semantics is used otherwise.
+
+from itertools import chain,repeat
+from operator import itemgetter
+
+#NumPy is imported on first use, so that runs over small documents never pay its import time
+np = None
+_NUMPY_LOADED = False
+
+def load_numpy():
+    """
+    Returns:
+       the numpy module, imported on first call, or None if it is not installed
+    """
+    global np,_NUMPY_LOADED
+    if not _NUMPY_LOADED:
+        _NUMPY_LOADED = True
+        try:
+            import numpy as module
+            np = module
+        except ImportError:
+            pass
+    return np
+
+O,B,I = 0,1,2
+
+#below this number of tokens, the python loops are faster than NumPy
+NUMPY_MIN_TOKENS = 384
+
+def as_list(values):
+    return values.tolist() if hasattr(values,'tolist') else values
+
+
+def tag_table(tag_names,labels=None):
+    """
+    Parses tag names. A tag starting with 'B' (resp. 'I') begins (resp.
+    continues) a span whose label is the part of the tag after its last
+    '-', any other tag is outside spans.
+    Args:
+       tag_names (list): the tag names, indexed by tag id
+       labels    (dict): maps label names to label ids, updated in place
+    Returns:
+       (kinds,tag_labels,labels). The kind (O, B or I) and the label id
+       (-1 for O tags) of each tag id, and the label dict
+    """
+    labels = labels if labels is not None else { }
+    kinds,tag_labels = [ ],[ ]
+    for name in tag_names:
+        kind = B if name.startswith('B') else I if name.startswith('I') else O
+        kinds.append(kind)
+        tag_labels.append(labels.setdefault(name.split('-')[-1],len(labels)) if kind else -1)
+    return kinds,tag_labels,labels
+
+
+def decode(tag_ids,kinds,tag_labels,parag_offsets,idx=None,repair=False):
+    """
+    Decodes spans from BIO tags. A span begins at a B tag and extends
+    over the following I tags. It ends before the next O tag, or at the
+    end of its paragraph. A B tag inside a span discards the open span and
+    an I tag outside a span is ignored (as the original evaluate.get_spans
+    loop does). With repair, a B tag inside a span closes it before
+    beginning the next one and an I tag outside a span begins a span as a
+    B tag would.
+    Args:
+       tag_ids (sequence)      : the tag id of each token of the document
+       kinds,tag_labels (list) : the tag table, see tag_table
+       parag_offsets (sequence): token offset of each paragraph, plus the number of tokens
+       idx (sequence)          : the idx of each token, defaults to its position
+       repair (bool)           : whether B tags close the open span and I tags outside spans begin one
+    Returns:
+       (starts,ends,labels) lists of the idx of the first and last token
+       and of the label id of each span, in document order
+    """
+    if len(tag_ids) < NUMPY_MIN_TOKENS or load_numpy() is None:
+        return decode_python(as_list(tag_ids),kinds,tag_labels,as_list(parag_offsets),
+                             None if idx is None else as_list(idx),repair)
+    starts,ends,labels = decode_numpy(tag_ids,kinds,tag_labels,parag_offsets,idx,repair)
+    return starts.tolist(),ends.tolist(),labels.tolist()
+
+
+def decode_numpy(tag_ids,kinds,tag_labels,parag_offsets,idx=None,repair=False):
+    """
+    NumPy version of decode (requires numpy), with the same arguments.
+    Several documents are decoded at once by concatenating their paragraphs.
+    Returns:
+       (starts,ends,labels) int arrays
+    """
+    load_numpy()
+    tag_ids = np.asarray(tag_ids)
+    ntoks   = len(tag_ids)
+    idx     = np.arange(ntoks) if idx is None else np.asarray(idx)
+    offsets = np.asarray(parag_offsets)
+    kind    = np.asarray(kinds,dtype=np.int8)[tag_ids]
+
+    first = np.zeros(ntoks,dtype=bool)      #first token of a paragraph
+    first[offsets[:-1][offsets[:-1] < ntoks]] = True
+    inside = kind != O
+    begin  = kind == B
+    if repair:
+        #an I tag right after an O tag or at the start of a paragraph
+        previous = np.concatenate(([False],inside[:-1]))
+        begin   |= (kind == I) & (first | ~previous)
+        stop = np.flatnonzero(begin | ~inside | first)
+    else:
+        stop = np.flatnonzero(~inside | first)
+
+    starts  = np.flatnonzero(begin)
+    #the span ends before the next stop token, or at the end of the document
+    nexts   = np.searchsorted(stop,starts,side='right')
+    bounds  = np.append(stop,ntoks)[nexts]
+    if not repair:
+        #a span is discarded when another B tag comes before its end
+        kept   = np.append(starts[1:],ntoks) >= bounds
+        starts,bounds = starts[kept],bounds[kept]
+    parag_end = offsets[np.searchsorted(offsets,starts,side='right')]
+    in_parag  = bounds < parag_end
+    ends    = np.where(in_parag,idx[np.minimum(bounds,ntoks-1)] - 1,idx[parag_end-1])
+    labels  = np.asarray(tag_labels,dtype=np.int64)[tag_ids[starts]]
+    return idx[starts],ends,labels
+
+
+def decode_python(tag_ids,kinds,tag_labels,parag_offsets,idx=None,repair=False):
+    """
+    Pure python version of decode, with the same arguments and results
+    """
+    starts,ends,labels = [ ],[ ],[ ]
+    def close(current,end):
+        starts.append(idx[current] if idx is not None else current)
+        ends.append(end)
+        labels.append(tag_labels[tag_ids[current]])
+
+    for pstart,pend in zip(parag_offsets,parag_offsets[1:]):
+        current = -1    #position of the first token of the open span
+        for pos in range(pstart,pend):
+            kind = kinds[tag_ids[pos]]
+            if kind == B or (repair and kind == I and current < 0):
+                if current >= 0 and repair:
+                    close(current,(idx[pos] if idx is not None else pos) - 1)
+                current = pos   #without repair, the open span is discarded
+            elif kind == O and current >= 0:
+                close(current,(idx[pos] if idx is not None else pos) - 1)
+                current = -1
+        if current >= 0:
+            close(current,idx[pend-1] if idx is not None else pend-1)
+    return starts,ends,labels
+
+
+def encode(idx,starts,ends,labels):
+    """
+    Encodes spans as BIO tags. The first token of a span is tagged B and
+    the following ones I, up to the token before its end idx (as
+    brat_import.annotate_NER does). When spans overlap, the later span
+    wins. Tokens outside spans are tagged O.
+    Args:
+       idx (sequence)   : the idx of each token of the document
+       starts,ends,labels (sequence): the first and last token idx and the label id of each span
+    Returns:
+       list of tag ids, 0 for O, 2*label+1 for B-label and 2*label+2 for I-label
+       (see tag_names)
+    """
+    #converting a list of idx to an array costs more than the python loop saves
+    if len(idx) < NUMPY_MIN_TOKENS or isinstance(idx,list) or load_numpy() is None:
+        return encode_python(as_list(idx),as_list(starts),as_list(ends),as_list(labels))
+
+    idx    = np.asarray(idx)
+    starts = np.asarray(starts,dtype=np.int64)
+    ends   = np.asarray(ends,dtype=np.int64)
+    labels = np.asarray(labels,dtype=np.int64)
+    #one write per tagged token, in the order of the python loop
+    lengths = np.maximum(ends - starts,1)
+    span    = np.repeat(np.arange(len(starts)),lengths)
+    offset  = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths,lengths)
+    written = starts[span] + offset
+    tags    = 2 * labels[span] + np.where(offset == 0,1,2)
+    #the last write of each token idx wins
+    last,keep = np.unique(written[::-1],return_index=True)
+    keep    = len(written) - 1 - keep
+    order   = np.argsort(idx,kind='stable')
+    pos     = np.searchsorted(idx,last,sorter=order)
+    found   = pos < len(idx)
+    found[found] = idx[order[pos[found]]] == last[found]
+    result  = np.zeros(len(idx),dtype=np.int64)
+    result[order[pos[found]]] = tags[keep[found]]
+    return result.tolist()
+
+
+def encode_python(idx,starts,ends,labels):
+    """
+    Pure python version of encode, with the same arguments and results
+    """
+    tagdict = { }
+    for start,end,label in zip(starts,ends,labels):
+        tagdict[start] = 2 * label + 1
+        inside = 2 * label + 2
+        for pos in range(start+1,end):
+            tagdict[pos] = inside
+    return list(map(tagdict.get,idx,repeat(0)))
+
+
+def tag_names(label_names):
+    """
+    Returns:
+       list of the tag names of the ids returned by encode
+    """
+    names = ['O']
+    for label in label_names:
+        names.extend((f'B-{label}',f'I-{label}'))
+    return names
+
+
+def decode_tokens(paragraphs,repair=False):
+    """
+    Decodes the spans of a document given as paragraphs of token dicts
+    (with 'idx' and 'arg' fields)
+    Returns:
+       list of (start,end,label) span triples
+    """
+    offsets = [0]
+    for paragraph in paragraphs:
+        offsets.append(offsets[-1] + len(paragraph))
+    tags      = [ token['arg'] for paragraph in paragraphs for token in paragraph ]
+    idx       = [ token['idx'] for paragraph in paragraphs for token in paragraph ]
+    tag_vocab = { tag:tag_id for tag_id,tag in enumerate(dict.fromkeys(tags)) }
+    tag_ids   = list(map(tag_vocab.__getitem__,tags))
+    kinds,tag_labels,labels = tag_table(tag_vocab)
+    label_names = list(labels)
+    starts,ends,span_labels = decode(tag_ids,kinds,tag_labels,offsets,idx,repair)
+    return [ (start,end,label_names[label]) for start,end,label in zip(starts,ends,span_labels) ]
+
+
+def encode_tokens(paragraphs,spans):
+    """
+    Encodes spans as the BIO tags of a document given as paragraphs of
+    token dicts (with an 'idx' field)
+    Args:
+       paragraphs (list): lists of token dicts
+       spans (list)     : dicts with 'start','end' and 'name' fields
+    Returns:
+       list of the tag names of the tokens
+    """
+    #the loop of encode_python, writing tag names rather than tag ids: token dicts
+    #are never worth converting to arrays
+    tags,tagdict = { },{ }
+    for span in spans:
+        name = span['name']
+        begin,inside = tags.get(name) or tags.setdefault(name,(f'B-{name}',f'I-{name}'))
+        start = span['start']
+        tagdict[start] = begin
+        for pos in range(start+1,span['end']):
+            tagdict[pos] = inside
+    return list(map(tagdict.get,map(itemgetter('idx'),chain.from_iterable(paragraphs)),repeat('O')))
+
+
+if __name__ == '__main__':
+    #benchmark of the codec against the per token loops of evaluate.get_spans and brat_import.annotate_NER
+    #(the checks of the codec are in test_bio.py)
+    import random
+    import timeit
+    from test_bio import legacy_decode,legacy_encode,random_document
+
+    rng = random.Random(0)
+    for ntokens in (100,1000,10000,100000):
+        paragraphs,spans = random_document(rng,ntokens)
+        #tag id arrays, as stored by document.Document
+        tag_vocab = { }
+        tag_ids = [ tag_vocab.setdefault(token['arg'],len(tag_vocab)) for paragraph in paragraphs for token in paragraph ]
+        offsets = [ 0 ]
+        for paragraph in paragraphs:
+            offsets.append(offsets[-1] + len(paragraph))
+        table = tag_table(tag_vocab)[:2]
+        if load_numpy() is not None:
+            tag_ids,offsets = np.asarray(tag_ids),np.asarray(offsets)
+        number = max(1,100000 // ntokens)
+        for name,func in (('decode (loop)',lambda: legacy_decode(paragraphs)),
+                          ('decode (codec)',lambda: decode_tokens(paragraphs)),
+                          ('decode (codec, tag ids)',lambda: decode(tag_ids,*table,offsets)),
+                          ('encode (loop)',lambda: legacy_encode(paragraphs,spans)),
+                          ('encode (codec)',lambda: encode_tokens(paragraphs,spans))):
+            seconds = min(timeit.repeat(func,number=number,repeat=3)) / number
+            print(f'{ntokens}\ttokens\t{name:24}\t{seconds*1e3:.3f} ms')
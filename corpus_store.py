@@ -0,0 +1,274 @@
+#Columnar binary storage of datasets.
+#A corpus is a directory of .npy columns and a corpus.json metadata file:
+#token strings, BIO tags, span and relation labels are integer ids into
+#interned vocabularies, and offset arrays delimit paragraphs and documents.
+#Columns are memory mapped when loading, any document is then a set of
+#zero-copy array slices. Documents are read into document.Document objects
+#wrapping these slices, and convert back to the json dataset format for
+#export.
+
+import json
+import os
+from array import array
+
+import numpy as np
+
+from document import Corpus,Document,Vocab,Vocabs
+
+META = 'corpus.json'
+
+#column name -> array typecode
+COLUMNS = {'token_idx':'q','token_str':'i','token_tag':'i',   #one row per token
+           'parag_offsets':'q',                                #token offset of each paragraph, plus the total
+           'doc_parags':'q',                                   #paragraph offset of each document, plus the total
+           'span_start':'q','span_end':'q','span_label':'i',   #one row per span
+           'doc_spans':'q',                                    #span offset of each document, plus the total
+           'rel_src_start':'q','rel_src_end':'q','rel_tgt_start':'q','rel_tgt_end':'q','rel_label':'i',
+           'doc_rels':'q',                                     #relation offset of each document, plus the total
+           'doc_keys':'b'}                                     #bit flags: the document has spans (1) and rels (2)
+HAS_SPANS = 1
+HAS_RELS  = 2
+
+
+def is_corpus(path):
+    """
+    Checks whether a path is a columnar corpus directory
+    """
+    return os.path.isdir(path) and os.path.exists(os.path.join(path,META))
+
+
+def write_corpus(documents,path):
+    """
+    Writes documents in the columnar format. Documents are consumed one at
+    a time and packed into compact arrays, a streamed input is never
+    materialized as a list.
+    Args:
+       documents (iterable) : documents in the json dataset format
+       path (str)           : the output directory, created if needed
+    Returns:
+       int. the number of documents written
+    """
+    columns = { name:array(code) for name,code in COLUMNS.items() }
+    vocabs  = {'str':{ },'tag':{ },'label':{ }}
+    for name in ('parag_offsets','doc_parags','doc_spans','doc_rels'):
+        columns[name].append(0)
+
+    def intern(vocab,value):
+        return vocabs[vocab].setdefault(value,len(vocabs[vocab]))
+
+    ndocs = 0
+    for document in documents:
+        for parag in document['tokens']:
+            for token in parag:
+                columns['token_idx'].append(token['idx'])
+                columns['token_str'].append(intern('str',token['str']))
+                columns['token_tag'].append(intern('tag',token['arg']))
+            columns['parag_offsets'].append(len(columns['token_idx']))
+        columns['doc_parags'].append(len(columns['parag_offsets'])-1)
+
+        for span in document.get('spans',[ ]):
+            columns['span_start'].append(span['start'])
+            columns['span_end'].append(span['end'])
+            columns['span_label'].append(intern('label',span['name']))
+        columns['doc_spans'].append(len(columns['span_start']))
+
+        for rel in document.get('rels',[ ]):
+            (src_start,src_end),(tgt_start,tgt_end) = rel['src'],rel['tgt']
+            columns['rel_src_start'].append(src_start)
+            columns['rel_src_end'].append(src_end)
+            columns['rel_tgt_start'].append(tgt_start)
+            columns['rel_tgt_end'].append(tgt_end)
+            columns['rel_label'].append(intern('label',rel['name']))
+        columns['doc_rels'].append(len(columns['rel_src_start']))
+
+        columns['doc_keys'].append(HAS_SPANS * ('spans' in document) | HAS_RELS * ('rels' in document))
+        ndocs += 1
+
+    os.makedirs(path,exist_ok=True)
+    for name,column in columns.items():
+        np.save(os.path.join(path,f'{name}.npy'),np.frombuffer(column,dtype=column.typecode) if column else np.zeros(0,dtype=column.typecode))
+    meta = {'format':'columnar','version':1,'documents':ndocs,
+            'vocabs':{ name:list(vocab) for name,vocab in vocabs.items() }}
+    with open(os.path.join(path,META),'w') as outfile:
+        outfile.write(json.dumps(meta))
+    return ndocs
+
+
+class ColumnarDocument:
+    """
+    A document of a columnar corpus. Its columns are zero-copy slices of
+    the memory mapped corpus columns.
+    """
+    def __init__(self,corpus,doc):
+        self.corpus = corpus
+        self.doc    = doc
+
+    def _slice(self,offsets,*names):
+        start,end = self.corpus[offsets][self.doc],self.corpus[offsets][self.doc+1]
+        return tuple(self.corpus[name][start:end] for name in names)
+
+    @property
+    def parag_offsets(self):
+        """
+        Token offsets of the paragraphs of the document, plus its end offset
+        """
+        start,end = self.corpus['doc_parags'][self.doc],self.corpus['doc_parags'][self.doc+1]
+        return self.corpus['parag_offsets'][start:end+1]
+
+    @property
+    def tokens(self):
+        """
+        (idx,str_ids,tag_ids) arrays of the tokens of the document
+        """
+        offsets = self.parag_offsets
+        return tuple(self.corpus[name][offsets[0]:offsets[-1]] for name in ('token_idx','token_str','token_tag'))
+
+    @property
+    def spans(self):
+        """
+        (start,end,label_ids) arrays of the spans of the document
+        """
+        return self._slice('doc_spans','span_start','span_end','span_label')
+
+    @property
+    def rels(self):
+        """
+        (src_start,src_end,tgt_start,tgt_end,label_ids) arrays of the relations of the document
+        """
+        return self._slice('doc_rels','rel_src_start','rel_src_end','rel_tgt_start','rel_tgt_end','rel_label')
+
+    def to_document(self,vocabs):
+        """
+        Wraps the columns of the document into a Document, without going
+        through the json dataset format. The Document columns are slices of
+        memoryviews of the corpus columns (no copy, and much cheaper than
+        slicing memory mapped arrays), only the paragraph offsets are copied
+        to start at 0
+        Args:
+           vocabs (Vocabs): the vocabularies of the corpus, see ColumnarCorpus.document_vocabs
+        Returns:
+           Document
+        """
+        views,doc = self.corpus.views,self.doc
+        document  = Document(vocabs)
+        offsets   = views['parag_offsets'][views['doc_parags'][doc]:views['doc_parags'][doc+1]+1]
+        base      = offsets[0]
+        document.parag_offsets = array('q',[ offset - base for offset in offsets ])
+        for name in ('token_idx','token_str','token_tag'):
+            setattr(document,name,views[name][base:offsets[-1]])
+        keys = views['doc_keys'][doc]
+        if keys & HAS_SPANS:
+            start,end = views['doc_spans'][doc],views['doc_spans'][doc+1]
+            for name in ('span_start','span_end','span_label'):
+                setattr(document,name,views[name][start:end])
+        if keys & HAS_RELS:
+            start,end = views['doc_rels'][doc],views['doc_rels'][doc+1]
+            for name in ('rel_src_start','rel_src_end','rel_tgt_start','rel_tgt_end','rel_label'):
+                setattr(document,name,views[name][start:end])
+        return document
+
+    def to_dict(self):
+        """
+        Returns:
+           dict. the document in the json dataset format (for json export)
+        """
+        strs,tags,labels = (self.corpus.vocabs[name] for name in ('str','tag','label'))
+        offsets = self.parag_offsets.tolist()
+        idxs,str_ids,tag_ids = (column.tolist() for column in self.tokens)
+        base    = offsets[0]
+        document = {'tokens':[ [ {'idx':idxs[i],'str':strs[str_ids[i]],'arg':tags[tag_ids[i]]}
+                                 for i in range(start-base,end-base) ]
+                               for start,end in zip(offsets,offsets[1:]) ]}
+        keys = int(self.corpus['doc_keys'][self.doc])
+        if keys & HAS_SPANS:
+            document['spans'] = [ {'name':labels[label],'start':start,'end':end}
+                                  for start,end,label in zip(*(column.tolist() for column in self.spans)) ]
+        if keys & HAS_RELS:
+            document['rels'] = [ {'name':labels[label],'src':[src_start,src_end],'tgt':[tgt_start,tgt_end]}
+                                 for src_start,src_end,tgt_start,tgt_end,label in zip(*(column.tolist() for column in self.rels)) ]
+        return document
+
+
+class ColumnarCorpus:
+    """
+    A columnar corpus loaded from disk. Columns are memory mapped: loading
+    does not read the data and documents are read on access.
+    """
+    def __init__(self,path,mmap=True):
+        """
+        Args:
+           path (str)  : the corpus directory
+           mmap (bool) : memory maps the columns rather than reading them
+        """
+        if not is_corpus(path):
+            raise Exception(f'{path} is not a columnar corpus directory. aborting.')
+        with open(os.path.join(path,META)) as infile:
+            meta = json.loads(infile.read())
+        self.ndocs   = meta['documents']
+        self.vocabs  = meta['vocabs']
+        self.columns = { name:np.load(os.path.join(path,f'{name}.npy'),mmap_mode='r' if mmap else None)
+                         for name in COLUMNS }
+        self.views   = { name:memoryview(column) for name,column in self.columns.items() }
+
+    def __getitem__(self,name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.ndocs
+
+    def document(self,doc):
+        """
+        Returns:
+           ColumnarDocument. the doc-th document
+        """
+        if not 0 <= doc < self.ndocs:
+            raise IndexError(f'document {doc} out of range')
+        return ColumnarDocument(self,doc)
+
+    def document_vocabs(self):
+        """
+        Returns:
+           Vocabs. the vocabularies of the corpus, as used by document.Document
+           (span and relation labels share the 'label' vocabulary in both models)
+        """
+        vocabs = Vocabs()
+        vocabs.strs,vocabs.tags,vocabs.labels = (Vocab(self.vocabs[name]) for name in ('str','tag','label'))
+        return vocabs
+
+    def documents(self,selection=None,vocabs=None):
+        """
+        Yields the documents as Documents wrapping the columns, sharing the same vocabularies
+        Args:
+           selection (slice): the selected document numbers, or None for all the documents
+           vocabs (Vocabs)  : the vocabularies of the documents, see document_vocabs
+        """
+        vocabs = vocabs if vocabs is not None else self.document_vocabs()
+        for doc in range(self.ndocs)[selection or slice(None)]:
+            yield self.document(doc).to_document(vocabs)
+
+    def to_corpus(self,selection=None):
+        """
+        Returns:
+           document.Corpus. the (selected) documents, see documents
+        """
+        vocabs = self.document_vocabs()
+        return Corpus(list(self.documents(selection,vocabs)),vocabs)
+
+    def __iter__(self):
+        """
+        Yields the documents in the json dataset format (for json export)
+        """
+        for doc in range(self.ndocs):
+            yield self.document(doc).to_dict()
+
+
+if __name__ == '__main__':
+    import argparse
+    from dataset_io import iter_documents
+    parser = argparse.ArgumentParser(
+                    prog='python corpus_store.py [dataset_file] [corpus_dir]',
+                    description='Converts a json or json-lines dataset file to the columnar corpus format.')
+    parser.add_argument('dataset_file')
+    parser.add_argument('corpus_dir')
+    args = parser.parse_args()
+    print(write_corpus(iter_documents(args.dataset_file),args.corpus_dir),'documents written')
@@ -7,8 +7,60 @@
 
 #todo check token/span indexing
 
+import os
 import re
-from nltk.tokenize import word_tokenize,TweetTokenizer
+import sys
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import chain
+
+try:    #bio.py and profiling.py are at the root of the repository, importable when brat_import is imported from there
+    import profiling
+    from bio import encode_tokens
+except ImportError:     #run as a script: the root of the repository is the parent directory
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import profiling
+    from bio import encode_tokens
+
+
+_TWEET_TOKENIZER = None
+
+def tweet_tokenizer():
+    """
+    Returns the tweet tokenizer of the current process, created on first use
+    """
+    global _TWEET_TOKENIZER
+    if _TWEET_TOKENIZER is None:
+        from nltk.tokenize import TweetTokenizer
+        _TWEET_TOKENIZER = TweetTokenizer()
+    return _TWEET_TOKENIZER
+
+#ascii words are single tokens for both tokenizers, except for these
+#contractions split by the treebank tokenizer (e.g. cannot -> can not)
+ASCII_WORD = re.compile(r'[A-Za-z]+')
+TREEBANK_SPLITS = {'cannot','gimme','gonna','gotta','lemme','wanna'}
+
+@lru_cache(maxsize=1 << 16)
+def tokenize_chunk(chunk,method='word'):
+    """
+    Tokenizes a chunk of text without whitespace. Plain words do not go
+    through NLTK, and the results are cached since chunks repeat a lot
+    within and across the documents of a corpus.
+    Args:
+      chunk  (str) : a chunk of text without whitespace
+      method (str) : 'word' or 'tweet'
+    Returns:
+      tuple of str. the tokens of the chunk
+    """
+    if ASCII_WORD.fullmatch(chunk) and (method == 'tweet' or chunk.lower() not in TREEBANK_SPLITS):
+        return (chunk,)
+    #nltk is slow to import: it is only loaded by the processes that actually tokenize
+    if method == 'tweet':
+        return tuple(tweet_tokenizer().tokenize(chunk))
+    from nltk.tokenize import word_tokenize
+    return tuple(word_tokenize(chunk))
+
+
 def tokenize_text(txtfile,method='word'):
     """
     Splits the text into tokens and returns a list of tokens
@@ -20,7 +72,6 @@ def tokenize_text(txtfile,method='word'):
       with begin and end char indexes in the text. This is a list of
       the paragraphs in the original text. Each paragraph is a list of tokens
     """
-    tt = TweetTokenizer()
     with open(txtfile) as infile:
         intxt =  infile.read()
         rawlist = re.split(r'(\s+)',intxt)
@@ -32,7 +83,7 @@ def tokenize_text(txtfile,method='word'):
         for elt in rawlist:
             if not elt.isspace():
                 #separates punctuation from main words
-                subtokens = tt.tokenize(elt) if method == 'tweet' else word_tokenize(elt) 
+                subtokens = tokenize_chunk(elt,method)
                 for subt in subtokens: 
                     subtok = (cidx,cidx+len(subt),idx,subt)
                     idx  += 1
@@ -81,24 +132,24 @@ def char2tokens(tokens,annotations):
     Returns:
        dict. tokens and annotations reindexed on tokens only
     """
+    #flat arrays of token char offsets, sorted since tokens never overlap
+    starts = [ sidx for paragraph in tokens for (sidx,_,_,_) in paragraph ]
+    ends   = [ eidx for paragraph in tokens for (_,eidx,_,_) in paragraph ]
+    widxs  = [ widx for paragraph in tokens for (_,_,widx,_) in paragraph ]
+
     #update spans
     for span in annotations["spans"]:
         start,end = span["start"],span["end"]
         newstart = -1
         newend   = -1
-        for paragraph in tokens:
-            for (sidx,eidx,widx,string) in paragraph:
-                #print("span",start,end)
-                #print('>',sidx,string,eidx)
-                if start >= sidx and start < eidx:
-                    newstart = widx
-                    #print('  ##start match')
-                if end >=sidx and end <= eidx :
-                    newend = widx
-                    #print('  @@end match')
-
-            if newstart >= 0 and newend >= 0:
-                break
+        #the token with sidx <= start < eidx
+        pos = bisect_right(starts,start) - 1
+        if pos >= 0 and start < ends[pos]:
+            newstart = widxs[pos]
+        #the last token with sidx <= end <= eidx
+        pos = bisect_right(starts,end) - 1
+        if pos >= 0 and end <= ends[pos]:
+            newend = widxs[pos]
         if newstart == -1 or newend == -1:
             #print('failed',start,end)
             raise Exception(f'warning remapping failed {(newstart,newend)}: span {span}\n{tokens}')
@@ -106,12 +157,12 @@ def char2tokens(tokens,annotations):
         span.update({"end" : newend})
         
     #update rels
+    spans_by_id = { span["ID"]:span for span in annotations["spans"] }
     for rel in annotations["rels"]:
-        for span in annotations["spans"]:
-            if span["ID"] == rel["src"]:
-                rel["src"] = (span["start"],span["end"])
-            if span["ID"] == rel["tgt"]:
-                rel["tgt"] = (span["start"],span["end"])
+        for key in ("src","tgt"):
+            span = spans_by_id.get(rel[key])
+            if span is not None:
+                rel[key] = (span["start"],span["end"])
 
     #update tokens
     tokens = [[{'idx':idx,'str':elt} for  (_,_,idx,elt) in parag] for parag in tokens]
@@ -130,37 +181,174 @@ def annotate_NER(annotations):
     Returns
       dict. The updated annotations
     """
-    tagdict = {}
-    for span in annotations['spans']:
-        label,start,end = span['name'],span['start'], span['end']
-        tagdict[start] = f'B-{label}'
-        for idx in range(start+1,end):
-            tagdict[idx] = f'I-{label}'
-    
-    for parag in annotations['tokens']:
-        for token in parag:
-            idx = token['idx']
-            token['arg'] = tagdict.get(idx,'O')
+    tags = encode_tokens(annotations['tokens'],annotations['spans'])
+    for token,tag in zip(chain.from_iterable(annotations['tokens']),tags):
+        token['arg'] = tag
     
     return annotations
 
 
-import os
 import json
-def convert_directory(dirname):
-    for filename in os.listdir(dirname):
+import hashlib
+import multiprocessing
+from functools import partial
+
+MANIFEST = '.brat_import_manifest'
+
+def convert_file(annfile,txtfile,outfile):
+    """
+    Converts a BRAT .ann/.txt pair to a json file
+    Args:
+      annfile (str) : path to the annotation file
+      txtfile (str) : path to the raw text file
+      outfile (str) : path to the json output file
+    """
+    stats = profiling.STATS
+    laps  = profiling.laps()
+    annotations = read_annotations(annfile)
+    laps.lap('read_annotations')
+    tokens      = tokenize_text(txtfile,method='tweet')
+    laps.lap('tokenize')
+    annotations = char2tokens(tokens,annotations)
+    laps.lap('char2tokens')
+    annotations = annotate_NER(annotations)
+    laps.lap('annotate_NER')
+    with open(outfile,'w') as out:
+        out.write(json.dumps(annotations))
+    laps.lap('write')
+    if stats is not None:
+        stats.count('tokens',sum(len(parag) for parag in annotations['tokens']))
+        stats.count('spans',len(annotations['spans']))
+        stats.count('rels',len(annotations['rels']))
+    laps.done(os.path.basename(annfile))
+
+
+def _convert_job(job):
+    """
+    Worker side of convert_directory
+    Returns:
+      (filename,error) where error is None on success
+    """
+    filename,annfile,txtfile,outfile = job
+    try:
+        convert_file(annfile,txtfile,outfile)
+        return filename,None
+    except Exception as e:
+        return filename,str(e)
+
+
+def file_signature(path):
+    """
+    Returns:
+      (mtime,sha1) the modification time and content hash of a file
+    """
+    with open(path,'rb') as infile:
+        return os.stat(path).st_mtime_ns,hashlib.sha1(infile.read()).hexdigest()
+
+
+def is_unchanged(entry,sources,outfile):
+    """
+    Checks a manifest entry against the current source files.
+    The hashes are only computed when a modification time changed.
+    Args:
+      entry   (dict) : the manifest entry of the document or None
+      sources (dict) : maps 'ann' and 'txt' to the source paths
+      outfile (str)  : path to the json output file
+    Returns:
+      (unchanged,signatures) a bool and the current signatures, None when the mtimes are unchanged
+    """
+    if entry is None or not os.path.exists(outfile):
+        return False,None
+    mtimes = { key:os.stat(path).st_mtime_ns for key,path in sources.items() }
+    if all(mtimes[key] == entry[key][0] for key in sources):
+        return True,None
+    signatures = { key:file_signature(path) for key,path in sources.items() }
+    return all(signatures[key][1] == entry[key][1] for key in sources),signatures
+
+
+def convert_directory(dirname,outdir='.',jobs=0,force=False):
+    """
+    Converts all the .ann/.txt pairs of a directory to json files, with a
+    process pool (one tokenizer per process) when jobs > 1. A manifest in
+    the output directory records the modification time and hash of the
+    sources of each converted document: documents whose sources are
+    unchanged and whose json file still exists are skipped. Errors do not
+    stop the conversion, they are collected and returned.
+    Args:
+      dirname (str) : the BRAT directory
+      outdir  (str) : the output directory of the json files
+      jobs    (int) : number of processes, 0 or less uses all cores (the default)
+      force   (bool): converts every document regardless of the manifest, the
+                      entries of the other documents are kept
+    Returns:
+      (converted,skipped,errors) two lists of .ann filenames and a list of (filename,message) couples
+    """
+    manifest_path = os.path.join(outdir,MANIFEST)
+    manifest      = { }
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as infile:
+            manifest = json.loads(infile.read())
+
+    jobs_todo,skipped,pending = [ ],[ ],{ }
+    for filename in sorted(os.listdir(dirname)):
         if filename.endswith('.ann'):
+            prefix  = os.path.splitext(filename)[0]
+            sources = {'ann':os.path.abspath(os.path.join(dirname,filename)),
+                       'txt':os.path.abspath(os.path.join(dirname,f'{prefix}.txt'))}
+            outfile = os.path.join(outdir,f'{prefix}.json')
             try:
-                prefix,suffix = filename.split('.')
-                annotations = read_annotations(os.path.join(dirname,filename))
-                tokens      = tokenize_text((os.path.join(dirname,f'{prefix}.txt')),method='tweet')   
-                annotations = char2tokens(tokens,annotations)
-                annotations = annotate_NER(annotations)
-                with open(f'{prefix}.json','w') as outfile:
-                    outfile.write(json.dumps(annotations))
-            except Exception as e:
-                print(e,filename)
-                exit()
+                unchanged,signatures = (False,None) if force else is_unchanged(manifest.get(sources['ann']),sources,outfile)
+            except OSError:
+                unchanged,signatures = False,None
+            if unchanged:
+                skipped.append(filename)
+                if signatures is not None:
+                    manifest[sources['ann']].update(signatures)
+                continue
+            pending[filename] = sources
+            jobs_todo.append((filename,sources['ann'],sources['txt'],outfile))
+
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count()
+    jobs = min(jobs,len(jobs_todo))
+    if jobs > 1:
+        #nltk is loaded once, before forking the workers
+        tweet_tokenizer()
+    stats = profiling.STATS
+    if jobs <= 1:
+        results = map(_convert_job,jobs_todo)
+    elif stats is not None:
+        #workers return their stats along with each result
+        pool    = multiprocessing.Pool(jobs)
+        profiled = pool.imap_unordered(partial(profiling.profiled_call,_convert_job,stats.slow,0),jobs_todo,chunksize=4)
+        def merged():
+            for result,job_stats in profiled:
+                stats.merge(job_stats)
+                yield result
+        results  = merged()
+    else:
+        pool    = multiprocessing.Pool(jobs)
+        results = pool.imap_unordered(_convert_job,jobs_todo,chunksize=4)
+
+    converted,errors = [ ],[ ]
+    try:
+        for filename,error in results:
+            sources = pending[filename]
+            if error is None:
+                converted.append(filename)
+                manifest[sources['ann']] = { key:file_signature(path) for key,path in sources.items() }
+            else:
+                errors.append((filename,error))
+                manifest.pop(sources['ann'],None)
+    finally:
+        if jobs > 1:
+            pool.close()
+            pool.join()
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path,'w') as outfile:
+            outfile.write(json.dumps(manifest))
+        os.replace(tmp_path,manifest_path)
+    return sorted(converted),skipped,sorted(errors)
 
 
 #annpath  = "abstrct_brat/train/neoplasm_train/20842129.ann"
@@ -177,6 +365,23 @@ def convert_directory(dirname):
 
 
 if __name__ == '__main__':
-    import sys
-    convert_directory(sys.argv[1])
-    pass
+    import argparse
+    parser = argparse.ArgumentParser(
+                    prog='python brat_import.py [brat_dir]',
+                    description='Converts BRAT annotated files to json files.')
+    parser.add_argument('brat_dir')
+    parser.add_argument('--outdir',default='.',help="output directory of the json files (default: current directory)")
+    parser.add_argument('--jobs',default=0,type=int,help="number of processes (default: 0, all cores)")
+    parser.add_argument('--force',action='store_true',help="converts all the files, even those unchanged since the last run")
+    parser.add_argument('--profile',nargs='?',const=0,default=None,type=int,metavar='N',help="prints stage timings and counters on stderr, with the N slowest files")
+    args = parser.parse_args()
+
+    stats = profiling.enable(args.profile) if args.profile is not None else None
+    converted,skipped,errors = convert_directory(args.brat_dir,outdir=args.outdir,jobs=args.jobs,force=args.force)
+    for filename,error in errors:
+        print(error,filename)
+    print(f'{len(converted)} converted, {len(skipped)} unchanged, {len(errors)} failed',file=sys.stderr)
+    if stats is not None:
+        stats.report()
+    if errors:
+        sys.exit(1)
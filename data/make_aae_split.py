@@ -24,24 +24,69 @@ def commonvocab(jsonvocab,vocab,verbose=False):
                 
 import os
 import json
-def get_filenames(jsondir,conllfilename,threshold=0.955):
+
+def conll_index(conllfilenames):
     """
-    Gets the json filenames that are part of the conllfile
+    Builds an inverted index of the vocabularies of several conll files
+    Args:
+       conllfilenames (list): the conll files, in split order
+    Returns:
+       dict. Maps each word to the bitmask of the files where it occurs (bit i for the i-th file)
     """
-    selected_files = []
-    other_files    = []
-    vocab =  connl2vocab(conllfilename)
-    for filename in os.listdir(jsondir):
+    index = { }
+    for num,conllfilename in enumerate(conllfilenames):
+        for token in connl2vocab(conllfilename):
+            index[token] = index.get(token,0) | (1 << num)
+    return index
+
+
+def assign_splits(jsondir,conllfiles,threshold=0.955,verbose=True):
+    """
+    Assigns the json files of a directory to the splits whose conll
+    reference contains at least threshold of their vocabulary, the other
+    files go to 'train'. Each json file is read once and its vocabulary
+    is matched against all the splits in a single scan of the inverted
+    index. A file matching several splits goes to the one with highest
+    proportion, the first split given wins ties.
+    Args:
+       jsondir (str)     : directory of the json files
+       conllfiles (dict) : maps split names to conll files, in tie breaking order
+       threshold (float) : minimal proportion of the vocabulary of a file found in the split
+       verbose (bool)    : whether the selected files are printed
+    Returns:
+       dict. Maps 'train' and each split name to the sorted list of its files
+    """
+    names  = list(conllfiles)
+    index  = conll_index([ conllfiles[name] for name in names ])
+    splits = { name:[ ] for name in ['train'] + names }
+    for filename in sorted(os.listdir(jsondir)):
         if filename.endswith('json'):
             with open(os.path.join(jsondir,filename)) as injson:
                 annotations = json.loads(injson.read())
-                prop = commonvocab([ token['str'] for paragraph in annotations["tokens"] for token in paragraph ],vocab)
-                if prop >= threshold:
+            vocab  = { token['str'] for paragraph in annotations["tokens"] for token in paragraph }
+            counts = [0] * len(names)
+            for token in vocab:
+                mask = index.get(token,0)
+                while mask:
+                    low = mask & -mask
+                    counts[low.bit_length()-1] += 1
+                    mask ^= low
+            best = max(range(len(names)),key=lambda num:(counts[num],-num),default=None)
+            prop = counts[best]/len(vocab) if best is not None and vocab else 0
+            if prop >= threshold:
+                if verbose:
                     print("In",filename,"with",prop)
-                    selected_files.append(filename)
-                    #print( commonvocab([ token['str'] for paragraph in annotations["tokens"] for token in paragraph ],vocab,verbose=True) )
-                    
-    return selected_files
+                splits[names[best]].append(filename)
+            else:
+                splits['train'].append(filename)
+    return splits
+
+
+def get_filenames(jsondir,conllfilename,threshold=0.955):
+    """
+    Gets the json filenames that are part of the conllfile
+    """
+    return assign_splits(jsondir,{'selected':conllfilename},threshold)['selected']
 
 def write_split(train,dev,test,outdirname):
     
@@ -55,11 +100,22 @@ def write_split(train,dev,test,outdirname):
         outfile.write('\n'.join(list(test)))
 
 
+def make_split(jsondir,dev_conll,test_conll,outdirname=None):
+    """
+    Writes the train, dev and test split files of the json files of a directory
+    Args:
+       jsondir (str)    : directory of the essay json files
+       dev_conll (str)  : conll file of the reference dev set
+       test_conll (str) : conll file of the reference test set
+       outdirname (str) : directory of the split files, defaults to jsondir
+    Returns:
+       (train,dev,test) the file names of each split
+    """
+    splits = assign_splits(jsondir,{'dev':dev_conll,'test':test_conll})
+    print(f"split train:{len(splits['train'])}, dev:{len(splits['dev'])}, test:{len(splits['test'])}")
+    write_split(splits['train'],splits['dev'],splits['test'],outdirname or jsondir)
+    return splits['train'],splits['dev'],splits['test']
+
+
 if __name__ == '__main__':
-    all_files   = set([filename for filename in os.listdir("aae_brat") if filename.endswith('json')])
-    dev_files   = get_filenames("aae_brat","aae_split/dev.dat")
-    test_files  = get_filenames("aae_brat","aae_split/test.dat")
-    trainfiles = set(all_files) - set(dev_files) - set(test_files)
-    print(f'split train:{len(trainfiles)}, dev:{len(dev_files)}, test:{len(test_files)}')
-    write_split(trainfiles,dev_files,test_files,"aae_brat")
-    
+    make_split("aae_brat","aae_split/dev.dat","aae_split/test.dat")
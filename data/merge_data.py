@@ -1,23 +1,137 @@
 # Lerges the json files inside a directory to a single json file.
 # This simply creates a document level structure. Each document is indexed separately
+# Documents are written one at a time, so that memory does not depend on the corpus size.
+# The output is either a json list of documents or its json-lines variant (one document per line),
+# optionally split into shards of a fixed number of documents described by an index file.
 
 import os
 import json
 
+SHARD_INDEX = 'shard_index'     #marker key of the index file, as in dataset_io
 
-def merge_dir(dirname,outfile):
 
-    documents = [ ]
-    
+class DocumentWriter:
+    """
+    Writes documents one at a time to a json list or to a json-lines file
+    and records the byte offsets of each document in the file (a json-lines
+    document ends after its newline, as in dataset_io)
+    """
+    def __init__(self,path,fmt='json'):
+        """
+        Args:
+          path (str): path to the output file
+          fmt  (str): 'json' or 'jsonl'
+        """
+        if fmt not in ('json','jsonl'):
+            raise Exception(f'Unknown output format {fmt}. aborting.')
+        self.path    = path
+        self.fmt     = fmt
+        self.offsets = [ ]
+        self.stream  = open(path,'wb')
+        self.pos     = 0
+        if fmt == 'json':
+            self._write(b'[')
+
+    def _write(self,data):
+        self.stream.write(data)
+        self.pos += len(data)
+
+    def write(self,document):
+        """
+        Appends a document to the file
+        """
+        if self.fmt == 'json' and self.offsets:
+            self._write(b', ')
+        start = self.pos
+        self._write(json.dumps(document).encode('utf-8'))
+        if self.fmt == 'jsonl':
+            self._write(b'\n')
+        self.offsets.append((start,self.pos))
+
+    def close(self):
+        if self.fmt == 'json':
+            self._write(b']')
+        self.stream.close()
+
+
+def iter_dir(dirname):
+    """
+    Reads the json files of a directory one at a time, in filename order
+    Yields:
+      dict. the documents
+    """
     for filename in sorted(os.listdir(dirname)):
         if filename.endswith('.json'):
             with open(os.path.join(dirname,filename)) as infile:
-                documents.append(json.loads(infile.read()))
-            
+                yield json.loads(infile.read())
+
+
+def shard_path(outfile,shard):
+    """
+    Returns:
+      str. the path of a shard, e.g. train-00002.jsonl for train.jsonl
+    """
+    prefix,ext = os.path.splitext(outfile)
+    return f'{prefix}-{shard:05d}{ext}'
+
+
+def merge_dir(dirname,outfile,fmt='json',shard_size=None):
+    """
+    Merges the json documents of a directory, writing them one at a time
+    Args:
+      dirname (str)   : directory of the per document json files
+      outfile (str)   : path to the output file
+      fmt (str)       : 'json' (a list of documents) or 'jsonl' (one document per line)
+      shard_size (int): if set, the documents are split into shards of shard_size
+                        documents and outfile is an index of the shards
+    Returns:
+      int. the number of documents merged
+    """
+    if shard_size is None:
+        writer = DocumentWriter(outfile,fmt)
+        try:
+            for document in iter_dir(dirname):
+                writer.write(document)
+        finally:
+            writer.close()
+        return len(writer.offsets)
+
+    if shard_size <= 0:
+        raise Exception('The shard size must be positive. aborting.')
+    shards = [ ]
+    writer = None
+    try:
+        for document in iter_dir(dirname):
+            if writer is None or len(writer.offsets) == shard_size:
+                if writer is not None:
+                    writer.close()
+                writer = DocumentWriter(shard_path(outfile,len(shards)),fmt)
+                shards.append(writer)
+            writer.write(document)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    #shard paths are relative to the index file
+    index = {SHARD_INDEX:1,
+             'format':fmt,
+             'documents':sum(len(shard.offsets) for shard in shards),
+             'shards':[ {'path':os.path.basename(shard.path),
+                         'documents':len(shard.offsets),
+                         'offsets':shard.offsets} for shard in shards ]}
     with open(outfile,'w') as outstream:
-        outstream.write(json.dumps(documents))
+        outstream.write(json.dumps(index))
+    return index['documents']
+
 
-            
 if __name__ == '__main__':
-    import sys
-    merge_dir(sys.argv[1],sys.argv[2])
+    import argparse
+    parser = argparse.ArgumentParser(
+                    prog='python merge_data.py [json_dir] [outfile]',
+                    description='Merges the json files of a directory into a single dataset file.')
+    parser.add_argument('json_dir')
+    parser.add_argument('outfile')
+    parser.add_argument('--format',default='json',choices=['json','jsonl'],help="a json list of documents or one document per line")
+    parser.add_argument('--shard-size',default=None,type=int,help="splits the output into shards of this many documents, outfile is then an index of the shards")
+    args = parser.parse_args()
+    merge_dir(args.json_dir,args.outfile,fmt=args.format,shard_size=args.shard_size)
@@ -0,0 +1,344 @@
+#Reading dataset files one document at a time.
+#Two formats are supported: the json format (a top level list of documents)
+#and its json-lines variant (one document per line).
+#Datasets split into shards are described by an index file (see data/merge_data.py),
+#read wherever a dataset file is expected.
+#Columnar corpus directories (see corpus_store.py) are read as well, as
+#document.Document objects built from the columns.
+#A sidecar offset index (<file>.idx) gives random access to the documents of a file.
+
+import codecs
+import json
+import os
+import re
+
+WHITESPACE  = re.compile(r'\s*')
+SHARD_INDEX = 'shard_index'     #marker key of the index of a sharded dataset
+
+
+def sniff_format(path):
+    """
+    Guesses the format of a dataset file from its first non blank character
+    Args:
+       path (str): path to a dataset file
+    Returns:
+       str. 'json' for a top level list of documents, 'jsonl' for one document per line
+    """
+    with open(path,'rb') as infile:
+        while True:
+            chunk = infile.read(4096)
+            if not chunk:
+                return 'json'
+            chunk = chunk.lstrip()
+            if chunk:
+                return 'json' if chunk.startswith(b'[') else 'jsonl'
+
+
+def iter_json_array(infile,chunk_size=1<<20):
+    """
+    Incrementally parses a top level json list. Only the current
+    document and a bounded read buffer are held in memory.
+    Args:
+       infile (file)    : a file opened in binary mode
+       chunk_size (int) : number of bytes read at once
+    Yields:
+       (document,start,end) triples, start and end are the byte offsets of the document in the file
+    Raises:
+       json.JSONDecodeError if the file is not a valid json list
+    """
+    decoder  = json.JSONDecoder()
+    utf8     = codecs.getincrementaldecoder('utf-8')()
+    buf,pos  = '',0
+    byte_pos = infile.tell()   #byte offset of buf[pos]
+    eof      = False
+
+    def fill():
+        nonlocal buf,pos,eof
+        data = infile.read(max(chunk_size,len(buf)-pos))
+        eof  = not data
+        buf  = buf[pos:] + utf8.decode(data,final=eof)
+        pos  = 0
+
+    def advance(end):
+        nonlocal pos,byte_pos
+        byte_pos += len(buf[pos:end].encode('utf-8'))
+        pos = end
+
+    def next_char():
+        #skips whitespace and returns the next significant char ('' at eof)
+        while True:
+            advance(WHITESPACE.match(buf,pos).end())
+            if pos < len(buf) or eof:
+                return buf[pos:pos+1]
+            fill()
+
+    def error(msg):
+        return json.JSONDecodeError(msg,buf,pos)
+
+    def end_of_list():
+        #nothing but whitespace may follow the list, as for json.loads
+        advance(pos+1)
+        if next_char():
+            raise error('Extra data')
+
+    if next_char() != '[':
+        raise error('Expecting a top level list of documents')
+    advance(pos+1)
+    if next_char() == ']':
+        end_of_list()
+        return
+    while True:
+        next_char()
+        try:
+            document,end = decoder.raw_decode(buf,pos)
+            #the value is complete once its delimiter is in the buffer, otherwise
+            #it may continue in the next chunk (e.g. a truncated number)
+            delim    = WHITESPACE.match(buf,end).end()
+            complete = eof or buf[delim:delim+1] in (',',']')
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            fill()
+            continue
+        start = byte_pos
+        advance(end)
+        yield document,start,byte_pos
+
+        char = next_char()
+        if char == ']':
+            end_of_list()
+            return
+        if char != ',':
+            raise error("Expecting ',' delimiter or ']'")
+        advance(pos+1)
+
+
+def iter_json_lines(infile):
+    """
+    Parses a json-lines file one document at a time
+    Args:
+       infile (file) : a file opened in binary mode
+    Yields:
+       (document,start,end) triples, start and end are the byte offsets of the document in the file
+    """
+    start = infile.tell()
+    for line in infile:
+        end = start + len(line)
+        if line.strip():
+            yield json.loads(line),start,end
+        start = end
+
+
+def read_shard_index(path):
+    """
+    Reads the index of a sharded dataset. The index is a single line json
+    object with a SHARD_INDEX key, only the first line of the file is read
+    Args:
+       path (str) : path to a dataset file
+    Returns:
+       dict. the index, or None if path is not a shard index
+    """
+    with open(path,'rb') as infile:
+        line = infile.readline().strip()
+    if not line.startswith(b'{'):
+        return None
+    try:
+        index = json.loads(line)
+    except ValueError:
+        return None
+    return index if isinstance(index,dict) and SHARD_INDEX in index else None
+
+
+def shard_paths(path,index):
+    """
+    Returns:
+       list of str. the paths of the shards, they are relative to the index file
+    """
+    dirname = os.path.dirname(path)
+    return [ os.path.join(dirname,shard['path']) for shard in index['shards'] ]
+
+
+def iter_documents(path,with_offsets=False):
+    """
+    Streams the documents of a dataset file in json or json-lines format,
+    of a sharded dataset or of a columnar corpus directory
+    Args:
+       path (str)          : path to the dataset file, shard index or corpus directory
+       with_offsets (bool) : whether the byte offsets of the documents are returned as well
+                             (offsets in their shard for a sharded dataset)
+    Yields:
+       documents (dict, document.Document for a columnar corpus) or (document,start,end)
+       triples if with_offsets is True
+    """
+    if os.path.isdir(path):
+        if with_offsets:
+            raise Exception('Byte offsets are not defined for a columnar corpus. aborting.')
+        from corpus_store import ColumnarCorpus
+        yield from ColumnarCorpus(path).documents()
+        return
+    index = read_shard_index(path)
+    if index is not None:
+        for shard in shard_paths(path,index):
+            yield from iter_documents(shard,with_offsets=with_offsets)
+        return
+    fmt = sniff_format(path)
+    with open(path,'rb') as infile:
+        documents = iter_json_array(infile) if fmt == 'json' else iter_json_lines(infile)
+        for document,start,end in documents:
+            yield (document,start,end) if with_offsets else document
+
+
+def iter_shards(index_path,with_offsets=False):
+    """
+    Streams the documents of a dataset split into shards (see data/merge_data.py)
+    Args:
+       index_path (str)    : path to the index file of the shards
+       with_offsets (bool) : whether the byte offsets of the documents in their shard are returned as well
+    Yields:
+       documents (dict) or (document,start,end) triples if with_offsets is True
+    """
+    index = read_shard_index(index_path)
+    if index is None:
+        raise Exception(f'{index_path} is not a shard index. aborting.')
+    for shard in shard_paths(index_path,index):
+        yield from iter_documents(shard,with_offsets=with_offsets)
+
+
+def index_path(path):
+    """
+    Returns:
+       str. the path of the offset index of a dataset file
+    """
+    return path + '.idx'
+
+
+def build_index(path):
+    """
+    Records the byte range of each document of a dataset file in a sidecar
+    index, along with the size and modification time of the file
+    Args:
+       path (str) : path to the dataset file
+    Returns:
+       list of (start,end) byte offsets, one per document
+    """
+    stat    = os.stat(path)
+    offsets = [ (start,end) for _,start,end in iter_documents(path,with_offsets=True) ]
+    index   = {'size':stat.st_size,'mtime':stat.st_mtime_ns,'offsets':offsets}
+    try:
+        with open(index_path(path),'w') as outfile:
+            outfile.write(json.dumps(index))
+    except OSError:
+        pass   #read only location: the index is rebuilt on next use
+    return offsets
+
+
+def load_index(path):
+    """
+    Loads the offset index of a dataset file, it is built on first use
+    and rebuilt whenever the file has changed since
+    Args:
+       path (str) : path to the dataset file
+    Returns:
+       list of (start,end) byte offsets, one per document
+    """
+    try:
+        with open(index_path(path)) as infile:
+            index = json.loads(infile.read())
+        stat = os.stat(path)
+        if index['size'] == stat.st_size and index['mtime'] == stat.st_mtime_ns:
+            return [ tuple(offsets) for offsets in index['offsets'] ]
+    except (OSError,ValueError,KeyError):
+        pass
+    return build_index(path)
+
+
+def parse_selection(doc=None,span=None):
+    """
+    Parses a document selection given on the command line
+    Args:
+       doc  (int) : a document number
+       span (str) : a range of document numbers 'a:b' (python slice, a or b may be omitted)
+    Returns:
+       slice or None if nothing is selected
+    """
+    if doc is not None:
+        return slice(doc,doc+1 if doc != -1 else None)
+    if span is not None:
+        try:
+            start,stop = ( int(bound) if bound.strip() else None for bound in span.split(':') )
+        except ValueError:
+            raise Exception(f'Invalid document range {span}, expected a:b. aborting.')
+        return slice(start,stop)
+    return None
+
+
+def select_documents(path,selection):
+    """
+    Reads some documents of a dataset file, seeking straight to them with
+    the offset index: only the selected documents are parsed. The offsets of
+    the documents of a sharded dataset are those recorded in its index
+    Args:
+       path (str)        : path to the dataset file, shard index or columnar corpus directory
+       selection (slice) : the selected document numbers
+    Returns:
+       list of documents (document.Corpus of Documents for a columnar corpus)
+    """
+    if os.path.isdir(path):
+        from corpus_store import ColumnarCorpus
+        return ColumnarCorpus(path).to_corpus(selection)
+    index = read_shard_index(path)
+    if index is None:
+        offsets = [ (path,start,end) for start,end in load_index(path) ]
+    else:
+        offsets = [ (shard_file,start,end) for shard_file,shard in zip(shard_paths(path,index),index['shards'])
+                                           for start,end in shard['offsets'] ]
+    documents = [ ]
+    infile    = None
+    try:
+        for filename,start,end in offsets[selection]:
+            if infile is None or infile.name != filename:
+                if infile is not None:
+                    infile.close()
+                infile = open(filename,'rb')
+            infile.seek(start)
+            documents.append(json.loads(infile.read(end-start)))
+    finally:
+        if infile is not None:
+            infile.close()
+    return documents
+
+
+def load_dataset(path):
+    """
+    Loads all the documents of a dataset file in json or json-lines format,
+    of a sharded dataset or of a columnar corpus directory
+    Args:
+       path (str) : path to the dataset file, shard index or corpus directory
+    Returns:
+       list of documents (document.Corpus of Documents for a columnar corpus)
+    """
+    if os.path.isdir(path):
+        from corpus_store import ColumnarCorpus
+        return ColumnarCorpus(path).to_corpus()
+    index = read_shard_index(path)
+    if index is not None:
+        return [ document for shard in shard_paths(path,index) for document in load_dataset(shard) ]
+    if sniff_format(path) == 'json':
+        with open(path) as infile:
+            return json.loads(infile.read())
+    return list(iter_documents(path))
+
+
+def write_json_lines(documents,path):
+    """
+    Writes documents in the json-lines variant of the dataset format
+    Args:
+       documents (iterable) : the documents
+       path (str)           : path to the output file
+    """
+    with open(path,'w') as outfile:
+        for document in documents:
+            outfile.write(json.dumps(document))
+            outfile.write('\n')
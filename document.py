@@ -0,0 +1,357 @@
+#Compact in-memory model of the dataset documents.
+#A Document stores its tokens, spans and relations as integer arrays, strings and
+#labels being ids into vocabularies shared by all the documents of a Corpus.
+#Derived views (BIO decoding, span and relation sets, paragraph boundaries...)
+#are computed on first use and cached, so that each is computed once per document
+#whatever the number of consumers.
+
+import os
+from array import array
+
+from bio import decode,encode,tag_names,tag_table
+
+
+class Vocab:
+    """
+    Interns strings as integer ids
+    """
+    __slots__ = ('ids','names')
+
+    def __init__(self,names=()):
+        self.ids   = { }
+        self.names = [ ]
+        for name in names:
+            self.index(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self,idx):
+        return self.names[idx]
+
+    def index(self,name):
+        """
+        Returns:
+           int. the id of name, added to the vocabulary if needed
+        """
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return idx
+
+
+class Vocabs:
+    """
+    The vocabularies of a corpus: token strings, BIO tags and span or relation labels
+    """
+    __slots__ = ('strs','tags','labels')
+
+    def __init__(self):
+        self.strs   = Vocab()
+        self.tags   = Vocab()
+        self.labels = Vocab()
+
+
+class Document:
+    """
+    A document of the dataset. Token, span and relation fields are stored
+    column wise in integer arrays, or memoryviews of the columns of a memory
+    mapped corpus (see corpus_store). The spans (resp. rels) columns are None
+    when the document has no 'spans' (resp. 'rels') key.
+    """
+    __slots__ = ('vocabs','token_idx','token_str','token_tag','parag_offsets',
+                 'span_start','span_end','span_label',
+                 'rel_src_start','rel_src_end','rel_tgt_start','rel_tgt_end','rel_label',
+                 '_cache')
+
+    def __init__(self,vocabs=None):
+        self.vocabs        = vocabs if vocabs is not None else Vocabs()
+        self.token_idx     = array('q')
+        self.token_str     = array('i')
+        self.token_tag     = array('i')
+        self.parag_offsets = array('q',[0])
+        self.span_start = self.span_end = self.span_label = None
+        self.rel_src_start = self.rel_src_end = self.rel_tgt_start = self.rel_tgt_end = self.rel_label = None
+        self._cache = { }
+
+    @staticmethod
+    def from_dict(annotations,vocabs=None):
+        """
+        Builds a document from an annotation dict
+        Args:
+           annotations (dict) : a document in the json dataset format
+           vocabs (Vocabs)    : the vocabularies to use, shared with other documents
+        Returns:
+           Document
+        """
+        doc   = Document(vocabs)
+        strs,tags,labels = doc.vocabs.strs,doc.vocabs.tags,doc.vocabs.labels
+        for parag in annotations['tokens']:
+            for token in parag:
+                doc.token_idx.append(token['idx'])
+                doc.token_str.append(strs.index(token['str']))
+                doc.token_tag.append(tags.index(token.get('arg','O')))
+            doc.parag_offsets.append(len(doc.token_idx))
+        if 'spans' in annotations:
+            spans = annotations['spans']
+            doc.span_start = array('q',[ span['start'] for span in spans ])
+            doc.span_end   = array('q',[ span['end'] for span in spans ])
+            doc.span_label = array('i',[ labels.index(span['name']) for span in spans ])
+        if 'rels' in annotations:
+            rels = annotations['rels']
+            doc.rel_src_start = array('q',[ rel['src'][0] for rel in rels ])
+            doc.rel_src_end   = array('q',[ rel['src'][1] for rel in rels ])
+            doc.rel_tgt_start = array('q',[ rel['tgt'][0] for rel in rels ])
+            doc.rel_tgt_end   = array('q',[ rel['tgt'][1] for rel in rels ])
+            doc.rel_label     = array('i',[ labels.index(rel['name']) for rel in rels ])
+        return doc
+
+    def to_dict(self):
+        """
+        Returns:
+           dict. the document in the json dataset format
+        """
+        strs,tags = self.vocabs.strs,self.vocabs.tags
+        annotations = {'tokens':[ [ {'idx':self.token_idx[i],'str':strs[self.token_str[i]],'arg':tags[self.token_tag[i]]}
+                                    for i in range(start,end) ]
+                                  for start,end in self.paragraphs() ]}
+        if 'spans' in self:
+            annotations['spans'] = [ {'name':label,'start':start,'end':end} for start,end,label in self.spans() ]
+        if 'rels' in self:
+            annotations['rels'] = [ {'name':label,'src':list(src),'tgt':list(tgt)} for src,tgt,label in self.rels() ]
+        return annotations
+
+    def __getstate__(self):
+        #memoryviews are not picklable, they are sent to worker processes as arrays
+        return { name:array(value.format,value) if type(value) is memoryview else value
+                 for name in self.__slots__ for value in (getattr(self,name),) }
+
+    def __setstate__(self,state):
+        for name,value in state.items():
+            setattr(self,name,value)
+
+    def __contains__(self,key):
+        """
+        Mimics the keys of an annotation dict: 'tokens', 'spans' and 'rels'
+        """
+        if key == 'tokens':
+            return True
+        if key == 'spans':
+            return self.span_start is not None
+        if key == 'rels':
+            return self.rel_src_start is not None
+        return False
+
+    def __len__(self):
+        return len(self.token_idx)
+
+    def _cached(self,name,compute):
+        value = self._cache.get(name)
+        if value is None:
+            value = self._cache[name] = compute()
+        return value
+
+    def invalidate(self):
+        """
+        Clears the cached views, to be called after modifying the arrays
+        """
+        self._cache.clear()
+
+    def paragraphs(self):
+        """
+        Returns:
+           list of (start,end) token positions of the paragraphs
+        """
+        return self._cached('paragraphs',lambda: list(zip(self.parag_offsets,self.parag_offsets[1:])))
+
+    def paragraph_lengths(self):
+        """
+        Returns:
+           list of the number of tokens of each paragraph
+        """
+        return self._cached('paragraph_lengths',lambda: [ end-start for start,end in self.paragraphs() ])
+
+    def tags(self):
+        """
+        Returns:
+           list of the BIO tag of each token
+        """
+        names = self.vocabs.tags.names
+        return self._cached('tags',lambda: [ names[tag] for tag in self.token_tag ])
+
+    def spans(self):
+        """
+        Returns:
+           list of (start,end,label) span triples, None if the document has no spans
+        """
+        if 'spans' not in self:
+            return None
+        labels = self.vocabs.labels.names
+        return self._cached('spans',lambda: [ (start,end,labels[label])
+                                              for start,end,label in zip(self.span_start,self.span_end,self.span_label) ])
+
+    def rels(self):
+        """
+        Returns:
+           list of ((src_start,src_end),(tgt_start,tgt_end),label) triples, None if the document has no rels
+        """
+        if 'rels' not in self:
+            return None
+        labels = self.vocabs.labels.names
+        return self._cached('rels',lambda: [ ((src_start,src_end),(tgt_start,tgt_end),labels[label])
+                                             for src_start,src_end,tgt_start,tgt_end,label
+                                             in zip(self.rel_src_start,self.rel_src_end,self.rel_tgt_start,self.rel_tgt_end,self.rel_label) ])
+
+    def bio_spans(self,repair=False):
+        """
+        Decodes the spans from the BIO tags of the tokens (see bio.decode)
+        Args:
+           repair (bool): whether B tags close the open span and I tags outside spans begin one
+        Returns:
+           list of (start,end,label) span triples
+        """
+        def compute():
+            kinds,tag_labels,labels = tag_table(self.vocabs.tags.names)
+            names = list(labels)
+            starts,ends,span_labels = decode(self.token_tag,kinds,tag_labels,self.parag_offsets,self.token_idx,repair)
+            return [ (start,end,names[label]) for start,end,label in zip(starts,ends,span_labels) ]
+        return self._cached(('bio_spans',repair),compute)
+
+    def span_set(self,labeled=True,repair=False):
+        """
+        The spans of the document: the 'spans' field when available, decoded
+        from the BIO tags otherwise (as evaluate.get_spans does)
+        Returns:
+           frozenset of (start,end,label) or (start,end) tuples
+        """
+        def compute():
+            spans = self.spans()
+            if spans is None:
+                spans = self.bio_spans(repair)
+            return frozenset(spans) if labeled else frozenset( span[:2] for span in spans )
+        return self._cached(('span_set',labeled,repair),compute)
+
+    def rel_set(self,labeled=True):
+        """
+        The relations of the document (as evaluate.get_rels does)
+        Returns:
+           frozenset of (src,tgt,label) or (src,tgt) tuples, None if the document has no rels
+        """
+        if 'rels' not in self:
+            return None
+        return self._cached(('rel_set',labeled),lambda: frozenset( rel if labeled else rel[:2] for rel in self.rels() ))
+
+    def ner_tags(self):
+        """
+        Encodes the 'spans' field as BIO tags, as brat_import.annotate_NER does
+        Returns:
+           list of the BIO tag of each token
+        """
+        def compute():
+            labels = Vocab()
+            spans  = self.spans() or [ ]
+            tag_ids = encode(self.token_idx,[ span[0] for span in spans ],[ span[1] for span in spans ],
+                             [ labels.index(span[2]) for span in spans ])
+            return list(map(tag_names(labels.names).__getitem__,tag_ids))
+        return self._cached('ner_tags',compute)
+
+    def rel_span_indices(self):
+        """
+        Resolves the relation endpoints to positions in the list of spans
+        Returns:
+           list of (src,tgt,label) triples, src and tgt are span positions
+           or -1 when the endpoint is not a span of the document. None if
+           the document has no rels
+        """
+        if 'rels' not in self:
+            return None
+        def resolve():
+            position = { }
+            spans = self.spans()
+            for pos,(start,end,_) in enumerate(spans if spans is not None else self.bio_spans()):
+                position.setdefault((start,end),pos)
+            return [ (position.get(src,-1),position.get(tgt,-1),label) for src,tgt,label in self.rels() ]
+        return self._cached('rel_span_indices',resolve)
+
+
+class Corpus:
+    """
+    A list of documents sharing the same vocabularies
+    """
+    __slots__ = ('documents','vocabs','_graph')
+
+    def __init__(self,documents=None,vocabs=None):
+        self.documents = documents if documents is not None else [ ]
+        self.vocabs    = vocabs if vocabs is not None else Vocabs()
+        self._graph    = None
+
+    @staticmethod
+    def from_dicts(annotations):
+        """
+        Args:
+           annotations (iterable): documents in the json dataset format
+        Returns:
+           Corpus
+        """
+        corpus = Corpus()
+        for document in annotations:
+            corpus.documents.append(Document.from_dict(document,corpus.vocabs))
+        return corpus
+
+    @staticmethod
+    def load(path,selection=None,graph=False):
+        """
+        Loads a dataset file (json, json-lines or columnar corpus directory).
+        The documents of a columnar corpus are read from its columns.
+        KwArgs:
+           selection (slice): the selected document numbers (see dataset_io.select_documents), or None
+           graph (bool)     : whether the relation graph index is built at load time
+        Returns:
+           Corpus
+        """
+        from dataset_io import iter_documents,select_documents
+        if os.path.isdir(path):
+            from corpus_store import ColumnarCorpus
+            corpus = ColumnarCorpus(path).to_corpus(selection)
+        elif selection is not None:
+            corpus = Corpus.from_dicts(select_documents(path,selection))
+        else:
+            corpus = Corpus.from_dicts(iter_documents(path))
+        if graph:
+            corpus.graph()
+        return corpus
+
+    def graph(self):
+        """
+        The relation graph index of all the documents (requires numpy), built on
+        first use. Documents added afterwards require a call to invalidate()
+        Returns:
+           RelationGraph
+        """
+        if self._graph is None:
+            from relation_graph import RelationGraph
+            self._graph = RelationGraph(self.documents)
+        return self._graph
+
+    def invalidate(self):
+        """
+        Clears the relation graph index, to be called after modifying the documents
+        """
+        self._graph = None
+
+    def to_dicts(self):
+        """
+        Returns:
+           list of documents in the json dataset format
+        """
+        return [ document.to_dict() for document in self.documents ]
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __getitem__(self,idx):
+        return self.documents[idx]
+
+    def __iter__(self):
+        return iter(self.documents)
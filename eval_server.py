@@ -0,0 +1,334 @@
+#Local evaluation server. Named reference sets are loaded and indexed once
+#(see evaluate.Evaluator) and kept in memory: clients post predictions and get
+#the evaluation results back as json, without paying for the process startup,
+#the parsing of the reference files and the extraction of the gold spans.
+#
+#  python eval_server.py serve --ref aae_test=aae_test.json --ref abstrct_neoplasm_test.json --port 8765
+#  python eval_server.py submit predfile.json aae_test --port 8765
+#  curl --data-binary @predfile.json 'localhost:8765/evaluate/aae_test?alpha=0.5'
+#
+#The server speaks a minimal HTTP/1.1 (keep-alive connections, Content-Length
+#bodies) over localhost TCP or a Unix socket (--socket). Requests are served by
+#asyncio, the evaluations run in a pool of processes forked after the references
+#are indexed, so that the workers share them.
+
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import parse_qs,urlsplit
+
+from evaluate import Evaluator
+
+#name -> Evaluator, filled before the workers are forked
+REFERENCES = { }
+
+STATUS = {200:'OK',400:'Bad Request',404:'Not Found',405:'Method Not Allowed',500:'Internal Server Error'}
+
+
+def load_references(refs):
+    """
+    Loads and indexes reference sets in the current process
+    Args:
+       refs (dict): maps reference names to dataset paths
+    """
+    from dataset_io import load_dataset
+    for name,path in refs.items():
+        REFERENCES[name] = Evaluator(load_dataset(path))
+
+
+def parse_refs(specs):
+    """
+    Parses the --ref arguments: name=path, or a path named after its file name
+    Returns:
+       dict. maps reference names to paths
+    """
+    refs = { }
+    for spec in specs:
+        name,sep,path = spec.partition('=')
+        if not sep:
+            name,path = os.path.splitext(os.path.basename(spec))[0],spec
+        if name in refs:
+            raise Exception(f'Duplicate reference name {name}. aborting.')
+        refs[name] = path
+    return refs
+
+
+def parse_predictions(body):
+    """
+    Parses predictions posted as a json list of documents or as json lines
+    Returns:
+       list of documents
+    """
+    text = body.decode('utf-8').strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [ json.loads(line) for line in text.splitlines() if line.strip() ]
+
+
+def evaluate_request(name,body,alpha=0.5,breakdown=False):
+    """
+    Evaluates posted predictions against a loaded reference set (runs in the workers)
+    Returns:
+       (status,response) an HTTP status and a json serializable response
+    """
+    evaluator = REFERENCES.get(name)
+    if evaluator is None:
+        return 404,{'error':f'Unknown reference {name}'}
+    try:
+        preds = parse_predictions(body)
+        if len(preds) != len(evaluator):
+            raise Exception(f'The prediction has {len(preds)} documents, the reference {name} has {len(evaluator)}. aborting.')
+        return 200,{'reference':name,'documents':len(preds),'alpha':alpha,
+                    'results':evaluator.evaluate(preds,alpha=alpha,breakdown=breakdown)}
+    except Exception as e:
+        return 400,{'error':str(e)}
+
+
+async def read_request(reader):
+    """
+    Reads a request from a connection
+    Returns:
+       (method,target,version,headers,body), None when the client closed the connection
+    Raises:
+       ValueError if the request line or the headers are malformed
+       asyncio.IncompleteReadError if the connection closes within the request
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    parts = request_line.decode('latin-1').split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+        raise ValueError('Malformed request line')
+    method,target,version = parts
+    headers = { }
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(line,None)
+        if not line.strip():
+            break
+        key,sep,value = line.decode('latin-1').partition(':')
+        if not sep or not key.strip():
+            raise ValueError('Malformed header line')
+        headers[key.strip().lower()] = value.strip()
+    length = headers.get('content-length','0')
+    if not length.isdigit():
+        raise ValueError('Malformed Content-Length header')
+    body = await reader.readexactly(int(length))
+    return method,target,version,headers,body
+
+
+class EvalServer:
+    """
+    Serves evaluation requests:
+       GET  /references              lists the reference sets and their number of documents
+       POST /evaluate/<name>?alpha=A&breakdown=1
+                                     evaluates the predictions in the request body (json or json lines)
+    """
+    def __init__(self,workers=0):
+        """
+        Args:
+           workers (int): number of worker processes, 0 or less uses all cores
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        #forked workers inherit the references indexed by the parent
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        if context.get_start_method() != 'fork':
+            raise Exception('The evaluation server requires the fork start method. aborting.')
+        self.pool     = ProcessPoolExecutor(workers if workers > 0 else os.cpu_count(),mp_context=context)
+        self.requests = 0
+
+    async def dispatch(self,method,target,body):
+        """
+        Returns:
+           (status,response) an HTTP status and a json serializable response
+        """
+        url  = urlsplit(target)
+        path = url.path.strip('/').split('/')
+        if path == ['references']:
+            if method != 'GET':
+                return 405,{'error':'use GET'}
+            return 200,{ name:len(evaluator) for name,evaluator in REFERENCES.items() }
+        if len(path) == 2 and path[0] == 'evaluate':
+            if method != 'POST':
+                return 405,{'error':'use POST'}
+            query = parse_qs(url.query)
+            try:
+                alpha = float(query.get('alpha',['0.5'])[0])
+            except ValueError:
+                return 400,{'error':'alpha must be a number'}
+            breakdown = query.get('breakdown',['0'])[0] not in ('0','false','')
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool,evaluate_request,path[1],body,alpha,breakdown)
+        return 404,{'error':f'Unknown path {url.path}'}
+
+    async def handle(self,reader,writer):
+        """
+        Serves the requests of a connection until the client closes it
+        """
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as e:
+                    #the rest of the stream cannot be parsed: answers and closes the connection
+                    request,status,response = None,400,{'error':str(e)}
+                else:
+                    if request is None:
+                        break
+                    method,target,version,headers,body = request
+                    try:
+                        status,response = await self.dispatch(method,target,body)
+                    except Exception as e:
+                        status,response = 500,{'error':str(e)}
+                self.requests += 1
+                payload = json.dumps(response).encode('utf-8')
+                keep_alive = request is not None and headers.get('connection','').lower() != 'close' and version == 'HTTP/1.1'
+                writer.write(f'HTTP/1.1 {status} {STATUS[status]}\r\n'
+                             f'Content-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\n'
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError,ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self,host='127.0.0.1',port=8765,socket_path=None):
+        """
+        Serves forever on a localhost port or a Unix socket
+        """
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(self.handle,path=socket_path)
+        else:
+            server = await asyncio.start_server(self.handle,host,port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def connect(host='127.0.0.1',port=8765,socket_path=None,timeout=None):
+    """
+    Opens a connection to the server
+    Returns:
+       http.client.HTTPConnection
+    """
+    import http.client
+    if socket_path is None:
+        return http.client.HTTPConnection(host,port,timeout=timeout)
+
+    import socket
+    class UnixConnection(http.client.HTTPConnection):
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(socket_path)
+    return UnixConnection('localhost',timeout=timeout)
+
+
+def submit(connection,reference,body,alpha=0.5,breakdown=False):
+    """
+    Posts predictions to the server
+    Args:
+       connection     : as returned by connect, reused across calls
+       reference (str): the name of the reference set
+       body (bytes)   : the predictions as a json list of documents or json lines
+    Returns:
+       dict. the server response
+    Raises:
+       Exception if the server returns an error
+    """
+    connection.request('POST',f"/evaluate/{reference}?alpha={alpha}&breakdown={int(breakdown)}",body=body,
+                       headers={'Content-Type':'application/json'})
+    response = json.loads(connection.getresponse().read())
+    if 'error' in response:
+        raise Exception(response['error'])
+    return response
+
+
+def benchmark(reference,body,clients=8,requests=20,alpha=0.5,**address):
+    """
+    Measures the throughput of the server under concurrent clients, each
+    posting the same predictions on its own keep-alive connection
+    Returns:
+       dict. the number of requests, the elapsed seconds and the requests per second
+    """
+    import threading
+    import time
+    errors = [ ]
+    def client():
+        connection = connect(**address)
+        try:
+            for _ in range(requests):
+                submit(connection,reference,body,alpha)
+        except Exception as e:
+            errors.append(str(e))
+        finally:
+            connection.close()
+    threads = [ threading.Thread(target=client) for _ in range(clients) ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+    if errors:
+        raise Exception(f'{len(errors)} clients failed: {errors[0]}')
+    return {'clients':clients,'requests':clients*requests,'seconds':seconds,
+            'requests_per_second':clients*requests / seconds}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+                    prog='python eval_server.py',
+                    description='Local evaluation server with preloaded reference sets.')
+    commands = parser.add_subparsers(dest='command',required=True)
+    serve_cmd  = commands.add_parser('serve',help="loads the reference sets and serves evaluation requests")
+    submit_cmd = commands.add_parser('submit',help="evaluates a prediction file on the server")
+    bench_cmd  = commands.add_parser('bench',help="measures the server throughput under concurrent clients")
+    for command in (serve_cmd,submit_cmd,bench_cmd):
+        command.add_argument('--host',default='127.0.0.1')
+        command.add_argument('--port',default=8765,type=int)
+        command.add_argument('--socket',default=None,help="serves on (connects to) this Unix socket rather than a port")
+    serve_cmd.add_argument('--ref',action='append',required=True,metavar='NAME=PATH',help="a reference set, named after its file when NAME is omitted (repeatable)")
+    serve_cmd.add_argument('--workers',default=0,type=int,help="number of worker processes (0 uses all cores)")
+    for command in (submit_cmd,bench_cmd):
+        command.add_argument('pred_file')
+        command.add_argument('reference',help="name of the reference set")
+        command.add_argument('--alpha',default=0.5,type=float)
+    submit_cmd.add_argument('--breakdown',action='store_true',help="adds the per label scores and the span label confusion matrix")
+    bench_cmd.add_argument('--clients',default=8,type=int,help="number of concurrent clients")
+    bench_cmd.add_argument('--requests',default=20,type=int,help="number of requests per client")
+    args = parser.parse_args()
+
+    address = {'socket_path':args.socket} if args.socket else {'host':args.host,'port':args.port}
+    try:
+        if args.command == 'serve':
+            load_references(parse_refs(args.ref))
+            server = EvalServer(args.workers)
+            print(f"serving {', '.join(REFERENCES)} on {args.socket or f'{args.host}:{args.port}'}",file=sys.stderr)
+            try:
+                asyncio.run(server.serve(host=args.host,port=args.port,socket_path=args.socket))
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.close()
+        else:
+            with open(args.pred_file,'rb') as infile:
+                body = infile.read()
+            if args.command == 'submit':
+                connection = connect(**address)
+                print(json.dumps(submit(connection,args.reference,body,args.alpha,args.breakdown),indent=2))
+            else:
+                print(json.dumps(benchmark(args.reference,body,args.clients,args.requests,args.alpha,**address),indent=2))
+    except Exception as e:
+        print('[error]',e)
+        sys.exit(1)
@@ -1,3 +1,53 @@
+import os
+from bisect import bisect_right
+from collections import deque
+from functools import partial
+from itertools import islice
+
+import profiling
+from bio import decode_tokens
+from document import Document
+
+def prf(tp,npred,nref):
+    """
+    Computes precision, recall and f-score from match counts. An empty
+    prediction for an empty reference is a perfect match, otherwise an
+    empty denominator yields a zero score.
+    Args:
+       tp    (int): number of correct predicted items
+       npred (int): number of predicted items
+       nref  (int): number of reference items
+    Returns:
+       (P,R,F) a triple of floats
+    """
+    if npred == 0 and nref == 0:
+        return (1.,1.,1.)
+    prec  = tp / npred if npred else 0.
+    recll = tp / nref if nref else 0.
+
+    if prec + recll == 0:
+        return (0.,0.,0.)
+
+    f1    = (2 * prec * recll) / (prec + recll)
+    return (prec,recll,f1)
+
+
+def count_matches(pred_items,ref_items):
+    """
+    Counts the predicted items found in the reference
+    Args:
+       pred_items (list): a list of spans or rels (tuples)
+       ref_items  (list): a list of spans or rels (tuples)
+    Returns:
+       (tp,npred,nref) a triple of ints
+    """
+    if not isinstance(pred_items,(set,frozenset)):
+        pred_items = set(pred_items)
+    if not isinstance(ref_items,(set,frozenset)):
+        ref_items = set(ref_items)
+    return (len(pred_items & ref_items),len(pred_items),len(ref_items))
+
+
 def eval_spans(pred_spans,ref_spans):
     """
     Receives two lists of spans and returns a precision, recall,
@@ -9,38 +59,24 @@ def eval_spans(pred_spans,ref_spans):
     Returns:
        (P,R,F) a triple of floats
     """
-    pred_spans = set(pred_spans)
-    ref_spans  = set(ref_spans) 
-
-    pred_correct = pred_spans & ref_spans
-    prec  = len(pred_correct) /  len(pred_spans)
-    recll = len(pred_correct) /  len(ref_spans)
-
-    if prec + recll == 0:
-        return (0,0,0)
-
-    f1    = (2 * prec * recll) / (prec + recll)
-    return (prec,recll,f1)
+    return prf(*count_matches(pred_spans,ref_spans))
 
 
 def eval_rels(pred_rels,ref_rels):
-   
-    pred_correct = pred_rels & ref_rels
-    prec  = len(pred_correct) /  len(pred_rels)
-    recll = len(pred_correct) /  len(ref_rels)
-
-    if prec + recll == 0:
-        return (0,0,0)
-    
-    f1    = (2 * prec * recll) / (prec + recll)
-    return (prec,recll,f1)
+    """
+    Receives two sets of rels and returns a precision, recall,
+    f-score
+    Returns:
+       (P,R,F) a triple of floats
+    """
+    return prf(*count_matches(pred_rels,ref_rels))
 
 
 def get_rels(annotations,labeled=True):
     """
     Gets the rels from the annotations and converts them to span
     Args:
-       annotations (dict) : the annotation dict
+       annotations (dict) : the annotation dict or a Document
     KwArgs:
        labeled     (bool) : whether the relations are labeled or not 
     Returns:
@@ -50,6 +86,8 @@ def get_rels(annotations,labeled=True):
     """
     if 'rels' not in annotations:
         raise Exception('Tried to extract relations from annotation but it failed. Aborting.')
+    if isinstance(annotations,Document):
+        return annotations.rel_set(labeled)
     
     if labeled:
         rels = { (tuple(rel['src']),tuple(rel['tgt']), rel['name'])  for rel in annotations['rels'] } 
@@ -59,82 +97,198 @@ def get_rels(annotations,labeled=True):
     return rels
 
 
+class RelAligner:
+    """
+    Aligns predicted relations on a fixed set of reference relations.
+    Reference src and tgt spans are stored in two SpanIndex. Each
+    predicted src (resp. tgt) span is resolved once against the
+    reference src (resp. tgt) spans, the mapping is cached and the
+    relations are then aligned by lookup.
+    """
+    def __init__(self,ref_rels):
+        #rank of the last reference relation using a span: when several
+        #reference spans match a predicted span, the last one wins
+        self.src_rank = { }
+        self.tgt_rank = { }
+        for rank,(rsrc,rtgt,*rlabel) in enumerate(ref_rels):
+            self.src_rank[rsrc] = rank
+            self.tgt_rank[rtgt] = rank
+        self.src_index = SpanIndex(self.src_rank)
+        self.tgt_index = SpanIndex(self.tgt_rank)
+
+    @staticmethod
+    def resolve(pspan,index,rank,alpha):
+        """
+        Resolves a predicted span against a reference index
+        Args:
+           pspan (tuple)     : a (start,end) predicted span
+           index (SpanIndex) : the reference spans
+           rank  (dict)      : the rank of each reference span
+           alpha (float)     : threshold for approximative span matching
+        Returns:
+           tuple. The matching reference span with highest rank or pspan if none matches
+        """
+        matches = list(index.matches(pspan[0],pspan[1],alpha))
+        if matches:
+            return max(matches,key=rank.get)
+        return pspan
+
+    @staticmethod
+    def candidates(pspan,index,rank):
+        """
+        Lists the reference spans overlapping a predicted span
+        Args:
+           pspan (tuple)     : a (start,end) predicted span
+           index (SpanIndex) : the reference spans
+           rank  (dict)      : the rank of each reference span
+        Returns:
+           list of (span,overlap,length) triples by decreasing rank
+        """
+        overlaps = sorted(index.overlapping(pspan[0],pspan[1]),key=lambda elt:rank[elt[0]],reverse=True)
+        return [(span,overlap,span[1]-span[0]+1) for span,overlap in overlaps]
+
+    def align(self,pred_rels,alpha):
+        """
+        Aligns the node rels in the pred with node rels in the ref
+        Args:
+           pred_rels (set) : the predicted rels as tuples
+           alpha (float)   : threshold for approximative span matching
+        Returns:
+           set of tuples. The aligned predicted rels
+        """
+        src_cache = { }
+        tgt_cache = { }
+        arels = [ ]
+        for psrc,ptgt,*plabel in pred_rels:
+            if psrc not in src_cache:
+                src_cache[psrc] = self.resolve(psrc,self.src_index,self.src_rank,alpha)
+            if ptgt not in tgt_cache:
+                tgt_cache[ptgt] = self.resolve(ptgt,self.tgt_index,self.tgt_rank,alpha)
+            src,tgt = src_cache[psrc],tgt_cache[ptgt]
+            if plabel:
+                arels.append((src,tgt,plabel[0]))
+            else:
+                arels.append((src,tgt))
+        return set(arels)
+
+
 def align_rels(pred_rels,ref_rels,alpha):
     """
     Aligns the node rels in the pred with node rels in the ref
+    Args:
+       pred_rels : set of tuples
+       ref_rels  : set of tuples or a RelAligner built on the ref rels
+       alpha (float) : threshold for approximative span matching
+    Returns:
+       set of tuples. The aligned predicted rels
     """
-    arels = [  ]
-    for prel in pred_rels:
-        src = False
-        tgt = False
-        psrc,ptgt,*plabel = prel
-        psrc_tokens = set(range(psrc[0],psrc[1]+1))
-        ptgt_tokens = set(range(ptgt[0],ptgt[1]+1))
-        for rrel in ref_rels:
-            rsrc,rtgt,*rlabel = rrel
-            rsrc_tokens = set(range(rsrc[0],rsrc[1]+1))
-            rtgt_tokens = set(range(rtgt[0],rtgt[1]+1))
-
-            if len(psrc_tokens & rsrc_tokens) > (alpha*len(rsrc_tokens)):
-                src = rsrc
-            
-            if len(ptgt_tokens & rtgt_tokens) > (alpha*len(rtgt_tokens)):
-                tgt = rtgt
-
-        if not src:
-            src = psrc
-        if not tgt:
-            tgt = ptgt
-        if plabel:
-            arels.append((src,tgt,plabel[0]))
-        else:
-            arels.append((src,tgt))
-    return set(arels)
+    aligner = ref_rels if isinstance(ref_rels,RelAligner) else RelAligner(ref_rels)
+    return aligner.align(pred_rels,alpha)
 
 
-from random import random
-
-def get_spans(annotations,labeled=True):
+def get_spans(annotations,labeled=True,repair=False):
      """
      Gets the spans from pred annotations in a robust manner: 
      if the spans are missing from the predicted annotations, then they are inferred from token annotations
      
      Args:
-         annotations (dict) : annotations
+         annotations (dict) : annotations or a Document (its decoded spans are cached)
      KwArgs:
         labeled(bool): whether the returned spans are labelled or not
+        repair (bool): whether B tags close the open span and I tags outside spans begin one when decoding the tags (see bio.decode)
      Returns:
        a set of pred spans as tuples. a set of ref spans as tuples
      """
+     if isinstance(annotations,Document):
+         return annotations.span_set(labeled,repair)
      if 'spans' in annotations:         
-         spans = annotations['spans']
+         spans = [ (span['start'],span['end'],span['name']) for span in annotations['spans'] ]
      else:
-
-         spans = [ ]
-         current_lbl   = ''
-         current_start = -1
-            
-         for paragraph in annotations['tokens']:
-             for token in paragraph:
-                 if token['arg'].startswith('B'):
-                     current_start = token['idx']
-                     current_lbl = token['arg'].split('-')[-1]
-                 elif token['arg'].startswith('I'):
-                     pass
-                 else: 
-                     if current_lbl:
-                         spans.append( {'name':current_lbl,'start':current_start,'end':token['idx'] - 1 } )
-                         current_lbl = ''
-                         current_start = -1
-             if current_lbl:
-                spans.append( {'name':current_lbl,'start':current_start,'end':paragraph[-1]['idx']})
-                current_lbl = ''
-                current_start = -1
+         spans = decode_tokens(annotations['tokens'],repair)
 
      if labeled:
-        return { (span['start'],span['end'],span['name']) for span in spans}
+        return set(spans)
      else:
-        return { (span['start'],span['end']) for span in spans}
+        return { span[:2] for span in spans }
+
+
+class SpanIndex:
+    """
+    Sorted interval index over a collection of spans. Spans are
+    tuples whose two first fields are the (inclusive) start and end
+    token indexes. Overlaps are computed arithmetically from the
+    endpoints and only the spans that actually overlap a query are
+    visited.
+    """
+    def __init__(self,spans):
+        self.spans   = sorted(spans,key=lambda span:(span[0],span[1]))
+        self.starts  = [span[0] for span in self.spans]
+        #maxends[i] is the largest end among spans[:i+1]
+        self.maxends = [ ]
+        maxend = None
+        for span in self.spans:
+            maxend = span[1] if maxend is None else max(maxend,span[1])
+            self.maxends.append(maxend)
+
+    def __len__(self):
+        return len(self.spans)
+
+    def overlapping(self,start,end):
+        """
+        Yields the spans sharing at least one token with the [start,end] query
+        Args:
+           start (int): first token of the query
+           end   (int): last token of the query (included)
+        Yields:
+           (span,overlap) couples where overlap is the number of common tokens
+        """
+        first = bisect_right(self.starts,end)-1
+        for idx in range(first,-1,-1):
+            if self.maxends[idx] < start:
+                break
+            span    = self.spans[idx]
+            overlap = min(end,span[1]) - max(start,span[0]) + 1
+            if overlap > 0:
+                yield span,overlap
+        else:
+            idx = -1
+        if profiling.STATS is not None:
+            profiling.STATS.count('candidate_pairs',first-idx)
+
+    def matches(self,start,end,alpha):
+        """
+        Yields the indexed spans whose overlap with the [start,end] query is
+        greater than alpha times their own length
+        Args:
+           start (int)   : first token of the query
+           end   (int)   : last token of the query (included)
+           alpha (float) : threshold for approximative span matching
+        Yields:
+           the matching spans
+        """
+        if alpha >= 0:
+            for span,overlap in self.overlapping(start,end):
+                if overlap > alpha*(span[1]-span[0]+1):
+                    yield span
+        else:
+            #a negative alpha lets any non empty span match, overlapping or not
+            for span in self.spans:
+                if span[1] >= span[0]:
+                    yield span
+
+
+def index_spans(spans):
+    """
+    Indexes spans by label
+    Args:
+       spans : list of span tuples (start,end,*label)
+    Returns:
+       dict. Maps a label tuple (empty for unlabeled spans) to a SpanIndex
+    """
+    groups = { }
+    for span in spans:
+        groups.setdefault(tuple(span[2:]),[ ]).append(span)
+    return {label:SpanIndex(group) for label,group in groups.items()}
 
 
 def align_spans(pred_spans,ref_spans,alpha):
@@ -142,29 +296,554 @@ def align_spans(pred_spans,ref_spans,alpha):
     Align pred spans on ref spans as soon as their overlap is greater than 50%
     Args:
        pred_spans : list of tuples 
-       ref_spans  : list of tuples
+       ref_spans  : list of tuples or a dict of SpanIndex as returned by index_spans
     Returns:
        list of tuples. The list of aligned predicted spans
     """
+    ref_index = ref_spans if isinstance(ref_spans,dict) else index_spans(ref_spans)
     aspans = [ ]
     for pspan in pred_spans:
-        added = False
-        pstart,pend,*plabel = pspan        
-        for rspan in ref_spans:
-            rstart,rend,*rlabel = rspan
-            if plabel == rlabel:
-                ptoks = set(range(pstart,pend+1))
-                rtoks = set(range(rstart,rend+1))
-                if len(rtoks & ptoks) > alpha*len(rtoks) :
-                    aspans.append(rspan)
-        if not added:
-            aspans.append(pspan)
+        pstart,pend,*plabel = pspan
+        index = ref_index.get(tuple(plabel))
+        if index is not None:
+            aspans.extend(index.matches(pstart,pend,alpha))
+        aspans.append(pspan)
     return aspans
 
 
 
 
-def eval_dataset(pred_annotations,ref_annotations,labeled=True,alpha=0.5):
+def token_shape(annotations):
+    """
+    Returns the number of tokens of each paragraph of a document
+    Raises:
+        Exception if the tokens are missing
+    """
+    if 'tokens' not in annotations:
+        raise Exception('The annotations do not contain a "tokens" field ! aborting.')
+    if isinstance(annotations,Document):
+        return annotations.paragraph_lengths()
+    return [ len(paragraph) for paragraph in annotations['tokens'] ]
+
+
+def check_shape(pred,shape):
+    """
+    Checks that a predicted document has the given tokenization
+    Args:
+        pred  (dict): an annotation dict
+        shape (list): the number of tokens of each reference paragraph
+    Raises:
+        Exception if the tokens are missing or if the documents differ in length
+    """
+    pred_shape = token_shape(pred)
+    if len(pred_shape) != len(shape):
+        raise Exception('pred data length is different from test data length. Different number of paragraphs in a document. aborting')
+    if pred_shape != shape:
+        raise Exception('pred data length is different from test data length. Different number of tokens in a paragraph. aborting')
+
+
+def check_tokens(pred,ref):
+    """
+    Checks that a predicted document and a reference document have the same tokenization
+    Args:
+        pred (dict): an annotation dict
+        ref  (dict): an annotation dict
+    Raises:
+        Exception if the tokens are missing or if the documents differ in length
+    """
+    token_shape(pred)
+    check_shape(pred,token_shape(ref))
+
+
+def unlabel(items):
+    """
+    Drops the labels of labeled spans
+    Args:
+       items (set): labeled span (start,end,label) tuples
+    Returns:
+       set of unlabeled tuples
+    """
+    return { item[:2] for item in items }
+
+
+VIEWS = ('labeled','unlabeled')
+
+def document_views(pred,ref,views=VIEWS):
+    """
+    Extracts the spans and the rels of a pred/ref document pair. The
+    spans are decoded once and projected on each of the requested views.
+    Args:
+        pred (dict) : an annotation dict (possibly missing some keys)
+        ref  (dict) : an annotation dict (possibly missing some keys)
+        views (tuple): 'labeled' and/or 'unlabeled'
+    Returns:
+        dict. Maps each view to a (pred_spans,ref_spans,pred_rels,ref_rels)
+        tuple, the rels are None when missing from pred or ref.
+    """
+    check_tokens(pred,ref)
+    pred_spans = get_spans(pred)
+    ref_spans  = get_spans(ref)
+    has_rels   = 'rels' in pred and 'rels' in ref
+
+    result = { }
+    for view in views:
+        if view == 'labeled':
+            result[view] = (pred_spans,ref_spans,
+                            get_rels(pred) if has_rels else None,
+                            get_rels(ref) if has_rels else None)
+        elif view == 'unlabeled':
+            #rels are cheap to read again and keep the set order of get_rels
+            result[view] = (unlabel(pred_spans),unlabel(ref_spans),
+                            get_rels(pred,labeled=False) if has_rels else None,
+                            get_rels(ref,labeled=False) if has_rels else None)
+        else:
+            raise Exception(f'Unknown evaluation view {view}. aborting.')
+    return result
+
+
+#fixed point representation of float sums: any float64 is an integer multiple of 2**-1074
+FIXED_SHIFT = 1074
+
+def to_fixed(x):
+    """
+    Converts a float to an exact fixed point integer (units of 2**-1074)
+    """
+    num,den = float(x).as_integer_ratio()
+    return num << (FIXED_SHIFT - den.bit_length() + 1)
+
+
+class EvalState:
+    """
+    Evaluation counts accumulated over documents. Each entry is keyed
+    by a (view,key,mode) triple such as ('labeled','spans','relaxed') and
+    holds the number of documents, the total true positive, predicted
+    and reference counts (micro averages) and the sums of the per
+    document P, R and F (macro averages).
+
+    The sums are exact fixed point integers: the memory used does not
+    depend on the number of documents, and states computed on different
+    shards or processes merge to the very same result whatever the
+    merge order. States serialize to plain json with to_dict.
+
+    The per label breakdown, when requested, is accumulated in the labels
+    LabelState during the same pass.
+    """
+    FIELDS = ('docs','tp','pred','ref','p','r','f')
+
+    def __init__(self,counts=None,labels=None):
+        self.counts = counts if counts is not None else { }
+        self.labels = labels
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    def add(self,view,key,mode,tp,npred,nref):
+        """
+        Adds the match counts of a document
+        Args:
+           view,key,mode (str): e.g. 'labeled','spans','strict'
+           tp,npred,nref (int): number of correct, predicted and reference items
+        """
+        p,r,f = prf(tp,npred,nref)
+        entry = self.counts.setdefault((view,key,mode),[0]*len(self.FIELDS))
+        entry[0] += 1
+        entry[1] += tp
+        entry[2] += npred
+        entry[3] += nref
+        entry[4] += to_fixed(p)
+        entry[5] += to_fixed(r)
+        entry[6] += to_fixed(f)
+
+    def add_document(self,doc_counts):
+        """
+        Adds the counts of a document as returned by score_document
+        """
+        for (view,key,mode),counts in doc_counts.items():
+            self.add(view,key,mode,*counts)
+
+    def merge(self,other):
+        """
+        Merges another state into this one
+        Returns:
+           EvalState. self
+        """
+        for name,counts in other.counts.items():
+            entry = self.counts.setdefault(name,[0]*len(self.FIELDS))
+            for idx,count in enumerate(counts):
+                entry[idx] += count
+        if other.labels is not None:
+            if self.labels is None:
+                self.labels = LabelState()
+            self.labels.merge(other.labels)
+        return self
+
+    def to_dict(self):
+        data = { '/'.join(name):dict(zip(self.FIELDS,counts)) for name,counts in self.counts.items() }
+        if self.labels is not None:
+            data['labels'] = self.labels.to_dict()
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        labels = LabelState.from_dict(data['labels']) if 'labels' in data else None
+        return EvalState({ tuple(name.split('/')):[counts[field] for field in EvalState.FIELDS]
+                           for name,counts in data.items() if name != 'labels' },labels)
+
+    def scores(self,view,key,mode):
+        """
+        Returns:
+           a couple of (P,R,F) triples. The macro and the micro averages
+        """
+        docs,tp,npred,nref,p,r,f = self.counts[(view,key,mode)]
+        macro = tuple(total / (docs << FIXED_SHIFT) for total in (p,r,f))
+        return macro,prf(tp,npred,nref)
+
+    def results(self):
+        """
+        Returns:
+           dict. The evaluation results of each view
+        """
+        results = { }
+        for view,key,mode in self.counts:
+            (p,r,f),(mp,mr,mf) = self.scores(view,key,mode)
+            entry = results.setdefault(view,{ }).setdefault(key,{'micro':{ }})
+            entry[mode]          = {'p':p,'r':r,'f':f}
+            entry['micro'][mode] = {'p':mp,'r':mr,'f':mf}
+        return results
+
+
+class LabelState:
+    """
+    Per label evaluation counts accumulated over documents: the total
+    true positive, predicted and reference counts of each label, keyed
+    by ('spans'|'rels','strict'|'relaxed',label) triples, and the
+    confusion counts of the span labels, keyed by (ref_label,pred_label)
+    couples, over the predicted spans whose boundaries match a reference span.
+    """
+    FIELDS = ('tp','pred','ref')
+
+    def __init__(self,counts=None,confusion=None):
+        self.counts    = counts if counts is not None else { }
+        self.confusion = confusion if confusion is not None else { }
+
+    def add(self,key,mode,pred_items,ref_items):
+        """
+        Adds the labeled items of a document, as count_matches counts them
+        Args:
+           key,mode (str)        : e.g. 'spans','strict'
+           pred_items,ref_items  : labeled spans or rels, the label is the last field
+        """
+        if not isinstance(pred_items,(set,frozenset)):
+            pred_items = set(pred_items)
+        if not isinstance(ref_items,(set,frozenset)):
+            ref_items = set(ref_items)
+        for item in pred_items:
+            entry = self.counts.setdefault((key,mode,item[-1]),[0,0,0])
+            entry[1] += 1
+            if item in ref_items:
+                entry[0] += 1
+        for item in ref_items:
+            self.counts.setdefault((key,mode,item[-1]),[0,0,0])[2] += 1
+
+    def add_confusion(self,pred_spans,ref_spans):
+        """
+        Adds the label confusions of the predicted spans whose boundaries match a reference span
+        Args:
+           pred_spans,ref_spans : labeled (start,end,label) spans of a document
+        """
+        ref_labels = { }
+        for start,end,label in ref_spans:
+            ref_labels.setdefault((start,end),[ ]).append(label)
+        for start,end,label in pred_spans:
+            for ref_label in ref_labels.get((start,end),()):
+                self.confusion[(ref_label,label)] = self.confusion.get((ref_label,label),0) + 1
+
+    def merge(self,other):
+        """
+        Merges another state into this one
+        Returns:
+           LabelState. self
+        """
+        for name,counts in other.counts.items():
+            entry = self.counts.setdefault(name,[0,0,0])
+            for idx,count in enumerate(counts):
+                entry[idx] += count
+        for name,count in other.confusion.items():
+            self.confusion[name] = self.confusion.get(name,0) + count
+        return self
+
+    def to_dict(self):
+        return {'counts':[ [key,mode,label,*counts] for (key,mode,label),counts in self.counts.items() ],
+                'confusion':[ [ref_label,pred_label,count] for (ref_label,pred_label),count in self.confusion.items() ]}
+
+    @staticmethod
+    def from_dict(data):
+        return LabelState({ tuple(row[:3]):list(row[3:]) for row in data['counts'] },
+                          { tuple(row[:2]):row[2] for row in data['confusion'] })
+
+    def results(self):
+        """
+        Returns:
+           dict. Maps 'spans' and 'rels' to the micro averaged scores and
+           counts of each label and mode, and 'confusion' to the number of
+           predicted spans of each reference label and predicted label
+        """
+        results = {'spans':{ },'rels':{ },'confusion':{ }}
+        for (key,mode,label),(tp,npred,nref) in sorted(self.counts.items()):
+            p,r,f = prf(tp,npred,nref)
+            results[key].setdefault(label,{ })[mode] = {'p':p,'r':r,'f':f,'tp':tp,'pred':npred,'ref':nref}
+        for (ref_label,pred_label),count in sorted(self.confusion.items()):
+            results['confusion'].setdefault(ref_label,{ })[pred_label] = count
+        return results
+
+
+def index_reference(ref,views=VIEWS):
+    """
+    Preprocesses a reference document once for all: spans, rels and their
+    alignment indexes are computed for each view
+    Args:
+        ref  (dict)  : an annotation dict (possibly missing some keys)
+        views (tuple): 'labeled' and/or 'unlabeled'
+    Returns:
+        dict. The token shape of the document under the 'shape' key and,
+        under the 'views' key, a (spans,span_index,rels,rel_aligner) tuple
+        for each view. The rels and the aligner are None when rels are missing
+    """
+    shape = token_shape(ref)
+    spans = get_spans(ref)
+    gold  = {'shape':shape,'views':{ }}
+    for view in views:
+        if view not in VIEWS:
+            raise Exception(f'Unknown evaluation view {view}. aborting.')
+        ref_spans = spans if view == 'labeled' else unlabel(spans)
+        ref_rels  = get_rels(ref,labeled=view == 'labeled') if 'rels' in ref else None
+        gold['views'][view] = (ref_spans,index_spans(ref_spans),
+                               ref_rels,None if ref_rels is None else RelAligner(ref_rels))
+    return gold
+
+
+def score_reference(pred,gold,alpha=0.5,views=VIEWS,laps=None,labels=None):
+    """
+    Scores a predicted document against a preprocessed reference document
+    Args:
+        pred (dict)  : an annotation dict (possibly missing some keys)
+        gold (dict)  : a reference document as returned by index_reference
+        alpha (float): threshold for approximative span matching
+        views (tuple): 'labeled' and/or 'unlabeled', a subset of the gold views
+        laps (Laps)  : profiling laps of the document, if started by the caller
+        labels (LabelState): per label counts of the labeled view, updated in place if given
+    Returns:
+        dict. Maps (view,'spans'|'rels','strict'|'relaxed') triples to
+        (tp,npred,nref) counts. Rels are missing when they are missing
+        from pred or ref
+    """
+    laps = laps or profiling.laps()
+    check_shape(pred,gold['shape'])
+    spans  = get_spans(pred)
+    laps.lap('decode')
+    counts = { }
+    for view in views:
+        ref_spans,ref_index,ref_rels,aligner = gold['views'][view]
+        pred_spans = spans if view == 'labeled' else unlabel(spans)
+        aligned_pred_spans = align_spans(pred_spans,ref_index,alpha)
+        laps.lap('align_spans')
+        counts[(view,'spans','strict')]  = count_matches(pred_spans,ref_spans)
+        counts[(view,'spans','relaxed')] = count_matches(aligned_pred_spans,ref_spans)
+        if labels is not None and view == 'labeled':
+            labels.add('spans','strict',pred_spans,ref_spans)
+            labels.add('spans','relaxed',aligned_pred_spans,ref_spans)
+            labels.add_confusion(pred_spans,ref_spans)
+        laps.lap('count')
+        if ref_rels is not None and 'rels' in pred:
+            pred_rels = get_rels(pred,labeled=view == 'labeled')
+            aligned_pred_rels = align_rels(pred_rels,aligner,alpha)
+            laps.lap('align_rels')
+            counts[(view,'rels','strict')]  = count_matches(pred_rels,ref_rels)
+            counts[(view,'rels','relaxed')] = count_matches(aligned_pred_rels,ref_rels)
+            if labels is not None and view == 'labeled':
+                labels.add('rels','strict',pred_rels,ref_rels)
+                labels.add('rels','relaxed',aligned_pred_rels,ref_rels)
+            laps.lap('count')
+    if profiling.STATS is not None:
+        count_events(profiling.STATS,counts,views[0])
+    laps.done()
+    return counts
+
+
+def count_events(stats,counts,view):
+    """
+    Adds the item and match counts of a scored document to profiling stats
+    Args:
+        stats (Stats) : profiling stats
+        counts (dict) : as returned by score_reference
+        view (str)    : the view whose item counts are reported
+    """
+    for (cview,key,mode),(tp,npred,nref) in counts.items():
+        stats.count(f'{mode}_matches',tp)
+        if cview == view and mode == 'strict':
+            stats.count(f'pred_{key}',npred)
+            stats.count(f'ref_{key}',nref)
+
+
+def score_document(pred,ref,alpha=0.5,views=VIEWS,labels=None):
+    """
+    Scores a pred/ref document pair
+    Args:
+        pred (dict)  : an annotation dict (possibly missing some keys)
+        ref  (dict)  : an annotation dict (possibly missing some keys)
+        alpha (float): threshold for approximative span matching
+        views (tuple): 'labeled' and/or 'unlabeled'
+        labels (LabelState): per label counts, updated in place if given
+    Returns:
+        dict. Maps (view,'spans'|'rels','strict'|'relaxed') triples to
+        (tp,npred,nref) counts. Rels are missing when they are missing
+        from pred or ref
+    """
+    laps = profiling.laps()
+    token_shape(pred)
+    gold = index_reference(ref,views)
+    laps.lap('index_reference')
+    return score_reference(pred,gold,alpha,views,laps,labels)
+
+
+def eval_chunk(chunk,alpha=0.5,views=VIEWS,breakdown=False):
+    """
+    Evaluates a list of (pred,ref) document pairs
+    Returns:
+        EvalState
+    """
+    state = EvalState(labels=LabelState() if breakdown else None)
+    for pred,ref in chunk:
+        state.add_document(score_document(pred,ref,alpha,views,state.labels))
+    return state
+
+
+def check_breakdown(views,backend='python'):
+    """
+    Raises:
+        Exception if the per label breakdown cannot be computed
+    """
+    if 'labeled' not in views:
+        raise Exception('The per label breakdown requires the labeled view. aborting.')
+    if backend != 'python':
+        raise Exception('The per label breakdown requires the python backend. aborting.')
+
+
+def map_chunks(func,pred_annotations,ref_annotations,jobs=1,chunk_size=64):
+    """
+    Applies a function to chunks of pred/ref document pairs. With
+    several jobs, the chunks are sharded across a process pool. At most
+    2*jobs chunks are in flight, so that streamed inputs are not read
+    ahead of the workers.
+    Args:
+        func (callable)        : a picklable function of a list of (pred,ref) pairs
+        pred_annotations (list): predicted documents
+        ref_annotations (list) : reference documents
+        jobs (int)             : number of processes, 0 or less uses all cores
+        chunk_size (int)       : number of documents sent at once to a process
+    Yields:
+        the results of each chunk, in document order
+    """
+    pairs  = zip(pred_annotations,ref_annotations)
+    chunks = iter(lambda:list(islice(pairs,chunk_size)),[ ])
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count()
+    if jobs == 1:
+        for chunk in chunks:
+            yield func(chunk)
+        return
+
+    import multiprocessing
+    #workers are forked when possible: they share the hash seed of the parent and
+    #iterate over label sets in the same order, which keeps tie breaking identical
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    stats = profiling.STATS
+    if stats is not None:
+        #workers gather their own stats, merged as the chunks complete
+        offset = stats.doc_offset
+        def submit(chunk):
+            nonlocal offset
+            offset += len(chunk)
+            return pool.apply_async(profiling.profiled_call,(func,stats.slow,offset-len(chunk),chunk))
+        def collect(pending):
+            result,chunk_stats = pending.get()
+            stats.merge(chunk_stats)
+            return result
+    else:
+        submit  = lambda chunk: pool.apply_async(func,(chunk,))
+        collect = lambda pending: pending.get()
+    with context.Pool(jobs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(submit(chunk))
+            if len(pending) >= 2*jobs:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+
+
+def eval_state(pred_annotations,ref_annotations,alpha=0.5,views=VIEWS,backend='python',jobs=1,breakdown=False):
+    """
+    Accumulates the evaluation counts of several views of the given
+    annotations dictionaries in a single pass over the data.
+    At least tokens with BIO annotations are expected in all cases.
+    Args:
+        pred_annotations (dict): an annotation dict (possibly missing some keys)
+        ref_annotations (dict) : an annotation dict (possibly missing some keys)
+        alpha (float)          : threshold for approximative span matching
+        views (tuple)          : 'labeled' and/or 'unlabeled'
+        backend (str)          : 'python' or 'numpy' (vectorized scoring, requires numpy)
+        jobs (int)             : number of processes for the python backend, 0 or less uses all cores
+        breakdown (bool)       : whether the per label counts are accumulated too (python backend)
+    Returns:
+        EvalState
+    """
+    if breakdown:
+        check_breakdown(views,backend)
+    if backend == 'numpy':
+        from evaluate_numpy import eval_state_numpy
+        if profiling.STATS is not None:
+            with profiling.STATS.timer('score (numpy)'):
+                return eval_state_numpy(pred_annotations,ref_annotations,alpha=alpha,views=views)
+        return eval_state_numpy(pred_annotations,ref_annotations,alpha=alpha,views=views)
+    elif backend != 'python':
+        raise Exception(f'Unknown evaluation backend {backend}. aborting.')
+
+    state = EvalState()
+    for chunk_state in map_chunks(partial(eval_chunk,alpha=alpha,views=views,breakdown=breakdown),pred_annotations,ref_annotations,jobs=jobs):
+        state.merge(chunk_state)
+    return state
+
+
+def eval_views(pred_annotations,ref_annotations,alpha=0.5,views=VIEWS,backend='python',jobs=1,breakdown=False):
+    """
+    Performs spans and relation evaluations for several views of the
+    given annotations dictionaries in a single pass over the data.
+    At least tokens with BIO annotations are expected in all cases.
+    Args:
+        pred_annotations (dict): an annotation dict (possibly missing some keys)
+        ref_annotations (dict) : an annotation dict (possibly missing some keys)
+        alpha (float)          : threshold for approximative span matching
+        views (tuple)          : 'labeled' and/or 'unlabeled'
+        backend (str)          : 'python' or 'numpy' (vectorized scoring, requires numpy)
+        jobs (int)             : number of processes for the python backend, 0 or less uses all cores
+        breakdown (bool)       : whether the per label scores and the span label confusions are
+                                 computed too, under the 'breakdown' key (see LabelState.results)
+    Returns dict mapping each view to its evaluation results (macro averages, and micro averages under the 'micro' key)
+    Raises:
+        Exception if there is no document to evaluate
+    """
+    state = eval_state(pred_annotations,ref_annotations,alpha=alpha,views=views,backend=backend,jobs=jobs,breakdown=breakdown)
+    if not state:
+        raise Exception('No document to evaluate. aborting.')
+    results = state.results()
+    if breakdown:
+        results['breakdown'] = state.labels.results()
+    return results
+
+
+def eval_dataset(pred_annotations,ref_annotations,labeled=True,alpha=0.5,backend='python',jobs=1):
     """
     Performs spans and relation evaluations for the given annotations dictionaries.
     At least tokens with BIO annotations are expected in all cases.
@@ -173,60 +852,204 @@ def eval_dataset(pred_annotations,ref_annotations,labeled=True,alpha=0.5):
         ref_annotations (dict) : an annotation dict (possibly missing some keys)
         labeled (bool)          : wether span labels are taken into account
         alpha (float)          : threshold for approximative span matching
+        backend (str)          : 'python' or 'numpy' (vectorized scoring, requires numpy)
+        jobs (int)             : number of processes for the python backend, 0 or less uses all cores
     Returns dict with evaluation results
     """
-    def avg_metric(score_list):
-        p = 0
-        r = 0
-        f = 0
-        N = len(score_list)
-        for x,y,z in score_list:
-            p += x
-            r += y
-            f += z
-        return p/N,r/N,f/N
-
-    strict_span_scores  = [ ]
-    aligned_span_scores = [ ]
-    strict_rel_scores   = [ ]
-    aligned_rel_scores  = [ ]
-
-    for pred,ref in zip(pred_annotations,ref_annotations):
-                    
-        if 'tokens' in pred and 'tokens' in ref:
-            if len(pred['tokens']) != len(ref['tokens']):
-                raise Exception('pred data length is different from test data length. Different number of paragraphs in a document. aborting')
-            else:
-                for paragA,paragB in zip(pred['tokens'],ref['tokens']):
-                    if len(paragA) != len(paragB):
-                        raise Exception('pred data length is different from test data length. Different number of tokens in a paragraph. aborting')
-
-            pred_spans         = get_spans(pred,labeled)
-            ref_spans          = get_spans(ref,labeled)
-            aligned_pred_spans = align_spans(pred_spans,ref_spans,alpha)
-            strict_span_scores.append( eval_spans(pred_spans,ref_spans) )
-            aligned_span_scores.append( eval_spans(aligned_pred_spans,ref_spans) )
-            if 'rels' in pred and 'rels' in ref:
-                pred_rels = get_rels(pred,labeled)
-                ref_rels  = get_rels(ref,labeled)
-                aligned_pred_rels = align_rels(pred_rels,ref_rels,alpha)
-                strict_rel_scores.append( eval_rels(pred_rels,ref_rels) )
-                aligned_rel_scores.append( eval_rels(aligned_pred_rels,ref_rels) )
-                
-        else:
-            raise Exception('The annotations do not contain a "tokens" field ! aborting.')
-    sp,sr,sf    = avg_metric(strict_span_scores)
-    asp,asr,asf = avg_metric(aligned_span_scores)
-    if strict_rel_scores:
-        rp,rr,rf    = avg_metric(strict_rel_scores)
-        arp,arr,arf = avg_metric(aligned_rel_scores)
-        return {"spans":{'strict': {'p':sp,'r':sr,'f':sf},'relaxed':{'p':asp,'r':asr,'f':asf}},
-                "rels":{'strict': {'p':rp,'r':rr,'f':rf},'relaxed':{'p':arp,'r':arr,'f':arf}}}
+    view = 'labeled' if labeled else 'unlabeled'
+    return eval_views(pred_annotations,ref_annotations,alpha=alpha,views=(view,),backend=backend,jobs=jobs)[view]
+
+
+class Evaluator:
+    """
+    Evaluates predictions against a fixed reference set, e.g. the dev set
+    during training. The reference documents are preprocessed and indexed
+    once (spans, rels and alignment indexes), so that each evaluation only
+    processes the predictions.
+    """
+    def __init__(self,ref_annotations,views=VIEWS):
+        """
+        Args:
+            ref_annotations (list): the reference documents
+            views (tuple)         : 'labeled' and/or 'unlabeled'
+        """
+        self.views = views
+        self.golds = [ index_reference(ref,views) for ref in ref_annotations ]
+
+    def __len__(self):
+        return len(self.golds)
+
+    def state(self,pred_annotations,alpha=0.5,breakdown=False):
+        """
+        Accumulates the evaluation counts of the predictions
+        Args:
+            pred_annotations (list): the predicted documents, in reference order
+            alpha (float)          : threshold for approximative span matching
+            breakdown (bool)       : whether the per label counts are accumulated too
+        Returns:
+            EvalState
+        """
+        if breakdown:
+            check_breakdown(self.views)
+        state = EvalState(labels=LabelState() if breakdown else None)
+        for pred,gold in zip(pred_annotations,self.golds):
+            state.add_document(score_reference(pred,gold,alpha,self.views,labels=state.labels))
+        return state
+
+    def evaluate(self,pred_annotations,alpha=0.5,breakdown=False):
+        """
+        Evaluates the predictions
+        Args:
+            pred_annotations (list): the predicted documents, in reference order
+            alpha (float)          : threshold for approximative span matching
+            breakdown (bool)       : whether the per label results are computed too (see eval_views)
+        Returns:
+            dict mapping each view to its evaluation results
+        Raises:
+            Exception if there is no document to evaluate
+        """
+        state = self.state(pred_annotations,alpha,breakdown)
+        if not state:
+            raise Exception('No document to evaluate. aborting.')
+        results = state.results()
+        if breakdown:
+            results['breakdown'] = state.labels.results()
+        return results
+
+
+ALPHA_SWEEP = (0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1.0)
+
+def sweep_document(pred_spans,ref_spans,pred_rels,ref_rels,alphas):
+    """
+    Scores a document for several alpha thresholds. The overlap of
+    each candidate pred/ref pair is computed once and every threshold
+    is derived from the stored overlaps.
+    Args:
+       pred_spans,ref_spans (set) : span tuples
+       pred_rels,ref_rels   (set) : rel tuples or None
+       alphas (list)              : non negative thresholds for approximative span matching
+    Returns:
+       dict. Maps ('spans'|'rels','strict'|'relaxed') to (tp,npred,nref)
+       counts for strict scores and to a list of counts (one per alpha)
+       for relaxed scores. Rels keys are missing when rels are None
+    """
+    counts = {('spans','strict'):count_matches(pred_spans,ref_spans)}
+
+    ref_index  = index_spans(ref_spans)
+    candidates = [ ]
+    for pstart,pend,*plabel in pred_spans:
+        index = ref_index.get(tuple(plabel))
+        if index is not None:
+            candidates.extend((span,overlap,span[1]-span[0]+1) for span,overlap in index.overlapping(pstart,pend))
+    counts[('spans','relaxed')] = [ ]
+    for alpha in alphas:
+        matched = { span for span,overlap,length in candidates if overlap > alpha*length }
+        counts[('spans','relaxed')].append( count_matches(set(pred_spans) | matched,ref_spans) )
+
+    if pred_rels is not None:
+        counts[('rels','strict')] = count_matches(pred_rels,ref_rels)
+        aligner = RelAligner(ref_rels)
+        src_candidates = {psrc:aligner.candidates(psrc,aligner.src_index,aligner.src_rank) for psrc,*_ in pred_rels}
+        tgt_candidates = {ptgt:aligner.candidates(ptgt,aligner.tgt_index,aligner.tgt_rank) for _,ptgt,*_ in pred_rels}
+        counts[('rels','relaxed')] = [ ]
+        for alpha in alphas:
+            def resolve(pspan,candidates):
+                return next((span for span,overlap,length in candidates[pspan] if overlap > alpha*length),pspan)
+            src = {psrc:resolve(psrc,src_candidates) for psrc in src_candidates}
+            tgt = {ptgt:resolve(ptgt,tgt_candidates) for ptgt in tgt_candidates}
+            arels = { (src[psrc],tgt[ptgt],*plabel) for psrc,ptgt,*plabel in pred_rels }
+            counts[('rels','relaxed')].append( count_matches(arels,ref_rels) )
+    return counts
+
+
+def sweep_chunk(chunk,alphas=ALPHA_SWEEP,views=VIEWS):
+    """
+    Evaluates a list of (pred,ref) document pairs for several alpha thresholds
+    Returns:
+        dict. Maps each alpha to an EvalState
+    """
+    states = {alpha:EvalState() for alpha in alphas}
+    for pred,ref in chunk:
+        for view,(pred_spans,ref_spans,pred_rels,ref_rels) in document_views(pred,ref,views).items():
+            counts = sweep_document(pred_spans,ref_spans,pred_rels,ref_rels,alphas)
+            for key in ('spans','rels'):
+                if (key,'strict') in counts:
+                    for alpha,relaxed in zip(alphas,counts[(key,'relaxed')]):
+                        states[alpha].add(view,key,'strict',*counts[(key,'strict')])
+                        states[alpha].add(view,key,'relaxed',*relaxed)
+    return states
+
+
+def eval_sweep(pred_annotations,ref_annotations,alphas=ALPHA_SWEEP,views=VIEWS,backend='python',jobs=1):
+    """
+    Performs spans and relation evaluations for several alpha
+    thresholds in a single pass over the data.
+    Args:
+        pred_annotations (dict): an annotation dict (possibly missing some keys)
+        ref_annotations (dict) : an annotation dict (possibly missing some keys)
+        alphas (list)          : non negative thresholds for approximative span matching
+        views (tuple)          : 'labeled' and/or 'unlabeled'
+        backend (str)          : 'python' or 'numpy' (vectorized scoring, requires numpy)
+        jobs (int)             : number of processes for the python backend, 0 or less uses all cores
+    Returns dict mapping each alpha to a dict mapping each view to its evaluation results
+    """
+    if any(alpha < 0 for alpha in alphas):
+        raise Exception('alpha sweep values must be non negative. aborting.')
+
+    if backend == 'numpy':
+        from evaluate_numpy import eval_sweep_numpy
+        states = eval_sweep_numpy(pred_annotations,ref_annotations,alphas=alphas,views=views)
+    elif backend == 'python':
+        states = {alpha:EvalState() for alpha in alphas}
+        for chunk_states in map_chunks(partial(sweep_chunk,alphas=alphas,views=views),pred_annotations,ref_annotations,jobs=jobs):
+            for alpha,state in chunk_states.items():
+                states[alpha].merge(state)
     else:
-        return {"spans":{'strict': {'p':sp,'r':sr,'f':sf},'relaxed':{'p':asp,'r':asr,'f':asf}}}
+        raise Exception(f'Unknown evaluation backend {backend}. aborting.')
+    if not any(states.values()):
+        raise Exception('No document to evaluate. aborting.')
+    return {alpha:state.results() for alpha,state in states.items()}
+
+
+def display_sweep(results):
+    """
+    Prints on stdout a table of the relaxed scores for each alpha value
+    Args:
+        results (dict): the results of eval_sweep
+    """
+    columns = [ (key,view) for key in ('spans','rels') for view in VIEWS
+                if all(key in result.get(view,{}) for result in results.values()) ]
+    print('\t'.join(['alpha'] + [ f'{key}({view}) {metric}' for key,view in columns for metric in 'PRF' ]))
+    for alpha,result in results.items():
+        scores = [ result[view][key]['relaxed'][metric] for key,view in columns for metric in 'prf' ]
+        print('\t'.join([str(alpha)] + [ f'{score:.4f}' for score in scores ]))
 
 
-def display_eval(pred_annotations,ref_annotations,alpha=0.5):
+def display_breakdown(breakdown):
+    """
+    Prints on stdout the per label scores and the span label confusion matrix
+    Args:
+        breakdown (dict): as returned by LabelState.results
+    """
+    for key,title in (('spans','SPANS'),('rels','RELATIONS')):
+        if not breakdown[key]:
+            continue
+        print(f'\n*** {title} BY LABEL (micro averages) ***')
+        print('\t'.join(['label'] + [ f'{mode} {metric}' for mode in ('strict','relaxed') for metric in 'PRF' ] + ['pred','ref']))
+        for label,modes in breakdown[key].items():
+            scores = [ f"{modes[mode][metric]:.4f}" for mode in ('strict','relaxed') for metric in 'prf' ]
+            print('\t'.join([label] + scores + [str(modes['strict']['pred']),str(modes['strict']['ref'])]))
+
+    confusion = breakdown['confusion']
+    labels    = sorted(set(confusion) | { label for row in confusion.values() for label in row })
+    print('\n*** SPAN LABEL CONFUSIONS (matched boundaries, reference x predicted) ***')
+    print('\t'.join(['ref\\pred'] + labels))
+    for ref_label in labels:
+        row = confusion.get(ref_label,{ })
+        print('\t'.join([ref_label] + [ str(row.get(pred_label,0)) for pred_label in labels ]))
+
+
+def display_eval(pred_annotations,ref_annotations,alpha=0.5,backend='python',jobs=1):
     """
     Prints on stdout the results of all the possible evaluations for the given annotations dictionaries.
     At least tokens with BIO annotations are expected in all cases.
@@ -234,9 +1057,21 @@ def display_eval(pred_annotations,ref_annotations,alpha=0.5):
         pred_annotations (dict): an annotation dict (possibly missing some keys)
         ref_annotations (dict): an annotation dict (possibly missing some keys)
         alpha (float) : threshold of common tokens for approximative matching of spans 
+        backend (str) : 'python' or 'numpy'
+        jobs (int)    : number of processes for the python backend
+    """
+    display_results(eval_views(pred_annotations,ref_annotations,alpha=alpha,backend=backend,jobs=jobs),alpha)
+
+
+def display_results(results,alpha=0.5):
+    """
+    Prints on stdout evaluation results, as returned by eval_views for both views
+    Args:
+        results (dict): maps 'labeled' and 'unlabeled' to their results
+        alpha (float) : threshold used for the relaxed evaluation
     """
-    ulabeled = eval_dataset(pred_annotations,ref_annotations,labeled=False,alpha=alpha)
-    labeled  = eval_dataset(pred_annotations,ref_annotations,labeled=True,alpha=alpha)
+    ulabeled = results['unlabeled']
+    labeled  = results['labeled']
     
     print(f"""
 
@@ -246,20 +1081,24 @@ def display_eval(pred_annotations,ref_annotations,alpha=0.5):
       Precision : {ulabeled['spans']['strict']['p']} 
       Recall    : {ulabeled['spans']['strict']['r']}
       F-score   : {ulabeled['spans']['strict']['f']}
+      Micro P/R/F : {ulabeled['spans']['micro']['strict']['p']} / {ulabeled['spans']['micro']['strict']['r']} / {ulabeled['spans']['micro']['strict']['f']}
     > Argument mining spans (labeled)
       Precision : {labeled['spans']['strict']['p']} 
       Recall    : {labeled['spans']['strict']['r']} 
       F-score   : {labeled['spans']['strict']['f']}
+      Micro P/R/F : {labeled['spans']['micro']['strict']['p']} / {labeled['spans']['micro']['strict']['r']} / {labeled['spans']['micro']['strict']['f']}
 
     RELAXED EVALUATION (\u03B1 = {alpha})
     > Argument mining spans (unlabeled)
       Precision : {ulabeled['spans']['relaxed']['p']} 
       Recall    : {ulabeled['spans']['relaxed']['r']}
       F-score   : {ulabeled['spans']['relaxed']['f']}
+      Micro P/R/F : {ulabeled['spans']['micro']['relaxed']['p']} / {ulabeled['spans']['micro']['relaxed']['r']} / {ulabeled['spans']['micro']['relaxed']['f']}
     > Argument mining spans (labeled)
       Precision : {labeled['spans']['relaxed']['p']} 
       Recall    : {labeled['spans']['relaxed']['r']} 
       F-score   : {labeled['spans']['relaxed']['f']}
+      Micro P/R/F : {labeled['spans']['micro']['relaxed']['p']} / {labeled['spans']['micro']['relaxed']['r']} / {labeled['spans']['micro']['relaxed']['f']}
 """)
 
     if 'rels' in labeled and 'rels' in ulabeled:
@@ -271,20 +1110,24 @@ def display_eval(pred_annotations,ref_annotations,alpha=0.5):
       Precision : {ulabeled['rels']['strict']['p']} 
       Recall    : {ulabeled['rels']['strict']['r']}
       F-score   : {ulabeled['rels']['strict']['f']}
+      Micro P/R/F : {ulabeled['rels']['micro']['strict']['p']} / {ulabeled['rels']['micro']['strict']['r']} / {ulabeled['rels']['micro']['strict']['f']}
     > Argument mining spans (labeled)
       Precision : {labeled['rels']['strict']['p']} 
       Recall    : {labeled['rels']['strict']['r']} 
       F-score   : {labeled['rels']['strict']['f']}
+      Micro P/R/F : {labeled['rels']['micro']['strict']['p']} / {labeled['rels']['micro']['strict']['r']} / {labeled['rels']['micro']['strict']['f']}
 
     RELAXED EVALUATION (\u03B1 = {alpha})
     > Argument mining spans (unlabeled)
       Precision : {ulabeled['rels']['relaxed']['p']} 
       Recall    : {ulabeled['rels']['relaxed']['r']}
       F-score   : {ulabeled['rels']['relaxed']['f']}
+      Micro P/R/F : {ulabeled['rels']['micro']['relaxed']['p']} / {ulabeled['rels']['micro']['relaxed']['r']} / {ulabeled['rels']['micro']['relaxed']['f']}
     > Argument mining spans (labeled)
       Precision : {labeled['rels']['relaxed']['p']} 
       Recall    : {labeled['rels']['relaxed']['r']} 
       F-score   : {labeled['rels']['relaxed']['f']}
+      Micro P/R/F : {labeled['rels']['micro']['relaxed']['p']} / {labeled['rels']['micro']['relaxed']['r']} / {labeled['rels']['micro']['relaxed']['f']}
 """)       
 
 
@@ -292,6 +1135,7 @@ def display_eval(pred_annotations,ref_annotations,alpha=0.5):
 if __name__ == '__main__':
     import argparse
     import json
+    from dataset_io import iter_documents,load_dataset,parse_selection,select_documents
     parser = argparse.ArgumentParser(
                     prog='python evaluate.py [pred_file] [test_file]',
                     description='Computes evaluation metrics for argument mining tasks.')
@@ -299,21 +1143,70 @@ if __name__ == '__main__':
     parser.add_argument('pred_file')
     parser.add_argument('ref_file')
     parser.add_argument('--alpha',default=0.5,type=float)
+    parser.add_argument('--backend',default='python',choices=['python','numpy'],help="numpy vectorizes the scoring over all the documents")
+    parser.add_argument('--alpha-sweep',nargs='*',type=float,default=None,help="relaxed evaluation for several alpha values (default 0.1 ... 1.0)")
+    parser.add_argument('--json',action='store_true',help="outputs the alpha sweep, breakdown or comparison results in json format rather than as a table")
+    parser.add_argument('--breakdown',action='store_true',help="adds the per label scores and the span label confusion matrix, computed in the same pass")
+    parser.add_argument('--stream',action='store_true',help="reads and scores the documents one at a time (json or json-lines files)")
+    parser.add_argument('--jobs',default=1,type=int,help="number of processes scoring the documents (0 uses all cores)")
+    parser.add_argument('--doc',default=None,type=int,help="evaluates a single document, read from the file offset index (the offsets are recorded in a <file>.idx sidecar on first use)")
+    parser.add_argument('--range',default=None,metavar='A:B',help="evaluates the documents A to B (excluded), read from the file offset index")
+    parser.add_argument('--compare',default=None,metavar='PRED_FILE_B',help="paired bootstrap significance test of a second prediction file against pred_file")
+    parser.add_argument('--samples',default=10000,type=int,help="number of bootstrap resamples for --compare")
+    parser.add_argument('--seed',default=0,type=int,help="random seed for --compare")
+    parser.add_argument('--profile',nargs='?',const=0,default=None,type=int,metavar='N',help="prints stage timings and counters on stderr, with the N slowest documents")
     #parser.add_argument('--tsv',help="outputs the evaluation results in tsv format rather than by pretty printing")
     args = parser.parse_args()
 
-    with open(args.pred_file) as preds_in:
-        with open(args.ref_file) as ref_in:
-
-            preds = json.loads(preds_in.read())
-            refs = json.loads(ref_in.read())
-            
-            try:
-                display_eval(preds,refs,alpha=args.alpha)
-            except Exception as e:
-                print('[error]',e)
-
-            
+    stats = profiling.enable(args.profile) if args.profile is not None else None
+    selection = parse_selection(args.doc,args.range)
+    if stats is not None and selection is not None and (selection.start or 0) >= 0:
+        stats.doc_offset = selection.start or 0
+    if args.stream and selection is None:
+        preds = iter_documents(args.pred_file)
+        refs  = iter_documents(args.ref_file)
+        if stats is not None:
+            preds,refs = stats.timed('parse',preds),stats.timed('parse',refs)
+    else:
+        read = load_dataset if selection is None else partial(select_documents,selection=selection)
+        if stats is not None:
+            with stats.timer('parse'):
+                preds,refs = read(args.pred_file),read(args.ref_file)
+        else:
+            preds,refs = read(args.pred_file),read(args.ref_file)
 
-    
-    
+    try:
+        if args.compare is not None and args.backend != 'python':
+            raise Exception('--compare scores the documents with the python backend only. aborting.')
+        if args.alpha_sweep is not None and args.breakdown:
+            raise Exception('--breakdown is not available with --alpha-sweep. aborting.')
+        if args.compare is not None:
+            from significance import compare_systems,display_comparison
+            if selection is not None:
+                preds_b = select_documents(args.compare,selection)
+            else:
+                preds_b = iter_documents(args.compare) if args.stream else load_dataset(args.compare)
+            results = compare_systems(preds,preds_b,refs,alpha=args.alpha,samples=args.samples,seed=args.seed,jobs=args.jobs)
+            if args.json:
+                print(json.dumps(results,indent=2))
+            else:
+                display_comparison(results)
+        elif args.alpha_sweep is not None:
+            results = eval_sweep(preds,refs,alphas=args.alpha_sweep or ALPHA_SWEEP,backend=args.backend,jobs=args.jobs)
+            if args.json:
+                print(json.dumps({str(alpha):result for alpha,result in results.items()},indent=2))
+            else:
+                display_sweep(results)
+        elif args.breakdown:
+            results = eval_views(preds,refs,alpha=args.alpha,backend=args.backend,jobs=args.jobs,breakdown=True)
+            if args.json:
+                print(json.dumps(results,indent=2))
+            else:
+                display_results(results,args.alpha)
+                display_breakdown(results['breakdown'])
+        else:
+            display_eval(preds,refs,alpha=args.alpha,backend=args.backend,jobs=args.jobs)
+    except Exception as e:
+        print('[error]',e)
+    if stats is not None:
+        stats.report()
@@ -0,0 +1,612 @@
+#Vectorized NumPy backend for evaluate.eval_dataset.
+#The spans and relations of all the documents are packed into flat arrays, straight
+#from the document fields or document.Document arrays, and scored in batch into an
+#evaluate.EvalState. Results are the same as the pure python path.
+
+from array import array
+from collections import defaultdict
+from itertools import accumulate
+from operator import itemgetter
+
+import numpy as np
+
+from bio import decode_numpy,tag_table
+from document import Document
+from evaluate import FIXED_SHIFT,VIEWS,EvalState,check_shape,token_shape
+
+
+SPAN_DTYPE = np.dtype([('doc',np.int64),('start',np.int64),('end',np.int64),('label',np.int64)])
+REL_DTYPE  = np.dtype([('doc',np.int64),('src_start',np.int64),('src_end',np.int64),
+                       ('tgt_start',np.int64),('tgt_end',np.int64),('label',np.int64),('rank',np.int64)])
+
+
+START,END,NAME,IDX,ARG,SRC,TGT = map(itemgetter,('start','end','name','idx','arg','src','tgt'))
+FIRST,LAST = itemgetter(0),itemgetter(1)
+
+def append_bytes(column,values):
+    """
+    Appends the items of a buffer (python array or memoryview) of the same item type to an array
+    """
+    column.frombytes(memoryview(values).cast('B'))
+
+
+def id_dict():
+    """
+    Returns:
+       dict interning names as ids: a missing name gets the next id
+    """
+    ids = defaultdict()
+    ids.default_factory = ids.__len__
+    return ids
+
+
+class ColumnPacker:
+    """
+    Gathers the span and relation columns of documents into flat arrays,
+    without building any span or relation tuple. The arrays of a
+    document.Document are copied as they are, annotation dicts are read
+    field by field. The documents without a 'spans' field are decoded from
+    their BIO tags all at once. Label and tag names get ids shared by all the
+    packers built on the same dicts.
+    """
+    def __init__(self,labels,tags):
+        """
+        Args:
+           labels (dict) : maps label names to label ids, updated in place (see id_dict)
+           tags   (dict) : maps BIO tag names to tag ids, updated in place
+        """
+        self.labels,self.tags = labels,tags
+        self.vocabs = { }       #maps the Vocabs of Documents to their slot, slot 0 is for dicts
+        self.spans  = (array('q'),array('q'),array('i'))                        #start,end,label
+        self.tokens = (array('q'),array('i'))                                   #idx,tag of the tokens to decode
+        self.parags = array('q')                                                #end offsets of the paragraphs to decode
+        self.rels   = (array('q'),array('q'),array('q'),array('q'),array('i'))  #src_start,src_end,tgt_start,tgt_end,label
+        #vocabulary slot and number of spans, of tokens and of paragraphs to decode of each document
+        self.docs   = array('q')
+        #vocabulary slot and number of relations of each document with relations
+        self.rel_docs = array('q')
+
+    def __len__(self):
+        return len(self.docs) // 4
+
+    def add(self,document):
+        """
+        Adds the spans of a document (annotation dict or document.Document)
+        Returns:
+           the paragraph offsets of a Document, the number of tokens of
+           each paragraph of an annotation dict (see evaluate.token_shape)
+        """
+        if isinstance(document,Document):
+            slot  = self.vocabs.setdefault(document.vocabs,len(self.vocabs)+1)
+            shape = document.parag_offsets
+            copy  = array.extend if type(document.token_idx) is array else append_bytes
+            if 'spans' in document:
+                for column,values in zip(self.spans,(document.span_start,document.span_end,document.span_label)):
+                    copy(column,values)
+                self.docs.extend((slot,len(document.span_start),0,0))
+            else:
+                copy(self.tokens[0],document.token_idx)
+                copy(self.tokens[1],document.token_tag)
+                append_bytes(self.parags,memoryview(shape)[1:])
+                self.docs.extend((slot,0,len(document),len(shape)-1))
+            return shape
+
+        shape = token_shape(document)
+        if 'spans' in document:
+            spans = document['spans']
+            starts,ends,labels = self.spans
+            starts.extend(map(START,spans))
+            ends.extend(map(END,spans))
+            labels.extend(map(self.labels.__getitem__,map(NAME,spans)))
+            self.docs.extend((0,len(spans),0,0))
+        else:
+            tokens = [ token for paragraph in document['tokens'] for token in paragraph ]
+            self.tokens[0].extend(map(IDX,tokens))
+            self.tokens[1].extend(map(self.tags.__getitem__,map(ARG,tokens)))
+            self.parags.extend(accumulate(shape))
+            self.docs.extend((0,0,len(tokens),len(shape)))
+        return shape
+
+    def add_rels(self,document):
+        """
+        Adds the relations of a document. Relation documents are numbered
+        apart: only the documents with relations on both sides are added
+        """
+        if isinstance(document,Document):
+            copy = array.extend if type(document.rel_label) is array else append_bytes
+            for column,values in zip(self.rels,(document.rel_src_start,document.rel_src_end,
+                                                document.rel_tgt_start,document.rel_tgt_end,document.rel_label)):
+                copy(column,values)
+            self.rel_docs.extend((self.vocabs.setdefault(document.vocabs,len(self.vocabs)+1),len(document.rel_label)))
+        else:
+            rels = document['rels']
+            srcs,tgts = list(map(SRC,rels)),list(map(TGT,rels))
+            src_starts,src_ends,tgt_starts,tgt_ends,labels = self.rels
+            src_starts.extend(map(FIRST,srcs))
+            src_ends.extend(map(LAST,srcs))
+            tgt_starts.extend(map(FIRST,tgts))
+            tgt_ends.extend(map(LAST,tgts))
+            labels.extend(map(self.labels.__getitem__,map(NAME,rels)))
+            self.rel_docs.extend((0,len(rels)))
+
+    def translate(self,ids,slots,field):
+        """
+        Maps the ids of the Document vocabularies to the shared ids, the ids read from dicts are kept
+        Args:
+           ids   (array) : label or tag ids
+           slots (array) : the vocabulary slot of each id
+           field (str)   : 'labels' or 'tags'
+        Returns:
+           int array
+        """
+        if not self.vocabs or not len(ids):
+            return ids
+        shared = getattr(self,field)
+        tables = [ [ shared[name] for name in getattr(vocabs,field).names ] for vocabs in self.vocabs ]
+        bases  = np.cumsum([0,0] + [ len(table) for table in tables ])
+        table  = np.array([ idx for table in tables for idx in table ] or [0],dtype=np.int64)
+        return np.where(slots > 0,table[np.where(slots > 0,bases[slots] + ids,0)],ids)
+
+    def span_columns(self):
+        """
+        Returns:
+           (doc,start,end,label) int arrays of the spans of all the documents
+        """
+        slots,nspans,ntokens,nparags = int_column(self.docs).reshape(-1,4).T
+        docs = np.repeat(np.arange(len(self)),nspans)
+        starts,ends,labels = (int_column(column) for column in self.spans)
+        labels = self.translate(labels,slots[docs],'labels')
+        idx,tags = (int_column(column) for column in self.tokens)
+        if not len(tags):
+            return docs,starts,ends,labels
+
+        tdocs = np.repeat(np.arange(len(self)),ntokens)
+        tags  = self.translate(tags,slots[tdocs],'tags')
+        kinds,tag_labels,_ = tag_table(list(self.tags),self.labels)
+        #the documents are decoded at once: paragraph offsets are shifted by the
+        #start of their document, the document number is the high part of the token idx
+        offsets = int_column(self.parags) + np.repeat(np.cumsum(ntokens) - ntokens,nparags)
+        low   = int(idx.min())
+        width = int(idx.max()) - low + 1
+        tstarts,tends,tlabels = decode_numpy(tags,kinds,tag_labels,np.r_[0,offsets],tdocs * width + (idx - low))
+        tdocs = tstarts // width
+        return (np.concatenate((docs,tdocs)),
+                np.concatenate((starts,tstarts - tdocs * width + low)),
+                np.concatenate((ends,tends - tdocs * width + low)),
+                np.concatenate((labels,tlabels)))
+
+    def rel_columns(self):
+        """
+        Returns:
+           (doc,src_start,src_end,tgt_start,tgt_end,label) int arrays of the relations of all the documents
+        """
+        slots,nrels = int_column(self.rel_docs).reshape(-1,2).T
+        docs = np.repeat(np.arange(len(nrels)),nrels)
+        rels = [ int_column(column) for column in self.rels ]
+        rels[-1] = self.translate(rels[-1],slots[docs],'labels')
+        return (docs,*rels)
+
+
+def int_column(values):
+    """
+    Returns:
+       int64 array of a python array
+    """
+    return np.frombuffer(values,dtype=values.typecode).astype(np.int64) if len(values) else np.zeros(0,dtype=np.int64)
+
+
+def unique_rows(*columns):
+    """
+    Returns:
+       int array. The position of the first occurrence of each distinct row, in increasing order
+    """
+    none = np.zeros(0,dtype=np.int64)
+    ids,_ = row_ids(*((column,none) for column in columns))
+    _,first = np.unique(ids,return_index=True)
+    return np.sort(first)
+
+
+def pack_spans(docs,starts,ends,labels):
+    """
+    Packs distinct spans into a structured array
+    Returns:
+       a SPAN_DTYPE array
+    """
+    rows   = unique_rows(docs,starts,ends,labels)
+    packed = np.empty(len(rows),dtype=SPAN_DTYPE)
+    for name,column in zip(SPAN_DTYPE.names,(docs,starts,ends,labels)):
+        packed[name] = column[rows]
+    return packed
+
+
+def pack_rels(docs,src_starts,src_ends,tgt_starts,tgt_ends,labels):
+    """
+    Packs distinct relations into a structured array, in order of first
+    occurrence. The rank of a relation is its position in its document,
+    RelOrder gives the rank used to break ties as align_rels does.
+    Returns:
+       a REL_DTYPE array
+    """
+    fields = (docs,src_starts,src_ends,tgt_starts,tgt_ends,labels)
+    rows   = unique_rows(*fields)
+    packed = np.empty(len(rows),dtype=REL_DTYPE)
+    for name,column in zip(REL_DTYPE.names,fields):
+        packed[name] = column[rows]
+    docs = packed['doc']
+    packed['rank'] = np.arange(len(rows)) - np.searchsorted(docs,docs)
+    return packed
+
+
+class RelOrder:
+    """
+    Ranks the reference relations of documents in the iteration order of
+    their python set, as evaluate.RelAligner does to break ties between
+    several matching reference spans. A set iterates in an order given by
+    the hashes and the insertion order of its elements: it is rebuilt from
+    the relations in order of first occurrence, and only for the
+    documents where a tie occurs.
+    """
+    def __init__(self,names,labeled):
+        """
+        Args:
+           names (list)   : the label names, indexed by label id
+           labeled (bool) : whether the relation tuples are labeled
+        """
+        self.names   = names
+        self.labeled = labeled
+        self.ranked  = set()
+
+    def update(self,rels,docs):
+        """
+        Sets the rank of the relations of some documents
+        Args:
+           rels (array) : REL_DTYPE array of reference rels, updated in place
+           docs (array) : the documents to rank
+        """
+        for doc in set(docs.tolist()) - self.ranked:
+            lo,hi = np.searchsorted(rels['doc'],(doc,doc+1))
+            rows  = zip(*(rels[name][lo:hi].tolist() for name in ('src_start','src_end','tgt_start','tgt_end','label')))
+            if self.labeled:
+                keys = [ ((src_start,src_end),(tgt_start,tgt_end),self.names[label]) for src_start,src_end,tgt_start,tgt_end,label in rows ]
+            else:
+                keys = [ ((src_start,src_end),(tgt_start,tgt_end)) for src_start,src_end,tgt_start,tgt_end,_ in rows ]
+            rank = { key:pos for pos,key in enumerate(set(keys)) }
+            rels['rank'][lo:hi] = [ rank[key] for key in keys ]
+            self.ranked.add(doc)
+
+
+def row_ids(*columns):
+    """
+    Gives a common integer id to identical rows. The ids are the mixed
+    radix encoding of the rows when it fits in an int64, ranks otherwise
+    Args:
+       columns : a list of couples of aligned int arrays, the first
+                 (resp. second) array of each couple holds the rows of a first
+                 (resp. second) table
+    Returns:
+       couple of int arrays. The row ids of the first and of the second table
+    """
+    n = len(columns[0][0])
+    table = [np.concatenate(couple) for couple in columns]
+    if not len(table[0]):
+        return np.zeros(0,dtype=np.int64),np.zeros(0,dtype=np.int64)
+
+    #mixed radix encoding of the rows into a single int64 key when it fits
+    key,size = np.zeros(len(table[0]),dtype=np.int64),1
+    for column in table:
+        low   = int(column.min())
+        width = int(column.max()) - low + 1
+        size *= width
+        if size >= 2**62:
+            break
+        key = key * width + (column - low)
+    else:
+        return key[:n],key[n:]
+
+    order = np.lexsort(table[::-1])
+    table = [column[order] for column in table]
+    new   = np.zeros(len(order),dtype=bool)
+    for column in table:
+        new[1:] |= column[1:] != column[:-1]
+    ids = np.empty(len(order),dtype=np.int64)
+    ids[order] = np.cumsum(new)
+    return ids[:n],ids[n:]
+
+
+def contains(pool,values):
+    """
+    Returns:
+       bool array. Whether each of the values is in the pool, as np.isin does with a sort
+    """
+    pool = np.sort(pool)
+    pos  = np.minimum(np.searchsorted(pool,values),max(len(pool)-1,0))
+    return pool[pos] == values if len(pool) else np.zeros(len(values),dtype=bool)
+
+
+def overlap_pairs(pgroup,pstart,pend,rgroup,rstart,rend,alpha):
+    """
+    Finds all the (pred,ref) pairs of spans from the same group whose
+    overlap is greater than alpha times the ref span length.
+    Args:
+       pgroup,pstart,pend (arrays): group ids and endpoints of the predicted spans
+       rgroup,rstart,rend (arrays): group ids and endpoints of the reference spans
+       alpha (float)              : threshold for approximative span matching
+    Returns:
+       couple of int arrays. The pred and ref indexes of the matching pairs
+    """
+    empty = np.zeros(0,dtype=np.int64)
+    if not len(pstart) or not len(rstart):
+        return empty,empty
+
+    #sorted interval index over the ref spans, groups are laid out contiguously
+    #by encoding (group,coordinate) into a single monotonic key
+    low   = min(pstart.min(),pend.min(),rstart.min(),rend.min())
+    width = max(pstart.max(),pend.max(),rstart.max(),rend.max()) - low + 1
+    rbase = rgroup * width - low
+    skeys = rbase + rstart
+    order = np.argsort(skeys,kind='stable')
+    skeys = skeys[order]
+    rgroup,rstart,rend = rgroup[order],rstart[order],rend[order]
+    maxends = np.maximum.accumulate(rbase[order] + rend)
+
+    if alpha >= 0:
+        pbase = pgroup * width - low
+        hi = np.searchsorted(skeys,pbase + pend,side='right')
+        lo = np.searchsorted(maxends,pbase + pstart,side='left')
+    else:
+        #a negative alpha lets any non empty span of the group match
+        hi = np.searchsorted(rgroup,pgroup,side='right')
+        lo = np.searchsorted(rgroup,pgroup,side='left')
+
+    counts = np.maximum(hi - lo,0)
+    total  = counts.sum()
+    pidx   = np.repeat(np.arange(len(pstart)),counts)
+    offset = np.arange(total) - np.repeat(np.cumsum(counts) - counts,counts)
+    ridx   = np.repeat(lo,counts) + offset
+
+    overlap = np.minimum(pend[pidx],rend[ridx]) - np.maximum(pstart[pidx],rstart[ridx]) + 1
+    length  = rend[ridx] - rstart[ridx] + 1
+    if alpha >= 0:
+        keep = (overlap > 0) & (overlap > alpha * length)
+    else:
+        keep = length > 0
+    return pidx[keep],order[ridx[keep]]
+
+
+def fixed_sum(values):
+    """
+    Exact sum of an array of non negative floats, as a fixed point integer (see evaluate.to_fixed)
+    """
+    mantissa,exponent = np.frexp(values)
+    mantissa = (mantissa * 2.**53).astype(np.int64)
+    high,low = mantissa >> 26,mantissa & ((1 << 26) - 1)
+    total = 0
+    for exp in np.unique(exponent).tolist():
+        selected = exponent == exp
+        partial  = (int(high[selected].sum()) << 26) + int(low[selected].sum())
+        shift    = exp - 53 + FIXED_SHIFT
+        #subnormal mantissas end with at least -shift zero bits
+        total   += partial << shift if shift >= 0 else partial >> -shift
+    return total
+
+
+def add_counts(state,view,key,mode,tp,npred,nref):
+    """
+    Adds per document counts to an evaluation state, same as calling
+    EvalState.add for each document
+    Args:
+       state (EvalState)      : the state updated in place
+       view,key,mode (str)    : e.g. 'labeled','spans','strict'
+       tp,npred,nref (arrays) : per document counts of correct, predicted and reference items
+    """
+    with np.errstate(divide='ignore',invalid='ignore'):
+        prec  = np.where(npred > 0,tp / np.maximum(npred,1),0.)
+        recll = np.where(nref > 0,tp / np.maximum(nref,1),0.)
+        denom = prec + recll
+        f1    = np.where(denom > 0,2 * prec * recll / np.where(denom > 0,denom,1.),0.)
+    empty = (npred == 0) & (nref == 0)
+    prec,recll,f1 = (np.where(empty,1.,x) for x in (prec,recll,f1))
+    counts = [len(tp),int(tp.sum()),int(npred.sum()),int(nref.sum()),
+              fixed_sum(prec),fixed_sum(recll),fixed_sum(f1)]
+    state.merge(EvalState({(view,key,mode):counts}))
+
+
+def span_counts(pred,ref,ndocs,alpha):
+    """
+    Counts strict and relaxed span matches per document
+    Args:
+       pred (array) : SPAN_DTYPE array of predicted spans
+       ref  (array) : SPAN_DTYPE array of reference spans
+       ndocs (int)  : number of documents
+       alpha (float): threshold for approximative span matching
+    Returns:
+       dict of per document count arrays
+    """
+    pids,rids = row_ids((pred['doc'],ref['doc']),(pred['start'],ref['start']),
+                        (pred['end'],ref['end']),(pred['label'],ref['label']))
+    ref_in_pred = contains(pids,rids)
+    npred = np.bincount(pred['doc'],minlength=ndocs)
+    nref  = np.bincount(ref['doc'],minlength=ndocs)
+    tp    = np.bincount(ref['doc'][ref_in_pred],minlength=ndocs)
+
+    nlabels = max(pred['label'].max(initial=0),ref['label'].max(initial=0)) + 1
+    pgroup,rgroup = pred['doc'] * nlabels + pred['label'],ref['doc'] * nlabels + ref['label']
+    _,ridx  = overlap_pairs(pgroup,pred['start'],pred['end'],rgroup,ref['start'],ref['end'],alpha)
+    matched = np.zeros(len(ref),dtype=bool)
+    matched[ridx] = True
+    #aligned spans are the predicted spans plus the matched ref spans
+    added = np.bincount(ref['doc'][matched & ~ref_in_pred],minlength=ndocs)
+    return {'tp':tp,'npred':npred,'nref':nref,'added':added}
+
+
+def endpoints(doc,start,end):
+    """
+    Returns:
+       (doc,start,end,ids). The distinct spans of a relation endpoint and the span id of each relation
+    """
+    none = np.zeros(0,dtype=np.int64)
+    ids,_ = row_ids((doc,none),(start,none),(end,none))
+    _,first,ids = np.unique(ids,return_index=True,return_inverse=True)
+    return doc[first],start[first],end[first],ids.reshape(-1)
+
+
+def resolve_spans(pstart,pend,rstart,rend,rrank,pidx,ridx):
+    """
+    Resolves each predicted span on the matching reference span with highest rank
+    Args:
+       pstart,pend (arrays)       : predicted spans
+       rstart,rend,rrank (arrays) : reference spans with their rank
+       pidx,ridx (arrays)         : the matching (pred,ref) pairs, see overlap_pairs
+    Returns:
+       couple of arrays. The resolved start and end of each predicted span
+    """
+    start,end = pstart.copy(),pend.copy()
+    if len(pidx):
+        order = np.lexsort((rrank[ridx],pidx))
+        pidx,ridx = pidx[order],ridx[order]
+        last = np.r_[pidx[1:] != pidx[:-1],True]
+        start[pidx[last]] = rstart[ridx[last]]
+        end[pidx[last]]   = rend[ridx[last]]
+    return start,end
+
+
+def rel_counts(pred,ref,ndocs,alpha,order=None):
+    """
+    Counts strict and relaxed relation matches per document
+    Args:
+       pred (array) : REL_DTYPE array of predicted rels
+       ref  (array) : REL_DTYPE array of reference rels, their rank is updated in place by order
+       ndocs (int)  : number of documents
+       alpha (float): threshold for approximative span matching
+       order (RelOrder): ranks the reference rels of the documents where a predicted span matches
+                         several reference spans, the packing ranks are kept if None
+    Returns:
+       dict of per document count arrays
+    """
+    fields = ('doc','src_start','src_end','tgt_start','tgt_end','label')
+    pids,rids = row_ids(*((pred[f],ref[f]) for f in fields))
+    npred = np.bincount(pred['doc'],minlength=ndocs)
+    nref  = np.bincount(ref['doc'],minlength=ndocs)
+    tp    = np.bincount(ref['doc'][contains(pids,rids)],minlength=ndocs)
+
+    matches = { }
+    for side in ('src','tgt'):
+        edoc,estart,eend,ids = endpoints(ref['doc'],ref[f'{side}_start'],ref[f'{side}_end'])
+        pairs = overlap_pairs(pred['doc'],pred[f'{side}_start'],pred[f'{side}_end'],edoc,estart,eend,alpha)
+        matches[side] = (estart,eend,ids,pairs)
+    if order is not None:
+        ties = [ pred['doc'][np.bincount(pidx,minlength=len(pred)) > 1] for *_,(pidx,_) in matches.values() ]
+        order.update(ref,np.concatenate(ties))
+
+    aligned = [pred['doc']]
+    for side,(estart,eend,ids,pairs) in matches.items():
+        #rank of the last relation using each reference span
+        rank = np.full(len(estart),-1,dtype=np.int64)
+        np.maximum.at(rank,ids,ref['rank'])
+        aligned.extend(resolve_spans(pred[f'{side}_start'],pred[f'{side}_end'],estart,eend,rank,*pairs))
+    aligned.append(pred['label'])
+    aids,rids = row_ids(*((a,ref[f]) for a,f in zip(aligned,fields)))
+    aids,first = np.unique(aids,return_index=True)
+    adoc = pred['doc'][first]
+    return {'tp':tp,'npred':npred,'nref':nref,
+            'atp':np.bincount(adoc[contains(rids,aids)],minlength=ndocs),
+            'apred':np.bincount(adoc,minlength=ndocs)}
+
+
+def pack_views(pred_annotations,ref_annotations,views=VIEWS):
+    """
+    Packs the spans and relations of each view of the documents
+    Args:
+        pred_annotations (list): the predicted documents (annotation dicts or document.Document)
+        ref_annotations (list) : the reference documents
+        views (tuple)          : 'labeled' and/or 'unlabeled'
+    Returns:
+        (packs,ndocs). packs maps each view to its (pred_spans,ref_spans,pred_rels,ref_rels)
+        packed arrays, its number of documents with relations and its RelOrder.
+        ndocs is the number of documents
+    Raises:
+        Exception if the tokens are missing or if the documents differ in length
+    """
+    for view in views:
+        if view not in VIEWS:
+            raise Exception(f'Unknown evaluation view {view}. aborting.')
+    labels,tags = id_dict(),id_dict()
+    pred,ref = ColumnPacker(labels,tags),ColumnPacker(labels,tags)
+    for pred_doc,ref_doc in zip(pred_annotations,ref_annotations):
+        pred_shape = pred.add(pred_doc)
+        ref_shape  = ref.add(ref_doc)
+        if pred_shape != ref_shape:
+            #raises unless the shapes only differ in their representation
+            check_shape(pred_doc,token_shape(ref_doc))
+        if 'rels' in pred_doc and 'rels' in ref_doc:
+            pred.add_rels(pred_doc)
+            ref.add_rels(ref_doc)
+
+    spans = (pred.span_columns(),ref.span_columns())
+    rels  = (pred.rel_columns(),ref.rel_columns())
+    names = list(labels)
+    packed = { }
+    for view in views:
+        if view == 'unlabeled':
+            spans = tuple((*columns[:-1],np.zeros_like(columns[-1])) for columns in spans)
+            rels  = tuple((*columns[:-1],np.zeros_like(columns[-1])) for columns in rels)
+        packed[view] = (pack_spans(*spans[0]),pack_spans(*spans[1]),pack_rels(*rels[0]),pack_rels(*rels[1]),
+                        len(ref.rel_docs) // 2,RelOrder(names,view == 'labeled'))
+    return packed,len(ref)
+
+
+def eval_state_numpy(pred_annotations,ref_annotations,alpha=0.5,views=VIEWS):
+    """
+    Accumulates the evaluation counts of several views of the given
+    annotations dictionaries with vectorized operations. Same interface
+    and same results as evaluate.eval_state.
+    Args:
+        pred_annotations (dict): an annotation dict (possibly missing some keys)
+        ref_annotations (dict) : an annotation dict (possibly missing some keys)
+        alpha (float)          : threshold for approximative span matching
+        views (tuple)          : 'labeled' and/or 'unlabeled'
+    Returns:
+        EvalState
+    """
+    return eval_sweep_numpy(pred_annotations,ref_annotations,alphas=(alpha,),views=views)[alpha]
+
+
+def eval_sweep_numpy(pred_annotations,ref_annotations,alphas,views=VIEWS):
+    """
+    Accumulates the evaluation counts for several alpha thresholds, the
+    documents are packed once and scored for each alpha
+    Returns:
+        dict. Maps each alpha to an EvalState, as evaluate.sweep_chunk does
+    """
+    packed,ndocs = pack_views(pred_annotations,ref_annotations,views)
+    states = { }
+    for alpha in alphas:
+        state = states[alpha] = EvalState()
+        for view,(pred_spans,ref_spans,pred_rels,ref_rels,nrel_docs,order) in packed.items():
+            eval_packed(state,view,pred_spans,ref_spans,pred_rels,ref_rels,ndocs,nrel_docs,alpha,order)
+    return states
+
+
+def eval_packed(state,view,pred_spans,ref_spans,pred_rels,ref_rels,ndocs,nrel_docs,alpha=0.5,order=None):
+    """
+    Scores packed spans and relations
+    Args:
+        state (EvalState)             : the state updated in place
+        view (str)                    : the name of the view
+        pred_spans,ref_spans (arrays) : SPAN_DTYPE arrays
+        pred_rels,ref_rels   (arrays) : REL_DTYPE arrays
+        ndocs     (int)               : number of documents
+        nrel_docs (int)               : number of documents with relations (0 if none)
+        alpha (float)                 : threshold for approximative span matching
+        order (RelOrder)              : ranks the reference rels to break ties (see rel_counts)
+    """
+    if not ndocs:
+        return
+    counts = span_counts(pred_spans,ref_spans,ndocs,alpha)
+    add_counts(state,view,'spans','strict',counts['tp'],counts['npred'],counts['nref'])
+    add_counts(state,view,'spans','relaxed',counts['tp'] + counts['added'],counts['npred'] + counts['added'],counts['nref'])
+
+    if nrel_docs:
+        counts = rel_counts(pred_rels,ref_rels,nrel_docs,alpha,order)
+        add_counts(state,view,'rels','strict',counts['tp'],counts['npred'],counts['nref'])
+        add_counts(state,view,'rels','relaxed',counts['atp'],counts['apred'],counts['nref'])
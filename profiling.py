@@ -0,0 +1,223 @@
+#Opt-in instrumentation of the evaluation and import paths.
+#Instrumented code reads the module level STATS object: when profiling is
+#disabled (the default) it is None and each instrumentation point costs a
+#single test. When enabled, stages are timed, events are counted and the
+#slowest documents are recorded.
+
+import heapq
+import sys
+import time
+from contextlib import contextmanager
+
+STATS = None
+
+
+class Stats:
+    """
+    Per stage timers, counters and slowest documents. Stats gathered in
+    worker processes are merged into the parent ones.
+    """
+    def __init__(self,slow=0,doc_offset=0):
+        """
+        Args:
+           slow (int)       : number of slowest documents to record
+           doc_offset (int) : number of the first document seen, for worker processes
+        """
+        self.timers     = { }   #stage -> [seconds,calls]
+        self.counters   = { }
+        self.slow       = slow
+        self.slow_docs  = [ ]   #min heap of (seconds,document)
+        self.doc_offset = doc_offset
+        self.started    = time.perf_counter()
+
+    def add_time(self,stage,seconds,calls=1):
+        entry = self.timers.setdefault(stage,[0.,0])
+        entry[0] += seconds
+        entry[1] += calls
+
+    def count(self,name,value=1):
+        self.counters[name] = self.counters.get(name,0) + value
+
+    @contextmanager
+    def timer(self,stage):
+        """
+        Times the enclosed block as a stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage,time.perf_counter() - start)
+
+    def timed(self,stage,iterable):
+        """
+        Times the production of each item of an iterable as a stage, e.g.
+        the parsing of streamed documents
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_time(stage,time.perf_counter() - start,0)
+                return
+            self.add_time(stage,time.perf_counter() - start)
+            yield item
+
+    def document(self,seconds,name=None):
+        """
+        Records the processing time of a document, the documents are numbered in order when unnamed
+        """
+        if name is None:
+            name = self.doc_offset + self.counters.get('docs',0) - 1
+        if self.slow > 0:
+            if len(self.slow_docs) < self.slow:
+                heapq.heappush(self.slow_docs,(seconds,name))
+            elif seconds > self.slow_docs[0][0]:
+                heapq.heapreplace(self.slow_docs,(seconds,name))
+
+    def merge(self,other):
+        """
+        Merges the stats of another process into this one
+        Returns:
+           Stats. self
+        """
+        for stage,(seconds,calls) in other.timers.items():
+            self.add_time(stage,seconds,calls)
+        for name,value in other.counters.items():
+            self.count(name,value)
+        for seconds,name in other.slow_docs:
+            self.document(seconds,name)
+        return self
+
+    def to_dict(self):
+        return {'wall':time.perf_counter() - self.started,
+                'timers':{ stage:{'seconds':seconds,'calls':calls} for stage,(seconds,calls) in self.timers.items() },
+                'counters':dict(self.counters),
+                'slow_docs':[ {'document':name,'seconds':seconds} for seconds,name in sorted(self.slow_docs,reverse=True) ]}
+
+    def report(self,outfile=sys.stderr):
+        """
+        Prints the stats, stages by decreasing time. With several processes,
+        stage times add up over the processes and may exceed the wall time
+        """
+        wall = time.perf_counter() - self.started
+        print(f'\n*** profile (wall time {wall:.3f} s) ***',file=outfile)
+        print(f"{'stage':24}{'seconds':>10}{'%wall':>8}{'calls':>10}{'ms/call':>10}",file=outfile)
+        for stage,(seconds,calls) in sorted(self.timers.items(),key=lambda item:-item[1][0]):
+            print(f'{stage:24}{seconds:10.3f}{100*seconds/wall:8.1f}{calls:10d}{1e3*seconds/max(calls,1):10.3f}',file=outfile)
+        for name,value in sorted(self.counters.items()):
+            print(f'{name:24}{value:10d}',file=outfile)
+        if self.slow_docs:
+            print('slowest documents:',file=outfile)
+            for seconds,name in sorted(self.slow_docs,reverse=True):
+                print(f'  {name}\t{1e3*seconds:.3f} ms',file=outfile)
+
+
+class Laps:
+    """
+    Splits the processing of a document into consecutive timed stages
+    """
+    __slots__ = ('stats','start','last')
+
+    def __init__(self,stats):
+        self.stats = stats
+        self.start = self.last = time.perf_counter()
+
+    def lap(self,stage):
+        """
+        Adds the time elapsed since the previous lap to a stage
+        """
+        now = time.perf_counter()
+        self.stats.add_time(stage,now - self.last)
+        self.last = now
+
+    def done(self,name=None):
+        """
+        Records the total time of the document
+        """
+        self.stats.count('docs')
+        self.stats.document(time.perf_counter() - self.start,name)
+
+
+class NullLaps:
+    """
+    Laps when profiling is disabled: does nothing
+    """
+    __slots__ = ()
+
+    def lap(self,stage):
+        pass
+
+    def done(self,name=None):
+        pass
+
+NULL_LAPS = NullLaps()
+
+
+def laps():
+    """
+    Returns:
+       Laps for the current document, or NULL_LAPS when profiling is disabled
+    """
+    return NULL_LAPS if STATS is None else Laps(STATS)
+
+
+def enable(slow=0):
+    """
+    Enables profiling with fresh stats
+    Args:
+       slow (int): number of slowest documents to record
+    Returns:
+       Stats
+    """
+    global STATS
+    STATS = Stats(slow)
+    return STATS
+
+
+def disable():
+    """
+    Disables profiling
+    Returns:
+       Stats. the stats gathered so far, or None
+    """
+    global STATS
+    stats,STATS = STATS,None
+    return stats
+
+
+@contextmanager
+def profile(slow=0):
+    """
+    Profiles the enclosed block:
+       with profile(slow=10) as stats:
+           eval_dataset(pred,ref)
+       stats.report()
+    """
+    global STATS
+    previous = STATS
+    stats = enable(slow)
+    try:
+        yield stats
+    finally:
+        STATS = previous
+
+
+def profiled_call(func,slow,doc_offset,*args):
+    """
+    Calls func in a worker process with fresh stats
+    Args:
+       func (callable)  : the function to profile
+       slow (int)       : number of slowest documents to record
+       doc_offset (int) : number of the first document processed by the call
+    Returns:
+       (result,stats) the result of func and the stats gathered during the call
+    """
+    global STATS
+    STATS = Stats(slow,doc_offset)
+    try:
+        return func(*args),STATS
+    finally:
+        STATS = None
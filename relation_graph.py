@@ -0,0 +1,341 @@
+#Relation graph index of the documents of a dataset (requires numpy).
+#The nodes of the graph are the spans of the documents, numbered corpus wide:
+#the nodes of document d are doc_nodes[d] to doc_nodes[d+1] (excluded) and the
+#local id of a span is its position in the span list of its document (relation
+#endpoints that are not spans of the document are appended as unlabeled nodes).
+#Relations are the edges, stored in CSR form in both directions: the targets of
+#node n are out_targets[out_offsets[n]:out_offsets[n+1]] and its sources are
+#in_sources[in_offsets[n]:in_offsets[n+1]]. The index is built once, neighbor
+#queries are then array slices and corpus statistics are computed with
+#vectorized operations over all the documents at once.
+#
+#The relations point from the supporting (or attacking) span to its target: the
+#roots of the argument trees are the spans with incoming but no outgoing relations
+#and the depth of a span is the length of the longest relation path to a root.
+
+import numpy as np
+
+from bio import decode_tokens
+from document import Document,Vocab
+
+
+def document_graph(document):
+    """
+    Extracts the spans and relations of a document
+    Args:
+       document (dict) : a document in the json dataset format or a Document
+    Returns:
+       (spans,rels). spans is a list of (start,end,label) triples, from the
+       'spans' field when available and decoded from the BIO tags otherwise.
+       rels is a list of ((src_start,src_end),(tgt_start,tgt_end),label) triples
+    """
+    if isinstance(document,Document):
+        spans = document.spans()
+        return (spans if spans is not None else document.bio_spans()),(document.rels() or [ ])
+    if 'spans' in document:
+        spans = [ (span['start'],span['end'],span['name']) for span in document['spans'] ]
+    else:
+        spans = decode_tokens(document['tokens'])
+    rels = [ (tuple(rel['src']),tuple(rel['tgt']),rel['name']) for rel in document.get('rels',[ ]) ]
+    return spans,rels
+
+
+def csr(keys,values,labels,size):
+    """
+    Sorts edges by key into compressed sparse rows
+    Returns:
+       (offsets,values,labels) arrays, the values and labels of key k are in offsets[k]:offsets[k+1]
+    """
+    order   = np.argsort(keys,kind='stable')
+    offsets = np.zeros(size+1,dtype=np.int64)
+    np.cumsum(np.bincount(keys,minlength=size),out=offsets[1:])
+    return offsets,values[order],labels[order]
+
+
+def histogram(values):
+    """
+    Returns:
+       dict mapping each value of an integer array to its number of occurrences
+    """
+    keys,counts = np.unique(values,return_counts=True)
+    return dict(zip(keys.tolist(),counts.tolist()))
+
+
+class RelationGraph:
+    """
+    CSR relation graph index over the documents of a dataset. Node ids are
+    global, see the module header. A single document is indexed as a one
+    document graph whose node ids are the positions of its spans.
+    """
+    def __init__(self,documents=()):
+        """
+        Args:
+           documents (iterable): documents in the json dataset format or Documents, read once
+        """
+        self.span_labels = Vocab()
+        self.rel_labels  = Vocab()
+        doc_nodes = [0]
+        starts,ends,node_labels = [ ],[ ],[ ]
+        srcs,tgts,edge_labels   = [ ],[ ],[ ]
+        for document in documents:
+            spans,rels = document_graph(document)
+            nodes = { }   #(start,end) -> node id, the first span wins as in Document.rel_span_indices
+            for start,end,label in spans:
+                nodes.setdefault((start,end),len(starts))
+                starts.append(start)
+                ends.append(end)
+                node_labels.append(self.span_labels.index(label))
+            for src,tgt,label in rels:
+                for endpoint in (src,tgt):
+                    if endpoint not in nodes:
+                        nodes[endpoint] = len(starts)
+                        starts.append(endpoint[0])
+                        ends.append(endpoint[1])
+                        node_labels.append(-1)
+                srcs.append(nodes[src])
+                tgts.append(nodes[tgt])
+                edge_labels.append(self.rel_labels.index(label))
+            doc_nodes.append(len(starts))
+
+        self.doc_nodes  = np.array(doc_nodes,dtype=np.int64)
+        self.node_start = np.array(starts,dtype=np.int64)
+        self.node_end   = np.array(ends,dtype=np.int64)
+        self.node_label = np.array(node_labels,dtype=np.int32)
+        self.node_doc   = np.repeat(np.arange(len(doc_nodes)-1,dtype=np.int64),np.diff(self.doc_nodes))
+        self.edge_src   = np.array(srcs,dtype=np.int64)
+        self.edge_tgt   = np.array(tgts,dtype=np.int64)
+        self.edge_label = np.array(edge_labels,dtype=np.int32)
+        nnodes = len(starts)
+        self.out_offsets,self.out_targets,self.out_labels = csr(self.edge_src,self.edge_tgt,self.edge_label,nnodes)
+        self.in_offsets,self.in_sources,self.in_labels    = csr(self.edge_tgt,self.edge_src,self.edge_label,nnodes)
+        self._depths = { }
+
+    @property
+    def ndocs(self):
+        return len(self.doc_nodes) - 1
+
+    def __len__(self):
+        """
+        Returns:
+           int. the number of nodes
+        """
+        return len(self.node_start)
+
+    def nodes(self,doc):
+        """
+        Returns:
+           range of the node ids of a document
+        """
+        return range(self.doc_nodes[doc],self.doc_nodes[doc+1])
+
+    def node(self,doc,start,end):
+        """
+        Returns:
+           int. the id of the (start,end) span of a document, or -1
+        """
+        first,last = self.doc_nodes[doc],self.doc_nodes[doc+1]
+        hits = np.flatnonzero((self.node_start[first:last] == start) & (self.node_end[first:last] == end))
+        return int(first + hits[0]) if len(hits) else -1
+
+    def span(self,node):
+        """
+        Returns:
+           (doc,start,end,label) of a node, the label is None for endpoints that are not spans
+        """
+        label = int(self.node_label[node])
+        return (int(self.node_doc[node]),int(self.node_start[node]),int(self.node_end[node]),
+                self.span_labels[label] if label >= 0 else None)
+
+    def _label_id(self,vocab,name):
+        return vocab.ids.get(name,-2)   #unknown names match nothing
+
+    def _neighbors(self,offsets,targets,labels,node,rel_label,span_label):
+        first,last = offsets[node],offsets[node+1]
+        found = targets[first:last]
+        if rel_label is not None:
+            found = found[labels[first:last] == self._label_id(self.rel_labels,rel_label)]
+        if span_label is not None:
+            found = found[self.node_label[found] == self._label_id(self.span_labels,span_label)]
+        return found
+
+    def successors(self,node,rel_label=None,span_label=None):
+        """
+        The targets of the relations of a node, e.g. the claims a premise supports
+        Args:
+           node (int)       : a node id
+        KwArgs:
+           rel_label (str)  : keeps the relations with this label only
+           span_label (str) : keeps the targets with this label only
+        Returns:
+           array of node ids
+        """
+        return self._neighbors(self.out_offsets,self.out_targets,self.out_labels,node,rel_label,span_label)
+
+    def predecessors(self,node,rel_label=None,span_label=None):
+        """
+        The sources of the relations to a node, e.g. all the premises supporting a claim:
+           graph.predecessors(claim,rel_label='supports',span_label='Premise')
+        Returns:
+           array of node ids
+        """
+        return self._neighbors(self.in_offsets,self.in_sources,self.in_labels,node,rel_label,span_label)
+
+    def edges(self,rel_label=None,src_label=None,tgt_label=None):
+        """
+        Selects the relations of all the documents at once
+        KwArgs:
+           rel_label (str) : the relation label
+           src_label (str) : the label of the source spans
+           tgt_label (str) : the label of the target spans
+        Returns:
+           (src,tgt) arrays of node ids
+        """
+        mask = np.ones(len(self.edge_src),dtype=bool)
+        if rel_label is not None:
+            mask &= self.edge_label == self._label_id(self.rel_labels,rel_label)
+        if src_label is not None:
+            mask &= self.node_label[self.edge_src] == self._label_id(self.span_labels,src_label)
+        if tgt_label is not None:
+            mask &= self.node_label[self.edge_tgt] == self._label_id(self.span_labels,tgt_label)
+        return self.edge_src[mask],self.edge_tgt[mask]
+
+    def in_degrees(self):
+        return np.diff(self.in_offsets)
+
+    def out_degrees(self):
+        return np.diff(self.out_offsets)
+
+    def path(self,src,tgt,rel_label=None,directed=True):
+        """
+        Shortest relation path between two nodes (breadth first search)
+        Args:
+           src,tgt (int)    : node ids
+        KwArgs:
+           rel_label (str)  : follows the relations with this label only
+           directed (bool)  : whether the relations are followed from source to target only
+        Returns:
+           list of node ids from src to tgt, or None if there is no path
+        """
+        parents  = {src:None}
+        frontier = [src]
+        while frontier and tgt not in parents:
+            following = [ ]
+            for node in frontier:
+                neighbors = self.successors(node,rel_label).tolist()
+                if not directed:
+                    neighbors += self.predecessors(node,rel_label).tolist()
+                for neighbor in neighbors:
+                    if neighbor not in parents:
+                        parents[neighbor] = node
+                        following.append(neighbor)
+            frontier = following
+        if tgt not in parents:
+            return None
+        path = [tgt]
+        while parents[path[-1]] is not None:
+            path.append(parents[path[-1]])
+        return path[::-1]
+
+    def _labeled_edges(self,rel_label):
+        """
+        Returns:
+           (src,tgt) arrays of the relations with a label, or of all of them when rel_label is None
+        """
+        if rel_label is None:
+            return self.edge_src,self.edge_tgt
+        mask = self.edge_label == self._label_id(self.rel_labels,rel_label)
+        return self.edge_src[mask],self.edge_tgt[mask]
+
+    def depths(self,rel_label=None):
+        """
+        Depth of each node: the length of the longest relation path from the
+        node to a root. With a relation label, the length of the longest chain
+        of such relations starting at the node (e.g. attack chains). Computed
+        for all the documents at once by relaxing all the edges in parallel,
+        as many times as the longest path. Cached.
+        Returns:
+           array of depths, -1 for the nodes reaching a cycle
+        """
+        if rel_label in self._depths:
+            return self._depths[rel_label]
+        src,tgt = self._labeled_edges(rel_label)
+        depth = np.zeros(len(self),dtype=np.int64)
+        #an acyclic path is shorter than the largest document, a cycle grows the depths of its nodes at each pass
+        bound = int(np.diff(self.doc_nodes).max()) if self.ndocs else 0
+        for _ in range(bound):
+            relaxed = depth.copy()
+            np.maximum.at(relaxed,src,depth[tgt] + 1)
+            if np.array_equal(relaxed,depth):
+                break
+            depth = relaxed
+        else:
+            depth[depth >= bound] = -1
+        self._depths[rel_label] = depth
+        return depth
+
+    def chain(self,node,rel_label=None):
+        """
+        A longest relation path from a node, e.g. the longest attack chain
+        starting at a span with rel_label='attacks'
+        Returns:
+           list of node ids, None if the node reaches a cycle
+        """
+        depth = self.depths(rel_label)
+        if depth[node] < 0:
+            return None
+        chain = [node]
+        while depth[chain[-1]] > 0:
+            successors = self.successors(chain[-1],rel_label)
+            chain.append(int(successors[np.argmax(depth[successors] == depth[chain[-1]] - 1)]))
+        return chain
+
+    def tree_stats(self,rel_label=None):
+        """
+        Per document statistics of the argument trees, in one vectorized pass
+        KwArgs:
+           rel_label (str): restricts the trees to the relations with this label
+        Returns:
+           dict of arrays with one value per document: nodes, edges, trees (roots:
+           nodes with incoming but no outgoing relations), max_depth (-1 when the
+           document has a cycle) and cyclic (the number of nodes reaching a cycle)
+        """
+        depth   = self.depths(rel_label)
+        src,tgt = self._labeled_edges(rel_label)
+        indeg   = np.bincount(tgt,minlength=len(self))
+        outdeg  = np.bincount(src,minlength=len(self))
+        ndocs   = self.ndocs
+        roots   = (outdeg == 0) & (indeg > 0)
+        cyclic  = np.bincount(self.node_doc[depth < 0],minlength=ndocs)
+        max_depth = np.zeros(ndocs,dtype=np.int64)
+        np.maximum.at(max_depth,self.node_doc,depth)
+        max_depth[cyclic > 0] = -1
+        return {'nodes':np.diff(self.doc_nodes),
+                'edges':np.bincount(self.node_doc[src],minlength=ndocs),
+                'trees':np.bincount(self.node_doc[roots],minlength=ndocs),
+                'max_depth':max_depth,
+                'cyclic':cyclic}
+
+    def stats(self):
+        """
+        Corpus statistics of the relation graph
+        Returns:
+           dict. totals (nodes include the relation endpoints that are not spans), the number of relations of each label, and the distributions
+           (value -> count) of the node in and out degrees, of the depths of the nodes
+           with relations and of the tree depths of the documents
+        """
+        indeg,outdeg = self.in_degrees(),self.out_degrees()
+        trees = self.tree_stats()
+        related = (indeg > 0) | (outdeg > 0)
+        return {'documents':self.ndocs,
+                'nodes':len(self),
+                'spans':int((self.node_label >= 0).sum()),
+                'relations':len(self.edge_src),
+                'relation_labels':{ self.rel_labels[label]:count
+                                    for label,count in enumerate(np.bincount(self.edge_label,minlength=len(self.rel_labels)).tolist()) },
+                'trees':int(trees['trees'].sum()),
+                'isolated':int((~related).sum()),
+                'cyclic':int(trees['cyclic'].sum()),
+                'in_degree':histogram(indeg),
+                'out_degree':histogram(outdeg),
+                'depth':histogram(self.depths()[related]),
+                'tree_depth':histogram(trees['max_depth'])}
@@ -0,0 +1,190 @@
+#Paired bootstrap significance testing between two systems.
+#The per document match counts of both systems are computed once. The bootstrap
+#resamples are drawn as a matrix of document indexes and the resampled macro and
+#micro F-scores of all the resamples are computed at once with NumPy.
+
+from functools import partial
+
+import numpy as np
+
+from evaluate import VIEWS,index_reference,map_chunks,score_reference
+
+AVERAGES = ('macro','micro')
+
+
+def compare_chunk(chunk,alpha=0.5,views=VIEWS):
+    """
+    Scores a list of ((pred_a,pred_b),ref) document triples
+    Returns:
+        a list of (counts_a,counts_b) couples, as returned by score_reference
+    """
+    result = [ ]
+    for (pred_a,pred_b),ref in chunk:
+        gold = index_reference(ref,views)
+        result.append((score_reference(pred_a,gold,alpha,views),score_reference(pred_b,gold,alpha,views)))
+    return result
+
+
+def document_counts(pred_a,pred_b,ref_annotations,alpha=0.5,views=VIEWS,jobs=1):
+    """
+    Computes the per document match counts of two systems
+    Args:
+        pred_a,pred_b (list)  : the predicted documents of each system
+        ref_annotations (list): the reference documents
+        alpha (float)         : threshold for approximative span matching
+        views (tuple)         : 'labeled' and/or 'unlabeled'
+        jobs (int)            : number of processes, 0 or less uses all cores
+    Returns:
+        (names,counts) where names is the list of the (view,key,mode) triples
+        and counts an int array of shape (2,ndocs,len(names),4). The last axis
+        holds (present,tp,npred,nref), present is 0 when a document has no
+        such evaluation (e.g. missing rels)
+    """
+    docs = [ ]
+    for chunk in map_chunks(partial(compare_chunk,alpha=alpha,views=views),zip(pred_a,pred_b),ref_annotations,jobs=jobs):
+        docs.extend(chunk)
+    if not docs:
+        raise Exception('No document to evaluate. aborting.')
+    names  = sorted({ name for doc in docs for system in doc for name in system })
+    column = { name:idx for idx,name in enumerate(names) }
+    counts = np.zeros((2,len(docs),len(names),4),dtype=np.int64)
+    for doc,systems in enumerate(docs):
+        for system,doc_counts in enumerate(systems):
+            for name,(tp,npred,nref) in doc_counts.items():
+                counts[system,doc,column[name]] = (1,tp,npred,nref)
+    return names,counts
+
+
+def prf_arrays(tp,npred,nref):
+    """
+    Vectorized evaluate.prf, with the same zero conventions
+    Returns:
+        (P,R,F) a triple of float arrays
+    """
+    tp,npred,nref = (np.asarray(x,dtype=np.float64) for x in (tp,npred,nref))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        prec  = np.where(npred > 0,tp / npred,0.)
+        recll = np.where(nref > 0,tp / nref,0.)
+        f1    = np.where(prec + recll > 0,(2 * prec * recll) / (prec + recll),0.)
+    empty = (npred == 0) & (nref == 0)
+    return (np.where(empty,1.,prec),np.where(empty,1.,recll),np.where(empty,1.,f1))
+
+
+def resampled_fscores(weights,counts):
+    """
+    Computes the macro and micro F-scores of bootstrap resamples
+    Args:
+        weights (array): float array of shape (nsamples,ndocs), the number of
+                         times each document is drawn in each resample
+        counts  (array): int array of shape (ndocs,nnames,4) as in document_counts
+    Returns:
+        (macro,micro) float arrays of shape (nsamples,nnames)
+    """
+    present = counts[...,0]
+    _,_,f   = prf_arrays(counts[...,1],counts[...,2],counts[...,3])
+    #a single product sums the documents, the f-scores and the counts of each resample
+    columns = np.concatenate([present,f * present,counts[...,1],counts[...,2],counts[...,3]],axis=1)
+    ndocs,fsum,tp,npred,nref = np.split(weights @ columns,5,axis=1)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        macro = np.where(ndocs > 0,fsum / ndocs,np.nan)
+    _,_,micro = prf_arrays(tp,npred,nref)
+    return macro,micro
+
+
+def resample_weights(rng,nsamples,ndocs):
+    """
+    Draws bootstrap resamples of documents with replacement
+    Returns:
+        float array of shape (nsamples,ndocs), the number of times each
+        document is drawn in each resample
+    """
+    index  = rng.integers(0,ndocs,size=(nsamples,ndocs))
+    index += np.arange(nsamples)[:,None] * ndocs
+    return np.bincount(index.ravel(),minlength=nsamples*ndocs).reshape(nsamples,ndocs).astype(np.float64)
+
+
+def paired_bootstrap(names,counts,samples=10000,seed=0,confidence=0.95,batch_size=None):
+    """
+    Paired bootstrap test of the difference between the F-scores of two systems.
+    Both systems are scored on the very same resamples of documents.
+    Args:
+        names (list)      : (view,key,mode) triples as returned by document_counts
+        counts (array)    : count array as returned by document_counts
+        samples (int)     : number of bootstrap resamples
+        seed (int)        : seed of the random generator
+        confidence (float): level of the confidence intervals
+        batch_size (int)  : number of resamples drawn at once, bounds memory use
+    Returns:
+        dict. results[view][key][mode][average] is a dict with the F-scores of
+        the two systems ('a','b'), their difference ('delta' = b - a), the
+        confidence intervals of the three ('ci_a','ci_b','ci_delta') and the
+        two sided p-value of the null hypothesis that the two systems perform
+        equally ('p_value')
+    """
+    ndocs = counts.shape[1]
+    if batch_size is None:
+        batch_size = max(1,(1 << 22) // ndocs)
+    rng = np.random.default_rng(seed)
+
+    observed = [ resampled_fscores(np.ones((1,ndocs)),counts[system]) for system in (0,1) ]
+    boot     = {(system,avg):[ ] for system in (0,1) for avg in range(len(AVERAGES))}
+    for start in range(0,samples,batch_size):
+        weights = resample_weights(rng,min(batch_size,samples-start),ndocs)
+        for system in (0,1):
+            for avg,fscores in enumerate(resampled_fscores(weights,counts[system])):
+                boot[(system,avg)].append(fscores)
+    boot = { name:np.concatenate(fscores) for name,fscores in boot.items() }
+
+    bounds  = (100 * (1 - confidence) / 2,100 * (1 + confidence) / 2)
+    results = { }
+    for idx,(view,key,mode) in enumerate(names):
+        entry = results.setdefault(view,{ }).setdefault(key,{ }).setdefault(mode,{ })
+        for avg,average in enumerate(AVERAGES):
+            score_a,score_b = observed[0][avg][0,idx],observed[1][avg][0,idx]
+            boot_a,boot_b   = boot[(0,avg)][:,idx],boot[(1,avg)][:,idx]
+            delta,boot_delta = score_b - score_a,boot_b - boot_a
+            valid = ~np.isnan(boot_delta)
+            #shifted null distribution: how often a resample departs from the
+            #observed difference at least as much as the observed difference from 0
+            extreme = np.count_nonzero(np.abs(boot_delta[valid] - delta) >= np.abs(delta))
+            entry[average] = {'a':float(score_a),'b':float(score_b),'delta':float(delta),
+                              'ci_a':tuple(np.nanpercentile(boot_a,bounds).tolist()),
+                              'ci_b':tuple(np.nanpercentile(boot_b,bounds).tolist()),
+                              'ci_delta':tuple(np.nanpercentile(boot_delta,bounds).tolist()),
+                              'p_value':float((extreme + 1) / (np.count_nonzero(valid) + 1))}
+    return results
+
+
+def compare_systems(pred_a,pred_b,ref_annotations,alpha=0.5,views=VIEWS,samples=10000,seed=0,confidence=0.95,jobs=1):
+    """
+    Tests whether two systems differ significantly with a paired bootstrap over documents
+    Args:
+        pred_a,pred_b (list)  : the predicted documents of each system
+        ref_annotations (list): the reference documents
+        alpha (float)         : threshold for approximative span matching
+        views (tuple)         : 'labeled' and/or 'unlabeled'
+        samples (int)         : number of bootstrap resamples
+        seed (int)            : seed of the random generator
+        confidence (float)    : level of the confidence intervals
+        jobs (int)            : number of processes scoring the documents
+    Returns:
+        dict. see paired_bootstrap
+    """
+    names,counts = document_counts(pred_a,pred_b,ref_annotations,alpha=alpha,views=views,jobs=jobs)
+    return paired_bootstrap(names,counts,samples=samples,seed=seed,confidence=confidence)
+
+
+def display_comparison(results):
+    """
+    Prints on stdout a table of the comparison of two systems
+    Args:
+        results (dict): the results of compare_systems
+    """
+    print('\t'.join(['view','key','mode','average','F(a)','F(b)','delta','CI(delta)','p-value']))
+    for view,keys in results.items():
+        for key,modes in keys.items():
+            for mode,averages in modes.items():
+                for average,result in averages.items():
+                    low,high = result['ci_delta']
+                    print('\t'.join([view,key,mode,average,f"{result['a']:.4f}",f"{result['b']:.4f}",
+                                     f"{result['delta']:+.4f}",f'[{low:+.4f},{high:+.4f}]',f"{result['p_value']:.4f}"]))
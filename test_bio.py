@@ -0,0 +1,127 @@
+#Checks of the BIO codec of bio.py against the original per token loops of
+#evaluate.get_spans and brat_import.annotate_NER, on both sides of the NumPy threshold.
+#Run as: python test_bio.py
+
+import random
+from array import array
+
+import bio
+from bio import NUMPY_MIN_TOKENS,decode,decode_python,decode_tokens,encode,encode_python,encode_tokens,tag_table
+
+SIZES = (1,100,NUMPY_MIN_TOKENS-1,NUMPY_MIN_TOKENS,NUMPY_MIN_TOKENS+1,10000)
+
+
+def legacy_decode(paragraphs):
+    spans = [ ]
+    current_lbl,current_start = '',-1
+    for paragraph in paragraphs:
+        for token in paragraph:
+            if token['arg'].startswith('B'):
+                current_start = token['idx']
+                current_lbl   = token['arg'].split('-')[-1]
+            elif token['arg'].startswith('I'):
+                pass
+            elif current_lbl:
+                spans.append((current_start,token['idx'] - 1,current_lbl))
+                current_lbl,current_start = '',-1
+        if current_lbl:
+            spans.append((current_start,paragraph[-1]['idx'],current_lbl))
+            current_lbl,current_start = '',-1
+    return spans
+
+
+def legacy_encode(paragraphs,spans):
+    tagdict = { }
+    for span in spans:
+        tagdict[span['start']] = f"B-{span['name']}"
+        for idx in range(span['start']+1,span['end']):
+            tagdict[idx] = f"I-{span['name']}"
+    return [ tagdict.get(token['idx'],'O') for paragraph in paragraphs for token in paragraph ]
+
+
+def random_document(rng,ntokens):
+    """
+    Returns:
+       (paragraphs,spans) paragraphs of at most 200 token dicts tagged from well formed spans
+    """
+    paragraphs,spans,idx = [ ],[ ],0
+    while idx < ntokens:
+        paragraph = [ ]
+        for _ in range(min(200,ntokens-idx)):
+            paragraph.append({'idx':idx,'arg':'O'})
+            idx += 1
+        pos = 0
+        while pos < len(paragraph) - 10:
+            pos   += rng.randint(1,10)
+            length = rng.randint(1,8)
+            name   = rng.choice(['Claim','Premise','MajorClaim'])
+            end    = min(pos+length,len(paragraph)) - 1
+            spans.append({'name':name,'start':paragraph[pos]['idx'],'end':paragraph[end]['idx']})
+            paragraph[pos]['arg'] = f'B-{name}'
+            for token in paragraph[pos+1:end+1]:
+                token['arg'] = f'I-{name}'
+            pos = end + 1
+        paragraphs.append(paragraph)
+    return paragraphs,spans
+
+
+def noisy_document(rng,paragraphs):
+    #random tags: adjacent B tags, I tags outside spans, non consecutive idx
+    return [ [ {'idx':2*token['idx'],'arg':rng.choice(['O','B-Claim','I-Claim','B-Premise','I-Premise'])}
+               for token in paragraph ] for paragraph in paragraphs ]
+
+
+def test_round_trip():
+    rng = random.Random(0)
+    for ntokens in SIZES:
+        paragraphs,spans = random_document(rng,ntokens)
+        assert decode_tokens(paragraphs) == legacy_decode(paragraphs),ntokens
+        assert decode_tokens(paragraphs) == [ (span['start'],span['end'],span['name']) for span in spans ],ntokens
+        noisy = noisy_document(rng,paragraphs)
+        assert decode_tokens(noisy) == legacy_decode(noisy),ntokens
+        assert encode_tokens(paragraphs,spans) == legacy_encode(paragraphs,spans),ntokens
+        assert encode_tokens(noisy,spans) == legacy_encode(noisy,spans),ntokens
+
+
+def test_thresholds():
+    #the NumPy and python versions agree on both sides of NUMPY_MIN_TOKENS, with lists and arrays
+    rng = random.Random(1)
+    for ntokens in SIZES:
+        noisy     = noisy_document(rng,random_document(rng,ntokens)[0] + [ [ ] ])
+        tag_vocab = { }
+        tag_ids   = [ tag_vocab.setdefault(token['arg'],len(tag_vocab)) for paragraph in noisy for token in paragraph ]
+        idx       = [ token['idx'] for paragraph in noisy for token in paragraph ]
+        offsets   = [ 0 ]
+        for paragraph in noisy:
+            offsets.append(offsets[-1] + len(paragraph))
+        kinds,tag_labels,_ = tag_table(tag_vocab)
+        for repair in (False,True):
+            expected = decode_python(tag_ids,kinds,tag_labels,offsets,idx,repair)
+            assert decode(tag_ids,kinds,tag_labels,offsets,idx,repair) == expected,(ntokens,repair)
+            assert decode(array('q',tag_ids),kinds,tag_labels,array('q',offsets),array('q',idx),repair) == expected
+        #overlapping spans, spans on missing idx
+        starts = [ rng.randrange(-2,2*ntokens+2) for _ in range(ntokens // 5 + 1) ]
+        ends   = [ start + rng.randint(-1,8) for start in starts ]
+        labels = [ rng.randint(0,3) for _ in starts ]
+        expected = encode_python(idx,starts,ends,labels)
+        assert encode(idx,starts,ends,labels) == expected,ntokens
+        assert encode(array('q',idx),starts,ends,labels) == expected,ntokens
+
+
+def test_without_numpy():
+    rng = random.Random(2)
+    paragraphs,spans = random_document(rng,2*NUMPY_MIN_TOKENS)
+    loaded = bio.load_numpy()
+    try:
+        bio.np = None
+        assert decode_tokens(paragraphs) == legacy_decode(paragraphs)
+        assert encode(array('q',range(2*NUMPY_MIN_TOKENS)),[0,5],[3,9],[1,0]) == encode_python(range(2*NUMPY_MIN_TOKENS),[0,5],[3,9],[1,0])
+    finally:
+        bio.np = loaded
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
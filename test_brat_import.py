@@ -0,0 +1,90 @@
+#Checks of the incremental conversion of BRAT directories of data/brat_import.py.
+#Run as: python test_brat_import.py (requires nltk)
+
+import json
+import os
+import tempfile
+
+from benchmark import generate_corpus,write_brat
+from data.brat_import import MANIFEST,convert_directory
+
+
+def brat_dir(dirname,ndocs=6,seed=0):
+    """
+    Returns:
+       list of the .ann filenames of a generated BRAT directory
+    """
+    os.makedirs(dirname)
+    documents,_ = generate_corpus(ndocs,paragraphs=2,tokens=20,seed=seed)
+    return sorted(os.path.basename(annfile) for _,annfile in write_brat(documents,dirname))
+
+
+def manifest(outdir):
+    with open(os.path.join(outdir,MANIFEST)) as infile:
+        return json.loads(infile.read())
+
+
+def test_incremental():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source,outdir = os.path.join(tmpdir,'brat'),os.path.join(tmpdir,'json')
+        os.makedirs(outdir)
+        files = brat_dir(source)
+        for jobs in (1,2):
+            assert convert_directory(source,outdir,jobs=jobs,force=jobs == 2) == (files,[ ],[ ])
+            assert convert_directory(source,outdir,jobs=jobs) == ([ ],files,[ ])
+        assert sorted(manifest(outdir)) == sorted(os.path.abspath(os.path.join(source,name)) for name in files)
+
+        #a touched file with the same content is skipped, a modified file or a deleted output is converted again
+        annfile = os.path.join(source,files[0])
+        stat = os.stat(annfile)
+        os.utime(annfile,ns=(stat.st_atime_ns,stat.st_mtime_ns + 10**9))
+        assert convert_directory(source,outdir) == ([ ],files,[ ])
+        assert manifest(outdir)[os.path.abspath(annfile)]['ann'][0] == stat.st_mtime_ns + 10**9
+        with open(os.path.join(source,files[1].replace('.ann','.txt')),'a') as outfile:
+            outfile.write('appended\n')
+        os.remove(os.path.join(outdir,files[2].replace('.ann','.json')))
+        assert convert_directory(source,outdir) == (files[1:3],files[:1] + files[3:],[ ])
+        with open(os.path.join(outdir,files[1].replace('.ann','.json'))) as infile:
+            assert infile.read().count('appended') == 1
+
+        #--force converts all the files of a directory and keeps the entries of the other directories
+        other = os.path.join(tmpdir,'other')
+        other_files = [ ]
+        for name in brat_dir(other,ndocs=2,seed=1):     #renamed so that the json files do not collide
+            for ext in ('.ann','.txt'):
+                os.rename(os.path.join(other,name.replace('.ann',ext)),os.path.join(other,'other_' + name.replace('.ann',ext)))
+            other_files.append('other_' + name)
+        assert convert_directory(other,outdir) == (other_files,[ ],[ ])
+        assert convert_directory(source,outdir,force=True) == (files,[ ],[ ])
+        assert convert_directory(other,outdir) == ([ ],other_files,[ ])
+        assert len(manifest(outdir)) == len(files) + len(other_files)
+
+
+def test_errors():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source,outdir = os.path.join(tmpdir,'brat'),os.path.join(tmpdir,'json')
+        os.makedirs(outdir)
+        files = brat_dir(source)
+        broken = os.path.join(source,files[3])
+        with open(broken,'a') as outfile:
+            outfile.write('T99\tClaim 50000 50010\tout of the text\n')
+        #the other files are converted, the failed file is retried on the next run
+        for jobs,converted in ((1,files[:3] + files[4:]),(2,[ ])):
+            result = convert_directory(source,outdir,jobs=jobs)
+            assert result[0] == converted
+            assert [ name for name,_ in result[2] ] == [files[3]]
+            assert 'remapping failed' in result[2][0][1]
+            assert os.path.abspath(broken) not in manifest(outdir)
+        #once fixed, the file is converted on the next run
+        with open(broken) as infile:
+            lines = infile.readlines()
+        with open(broken,'w') as outfile:
+            outfile.write(''.join(lines[:-1]))
+        assert convert_directory(source,outdir) == ([files[3]],files[:3] + files[4:],[ ])
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
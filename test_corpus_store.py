@@ -0,0 +1,77 @@
+#Checks of the columnar corpus format of corpus_store.py.
+#Run as: python test_corpus_store.py (requires numpy)
+
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from benchmark import generate_corpus
+from corpus_store import COLUMNS,ColumnarCorpus,write_corpus
+from evaluate import eval_state
+
+
+def sample_documents():
+    """
+    Returns:
+       list of documents, some of them without spans or rels, with empty paragraphs or no tokens at all
+    """
+    documents,_ = generate_corpus(20,seed=3)
+    documents[1].pop('spans')
+    documents[2].pop('rels')
+    documents[3]['tokens'].insert(1,[ ])
+    documents[4] = {'tokens':[ ]}
+    return documents
+
+
+def test_round_trip():
+    documents = sample_documents()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        assert write_corpus(iter(documents),tmpdir) == len(documents)
+        corpus = ColumnarCorpus(tmpdir)
+        assert len(corpus) == len(documents)
+        for name,code in COLUMNS.items():
+            assert corpus[name].dtype == np.dtype(code),name
+            assert isinstance(corpus[name],np.memmap) or len(corpus[name]) == 0,name
+
+        #offset columns start at 0, the last offset is the length of the delimited column
+        for offsets,column in (('parag_offsets','token_idx'),('doc_parags','parag_offsets'),
+                               ('doc_spans','span_start'),('doc_rels','rel_src_start')):
+            values = corpus[offsets]
+            assert values[0] == 0 and np.all(np.diff(values) >= 0),offsets
+            assert values[-1] == len(corpus[column]) - (column == 'parag_offsets'),offsets
+        assert len(corpus['doc_parags']) == len(corpus['doc_spans']) == len(corpus['doc_rels']) == len(documents) + 1
+
+        assert list(corpus) == documents
+        for original,document in zip(documents,corpus.documents()):
+            assert document.to_dict() == original
+            assert document.parag_offsets[0] == 0
+            #Document columns are views of the memory mapped columns
+            for name in ('token_idx','token_tag','span_start','rel_label'):
+                column = getattr(document,name)
+                if column is not None and len(column):
+                    assert isinstance(column,memoryview)
+                    assert np.shares_memory(np.asarray(column),corpus[name]),name
+            assert pickle.loads(pickle.dumps(document)).to_dict() == original
+        assert corpus.to_corpus(slice(5,8)).documents[0].to_dict() == documents[5]
+
+
+def test_evaluation():
+    refs,preds = generate_corpus(30,seed=4)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_corpus(refs,os.path.join(tmpdir,'refs'))
+        write_corpus(preds,os.path.join(tmpdir,'preds'))
+        ref_corpus  = ColumnarCorpus(os.path.join(tmpdir,'refs')).to_corpus()
+        pred_corpus = ColumnarCorpus(os.path.join(tmpdir,'preds')).to_corpus()
+        expected = eval_state(preds,refs).counts
+        for backend in ('python','numpy'):
+            assert eval_state(pred_corpus,ref_corpus,backend=backend).counts == expected,backend
+            assert eval_state(preds,ref_corpus,backend=backend).counts == expected,backend
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
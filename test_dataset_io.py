@@ -0,0 +1,148 @@
+#Checks of the dataset readers of dataset_io.py.
+#Run as: python test_dataset_io.py
+
+import io
+import json
+import os
+import tempfile
+
+from argbase import read_dataset
+from benchmark import generate_corpus
+from data.merge_data import merge_dir
+from dataset_io import (build_index,index_path,iter_documents,iter_json_array,iter_json_lines,iter_shards,load_dataset,
+                        load_index,parse_selection,select_documents,write_json_lines)
+
+
+def write_dir(documents,dirname):
+    #one json file per document, as brat_import.py writes them
+    os.makedirs(dirname)
+    for idx,document in enumerate(documents):
+        with open(os.path.join(dirname,f'doc{idx:03d}.json'),'w') as outfile:
+            outfile.write(json.dumps(document))
+
+
+def test_iter_json_array():
+    documents,_ = generate_corpus(5,seed=1)
+    documents[0]['tokens'][0][0]['str'] = 'é€😀 "quoted" [,]'     #multibyte chars and delimiters inside strings
+    texts = [json.dumps(documents),json.dumps(documents,indent=2),
+             '\n [ ' + ' ,\n'.join(json.dumps(document,ensure_ascii=False) for document in documents) + '\n]\n',
+             '[]',' [ ]\n','[1, 23, 456.5, -7e3,"x",null]','[{"a":[]}]']
+    for text in texts:
+        data = text.encode('utf-8')
+        for chunk_size in (1,2,3,7,64,1<<20):
+            parsed = list(iter_json_array(io.BytesIO(data),chunk_size=chunk_size))
+            assert [ document for document,_,_ in parsed ] == json.loads(text),(text[:20],chunk_size)
+            for document,start,end in parsed:
+                assert json.loads(data[start:end]) == document
+    for text in ('','{}','[1 2]','[1,','[{"a":1}','[1,]x','[1]]'):
+        for chunk_size in (1,1<<20):
+            try:
+                list(iter_json_array(io.BytesIO(text.encode('utf-8')),chunk_size=chunk_size))
+            except json.JSONDecodeError:
+                continue
+            raise AssertionError(f'{text!r} was parsed')
+
+
+def test_iter_json_lines():
+    documents,_ = generate_corpus(5,seed=2)
+    data = ('\n'.join(json.dumps(document,ensure_ascii=False) for document in documents) + '\n\n').encode('utf-8')
+    parsed = list(iter_json_lines(io.BytesIO(data)))
+    assert [ document for document,_,_ in parsed ] == documents
+    for document,start,end in parsed:
+        assert json.loads(data[start:end]) == document
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name,text,expected in (('data.json',json.dumps(documents),documents),('data.jsonl',data.decode('utf-8'),documents),
+                                   ('empty.json','[]',[ ])):
+            path = os.path.join(tmpdir,name)
+            with open(path,'w') as outfile:
+                outfile.write(text)
+            assert list(iter_documents(path)) == load_dataset(path) == expected,name
+
+
+def test_index():
+    documents,_ = generate_corpus(12,seed=3)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in ('data.json','data.jsonl'):
+            path = os.path.join(tmpdir,name)
+            if name.endswith('.jsonl'):
+                write_json_lines(documents,path)
+            else:
+                with open(path,'w') as outfile:
+                    outfile.write(json.dumps(documents))
+            offsets = build_index(path)
+            assert os.path.exists(index_path(path))
+            assert len(offsets) == len(documents)
+            with open(path,'rb') as infile:
+                data = infile.read()
+            assert [ json.loads(data[start:end]) for start,end in offsets ] == documents
+            assert load_index(path) == offsets
+
+            #stale index: same size but a new mtime, then a new size with the old mtime
+            stat = os.stat(path)
+            with open(path,'wb') as outfile:
+                outfile.write(data.replace(b'"idx": 0,',b'"idx": 9,',1))
+            os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns + 10**9))
+            assert select_documents(path,slice(0,1))[0]['tokens'][0][0]['idx'] == 9
+            with open(path,'wb') as outfile:
+                outfile.write(data.replace(b'"idx": 0,',b'"idx": 1000,',1))
+            os.utime(path,ns=(stat.st_atime_ns,stat.st_mtime_ns + 10**9))
+            assert select_documents(path,slice(0,1))[0]['tokens'][0][0]['idx'] == 1000
+            assert load_index(path)[1:] == [ (start+3,end+3) for start,end in offsets[1:] ]
+
+            #unreadable index: rebuilt
+            with open(index_path(path),'w') as outfile:
+                outfile.write('{')
+            assert load_index(path)[0][0] == offsets[0][0]
+
+
+def test_selection():
+    documents,_ = generate_corpus(10,seed=4)
+    assert parse_selection() is None
+    assert parse_selection(3) == slice(3,4)
+    assert parse_selection(0,'5:6') == slice(0,1)      #--doc wins over --range
+    assert parse_selection(-1) == slice(-1,None)
+    assert parse_selection(-2) == slice(-2,-1)
+    for span,expected in (('2:5',slice(2,5)),(':3',slice(None,3)),('7:',slice(7,None)),(':',slice(None,None)),
+                          (' 1 : 4 ',slice(1,4)),('-3:',slice(-3,None)),('5:2',slice(5,2))):
+        assert parse_selection(span=span) == expected,span
+    for span in ('3','1:2:3','a:b','1.5:2',''):
+        try:
+            parse_selection(span=span)
+        except Exception as error:
+            assert 'aborting' in str(error)
+            continue
+        raise AssertionError(f'{span!r} was parsed')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir,'data.json')
+        with open(path,'w') as outfile:
+            outfile.write(json.dumps(documents))
+        for selection in (slice(3,4),slice(-1,None),slice(-2,-1),slice(2,5),slice(None,3),slice(7,None),slice(None,None),
+                          slice(5,2),slice(8,20),slice(10,11),slice(-20,2)):
+            assert select_documents(path,selection) == documents[selection],selection
+            assert read_dataset(path,selection=selection) == documents[selection],selection
+
+
+def test_shard_round_trip():
+    documents,_ = generate_corpus(23,seed=0)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        write_dir(documents,os.path.join(tmpdir,'json'))
+        for fmt in ('json','jsonl'):
+            for shard_size in (None,1,5,23,100):
+                outfile = os.path.join(tmpdir,f'merged-{shard_size}.{fmt}')
+                assert merge_dir(os.path.join(tmpdir,'json'),outfile,fmt=fmt,shard_size=shard_size) == len(documents)
+                assert load_dataset(outfile) == documents
+                assert list(iter_documents(outfile)) == documents
+                assert read_dataset(outfile) == documents
+                assert list(read_dataset(outfile,stream=True)) == documents
+                for selection in (slice(0,1),slice(4,12),slice(-3,None),slice(None,None,-1),slice(30,40)):
+                    assert select_documents(outfile,selection) == documents[selection],selection
+                if shard_size is not None:
+                    assert list(iter_shards(outfile)) == documents
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
@@ -0,0 +1,103 @@
+#Checks of the evaluation server of eval_server.py, served on an ephemeral localhost port.
+#Run as: python test_eval_server.py (requires the fork start method)
+
+import asyncio
+import json
+import socket
+import threading
+
+import eval_server
+from benchmark import generate_corpus
+from eval_server import REFERENCES,EvalServer,connect,submit
+from evaluate import Evaluator,eval_views
+
+
+def start_server():
+    """
+    Serves the loaded references from a background thread
+    Returns:
+       (server,port,stop) the EvalServer, its port and a function stopping it
+    """
+    server  = EvalServer(workers=1)
+    #forks the worker now: a worker forked later would keep the sockets of the clients of this process open
+    server.pool.submit(int).result()
+    loop    = asyncio.new_event_loop()
+    started = threading.Event()
+    state   = { }
+    async def run():
+        state['server'] = await asyncio.start_server(server.handle,'127.0.0.1',0)
+        state['port']   = state['server'].sockets[0].getsockname()[1]
+        started.set()
+        async with state['server']:
+            try:
+                await state['server'].serve_forever()
+            except asyncio.CancelledError:
+                pass
+        #lets the handlers of the connections closed by the clients finish
+        await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}))
+    thread = threading.Thread(target=loop.run_until_complete,args=(run(),))
+    thread.start()
+    started.wait()
+    def stop():
+        loop.call_soon_threadsafe(state['server'].close)
+        thread.join()
+        loop.close()
+        server.close()
+    return server,state['port'],stop
+
+
+def raw_request(port,data):
+    """
+    Sends raw bytes on a new connection
+    Returns:
+       (status,response) the HTTP status and the json response, read until the server closes the connection
+    """
+    with socket.create_connection(('127.0.0.1',port),timeout=30) as sock:
+        sock.sendall(data)
+        received = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            received += chunk
+    head,_,payload = received.partition(b'\r\n\r\n')
+    assert b'Connection: close' in head
+    return int(head.split()[1]),json.loads(payload)
+
+
+def test_requests():
+    refs,preds = generate_corpus(20,seed=5)
+    REFERENCES['ref'] = Evaluator(refs)
+    server,port,stop = start_server()
+    try:
+        connection = connect(port=port,timeout=30)
+        body = json.dumps(preds).encode('utf-8')
+        response = submit(connection,'ref',body,alpha=0.5)
+        assert response['documents'] == 20
+        assert json.loads(json.dumps(eval_views(preds,refs))) == response['results']
+        #the connection is kept alive across requests
+        assert submit(connection,'ref',b'\n'.join(json.dumps(pred).encode('utf-8') for pred in preds)) == response
+        connection.close()
+
+        for data in (b'GARBAGE\r\n\r\n',
+                     b'POST /evaluate/ref\r\n\r\n',
+                     b'POST /evaluate/ref HTTP/1.1\r\nno header separator\r\n\r\n',
+                     b'POST /evaluate/ref HTTP/1.1\r\nContent-Length: ten\r\n\r\n',
+                     b'POST /evaluate/ref HTTP/1.1\r\nContent-Length: -1\r\n\r\n'):
+            status,error = raw_request(port,data)
+            assert status == 400 and 'Malformed' in error['error'],data
+        status,error = raw_request(port,b'POST /evaluate/ref HTTP/1.1\r\nContent-Length: 3\r\nConnection: close\r\n\r\n[{]')
+        assert status == 400 and 'error' in error
+        status,error = raw_request(port,b'POST /evaluate/missing HTTP/1.0\r\nContent-Length: 2\r\n\r\n[]')
+        assert status == 404
+        assert server.requests == 9
+    finally:
+        stop()
+        REFERENCES.clear()
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
@@ -0,0 +1,90 @@
+#Checks of the exact fixed point sums of evaluate.EvalState.
+#Run as: python test_eval_state.py
+
+import math
+import random
+from fractions import Fraction
+
+from evaluate import FIXED_SHIFT,EvalState,prf,to_fixed
+
+
+def random_floats(rng,n):
+    """
+    Returns:
+       list of non negative floats of very different magnitudes, as P/R/F
+       scores and adversarial values for naive float sums
+    """
+    values = [ ]
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.5:
+            values.append(rng.randint(0,50) / rng.randint(1,50))
+        elif kind < 0.8:
+            values.append(rng.random())
+        elif kind < 0.9:
+            values.append(rng.random() * 2.**rng.randint(-1074,0))     #down to subnormals
+        else:
+            values.append(rng.choice([0.,1.,1e-16,1-2**-53,5e-324]))
+    return values
+
+
+def test_to_fixed_is_exact():
+    rng = random.Random(0)
+    for x in random_floats(rng,10000):
+        assert Fraction(to_fixed(x),1 << FIXED_SHIFT) == Fraction(x),x
+
+
+def test_sums_match_fsum():
+    #the fixed point sum is exact, rounding it once gives the correctly rounded sum, as math.fsum does
+    rng = random.Random(1)
+    for n in (1,2,10,1000,20000):
+        values = random_floats(rng,n)
+        total  = sum(map(to_fixed,values))
+        assert total / (1 << FIXED_SHIFT) == math.fsum(values),n
+
+
+def test_macro_averages():
+    rng    = random.Random(2)
+    state  = EvalState()
+    scores = [ ]
+    for _ in range(5000):
+        nref  = rng.randint(0,20)
+        npred = rng.randint(0,20)
+        tp    = rng.randint(0,min(npred,nref))
+        state.add('labeled','spans','strict',tp,npred,nref)
+        scores.append(prf(tp,npred,nref))
+    macro,_ = state.scores('labeled','spans','strict')
+    for idx in range(3):
+        exact = Fraction(sum(Fraction(score[idx]) for score in scores),len(scores))
+        assert macro[idx] == float(exact)
+        assert math.isclose(macro[idx],math.fsum(score[idx] for score in scores) / len(scores),rel_tol=1e-15)
+
+
+def test_merge_order():
+    #states of shards merge to the very same counts whatever the sharding and the merge order
+    rng    = random.Random(3)
+    counts = [ (rng.randint(0,5),rng.randint(5,10),rng.randint(5,10)) for _ in range(3000) ]
+    whole  = EvalState()
+    for doc_counts in counts:
+        whole.add('unlabeled','rels','relaxed',*doc_counts)
+    for _ in range(10):
+        cuts   = sorted(rng.sample(range(1,len(counts)),rng.randint(1,20)))
+        shards = [ ]
+        for start,end in zip([0] + cuts,cuts + [len(counts)]):
+            shard = EvalState()
+            for doc_counts in counts[start:end]:
+                shard.add('unlabeled','rels','relaxed',*doc_counts)
+            shards.append(EvalState.from_dict(shard.to_dict()))
+        rng.shuffle(shards)
+        merged = EvalState()
+        for shard in shards:
+            merged.merge(shard)
+        assert merged.counts == whole.counts
+        assert merged.results() == whole.results()
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
@@ -0,0 +1,131 @@
+#Checks that the NumPy backend (evaluate_numpy.py) gives the same results as the
+#pure python evaluation, and checks its building blocks against brute force versions.
+#Run as: python test_evaluate_numpy.py (requires numpy)
+
+import random
+import time
+
+import numpy as np
+
+from benchmark import generate_corpus
+from document import Corpus
+from evaluate import FIXED_SHIFT,eval_dataset,eval_state,eval_sweep,eval_views,to_fixed
+from evaluate_numpy import fixed_sum,overlap_pairs,row_ids
+
+ALPHAS = (0.,0.25,0.5,1.)
+
+
+def synthetic_corpus(seed,ndocs=60):
+    """
+    Returns:
+       (refs,preds) noisy predictions, half of them without a 'spans' field (decoded from the BIO tags)
+    """
+    refs,preds = generate_corpus(ndocs,paragraphs=3,tokens=40,noise=0.3,seed=seed)
+    for pred in preds[::2]:
+        del pred['spans']
+    return refs,preds
+
+
+def test_backends():
+    for seed in range(6):
+        refs,preds = synthetic_corpus(seed)
+        for alpha in ALPHAS:
+            python = eval_state(preds,refs,alpha=alpha)
+            vector = eval_state(preds,refs,alpha=alpha,backend='numpy')
+            assert vector.counts == python.counts,(seed,alpha)
+            assert eval_views(preds,refs,alpha=alpha,backend='numpy') == eval_views(preds,refs,alpha=alpha),(seed,alpha)
+
+
+def test_documents():
+    #Document arrays are packed as they are, pred and ref corpora have their own vocabularies
+    for seed in range(3):
+        refs,preds = synthetic_corpus(seed)
+        for pred in preds[1::3]:
+            pred.pop('rels')
+        pred_corpus,ref_corpus = Corpus.from_dicts(preds),Corpus.from_dicts(refs)
+        mixed = [ pred_corpus[idx] if idx % 2 else pred for idx,pred in enumerate(preds) ]
+        for alpha in ALPHAS:
+            python = eval_state(preds,refs,alpha=alpha).counts
+            for pred_docs,ref_docs in ((pred_corpus,ref_corpus),(preds,ref_corpus),(mixed,refs)):
+                assert eval_state(pred_docs,ref_docs,alpha=alpha,backend='numpy').counts == python,(seed,alpha)
+
+
+def test_errors():
+    doc = {'tokens':[[{'idx':0,'str':'a','arg':'B-Claim'},{'idx':2,'str':'b','arg':'I-Claim'}]],'spans':[ ]}
+    for pred in ({'spans':[ ]},{'tokens':[[ ],[ ]]},{'tokens':[[{'idx':0,'str':'a','arg':'O'}]]}):
+        messages = [ ]
+        for backend in ('python','numpy'):
+            try:
+                eval_state([pred],[doc],backend=backend)
+            except Exception as error:
+                messages.append(str(error))
+        assert len(messages) == 2 and messages[0] == messages[1],messages
+
+
+def test_throughput():
+    refs,preds = generate_corpus(2000,seed=7)
+    pred_corpus,ref_corpus = Corpus.from_dicts(preds),Corpus.from_dicts(refs)
+    seconds = { }
+    for backend in ('python','numpy'):
+        start = time.perf_counter()
+        eval_dataset(pred_corpus,ref_corpus,backend=backend)
+        seconds[backend] = time.perf_counter() - start
+    #the gain is about 5x on documents arrays, 2.5x on json dicts (see benchmark.py)
+    assert seconds['numpy'] * 2 < seconds['python'],seconds
+
+
+def test_sweep():
+    refs,preds = synthetic_corpus(6)
+    assert eval_sweep(preds,refs,alphas=ALPHAS,backend='numpy') == eval_sweep(preds,refs,alphas=ALPHAS)
+
+
+def test_overlap_pairs():
+    rng = np.random.default_rng(0)
+    for alpha in (-1.,) + ALPHAS:
+        for _ in range(20):
+            npred,nref = rng.integers(0,60,size=2)
+            pgroup,rgroup = rng.integers(0,4,size=npred),rng.integers(0,4,size=nref)
+            pstart,rstart = rng.integers(0,50,size=npred),rng.integers(0,50,size=nref)
+            pend,rend     = pstart + rng.integers(0,8,size=npred),rstart + rng.integers(0,8,size=nref)
+            pidx,ridx = overlap_pairs(pgroup,pstart,pend,rgroup,rstart,rend,alpha)
+            expected  = set()
+            for p in range(npred):
+                for r in range(nref):
+                    overlap = min(pend[p],rend[r]) - max(pstart[p],rstart[r]) + 1
+                    length  = rend[r] - rstart[r] + 1
+                    match   = overlap > 0 and overlap > alpha * length if alpha >= 0 else length > 0
+                    if pgroup[p] == rgroup[r] and match:
+                        expected.add((p,r))
+            assert len(pidx) == len(expected)
+            assert set(zip(pidx.tolist(),ridx.tolist())) == expected,alpha
+
+
+def test_row_ids():
+    rng = np.random.default_rng(1)
+    #small values use the packed key, huge values the lexicographic sort
+    for high in (5,2**40):
+        for _ in range(20):
+            first  = [ rng.integers(0,high,size=30) for _ in range(3) ]
+            second = [ np.concatenate([ column[:10],rng.integers(0,high,size=20) ]) for column in first ]
+            ids1,ids2 = row_ids(*zip(first,second))
+            rows = [ tuple(row) for row in zip(*first) ] + [ tuple(row) for row in zip(*second) ]
+            ids  = ids1.tolist() + ids2.tolist()
+            for i in range(len(rows)):
+                for j in range(len(rows)):
+                    assert (ids[i] == ids[j]) == (rows[i] == rows[j])
+
+
+def test_fixed_sum():
+    rng = random.Random(2)
+    for n in (0,1,100,5000):
+        values = [ rng.random() * 2.**rng.randint(-1074,0) if rng.random() < 0.2 else rng.randint(0,30) / rng.randint(1,30)
+                   for _ in range(n) ]
+        assert fixed_sum(np.array(values,dtype=np.float64)) == sum(map(to_fixed,values))
+    assert FIXED_SHIFT == 1074
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
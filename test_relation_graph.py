@@ -0,0 +1,104 @@
+#Checks of the relation graph index of relation_graph.py on small hand built graphs.
+#Run as: python test_relation_graph.py (requires numpy)
+
+from document import Corpus
+from relation_graph import RelationGraph
+
+
+def document(spans,rels):
+    """
+    Args:
+       spans (list): (start,end,label) triples
+       rels (list) : (src,tgt,label) triples, src and tgt are (start,end) couples
+    Returns:
+       dict. a document in the json dataset format
+    """
+    return {'tokens':[ [ {'idx':idx,'str':'w','arg':'O'} for idx in range(25) ] ],
+            'spans':[ {'start':start,'end':end,'name':label} for start,end,label in spans ],
+            'rels':[ {'src':list(src),'tgt':list(tgt),'name':label} for src,tgt,label in rels ]}
+
+
+A,B,C,D,E = (0,0),(2,3),(5,5),(7,8),(10,10)
+X,Y,Z,W   = (0,1),(3,3),(5,6),(8,8)
+P,Q,R,S   = (0,0),(2,2),(4,4),(6,7)     #S is a relation endpoint but not a span
+
+DOCUMENTS = [
+    #a tree rooted at A and an isolated span E
+    document([A+('Claim',),B+('Premise',),C+('Premise',),D+('Premise',),E+('Premise',)],
+             [(B,A,'supports'),(C,A,'attacks'),(D,B,'supports')]),
+    #a cycle X -> Y -> Z -> X, and W pointing into it
+    document([X+('Claim',),Y+('Premise',),Z+('Premise',),W+('Premise',)],
+             [(X,Y,'supports'),(Y,Z,'supports'),(Z,X,'attacks'),(W,X,'attacks')]),
+    #no span, no relation
+    document([ ],[ ]),
+    #a forest of two trees, one of them rooted at R and reached from a non span endpoint
+    document([P+('Premise',),Q+('Claim',),R+('Claim',)],[(P,Q,'supports'),(S,R,'attacks')]),
+]
+
+
+def check_graph(graph):
+    assert graph.ndocs == 4 and len(graph) == 5 + 4 + 0 + 4
+    assert list(graph.nodes(2)) == [ ]
+    a,b,c,d,e = graph.nodes(0)
+    x,y,z,w   = graph.nodes(1)
+    p,q,r,s   = graph.nodes(3)
+    assert graph.node(3,*S) == s and graph.span(s) == (3,6,7,None) and graph.span(a) == (0,0,0,'Claim')
+    assert graph.node(0,*X) == -1
+
+    assert graph.in_degrees().tolist()  == [2,1,0,0,0, 2,1,1,0, 0,1,1,0]
+    assert graph.out_degrees().tolist() == [0,1,1,1,0, 1,1,1,1, 1,0,0,1]
+    assert sorted(graph.predecessors(a).tolist()) == [b,c]
+    assert graph.predecessors(a,rel_label='supports').tolist() == [b]
+    assert graph.predecessors(a,span_label='Claim').tolist() == [ ]
+    assert graph.successors(s).tolist() == [r]
+
+    assert graph.depths().tolist() == [0,1,1,2,0, -1,-1,-1,-1, 1,0,0,1]
+    assert graph.depths('attacks').tolist() == [0,0,1,0,0, 0,0,1,1, 0,0,0,1]
+    assert graph.chain(d) == [d,b,a]
+    assert graph.chain(w,rel_label='attacks') == [w,x]
+    assert graph.chain(y) is None
+    assert graph.path(d,a) == [d,b,a]
+    assert graph.path(a,d) is None
+    assert graph.path(a,d,directed=False) == [a,b,d]
+    assert graph.path(a,e,directed=False) is None
+
+    trees = graph.tree_stats()
+    assert trees['nodes'].tolist()     == [5,4,0,4]
+    assert trees['edges'].tolist()     == [3,4,0,2]
+    assert trees['trees'].tolist()     == [1,0,0,2]
+    assert trees['max_depth'].tolist() == [2,-1,0,1]
+    assert trees['cyclic'].tolist()    == [0,4,0,0]
+    assert graph.tree_stats('attacks')['max_depth'].tolist() == [1,1,0,1]
+
+    stats = graph.stats()
+    assert stats == {'documents':4,'nodes':13,'spans':12,'relations':9,
+                     'relation_labels':{'supports':5,'attacks':4},
+                     'trees':3,'isolated':1,'cyclic':4,
+                     'in_degree':{0:6,1:5,2:2},
+                     'out_degree':{0:4,1:9},
+                     'depth':{-1:4,0:3,1:4,2:1},
+                     'tree_depth':{-1:1,0:1,1:1,2:1}},stats
+
+
+def test_dicts():
+    check_graph(RelationGraph(DOCUMENTS))
+
+
+def test_documents():
+    check_graph(Corpus.from_dicts(DOCUMENTS).graph())
+
+
+def test_empty():
+    graph = RelationGraph([ ])
+    assert graph.ndocs == 0 and len(graph) == 0
+    assert graph.stats()['tree_depth'] == { }
+    graph = RelationGraph([document([A+('Claim',)],[ ])])
+    assert graph.depths().tolist() == [0]
+    assert graph.stats()['isolated'] == 1 and graph.stats()['trees'] == 0
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
@@ -0,0 +1,69 @@
+#Checks of the paired bootstrap test of significance.py on seeded synthetic systems.
+#Run as: python test_significance.py (requires numpy)
+
+import math
+
+from benchmark import generate_corpus
+from evaluate import eval_views
+from significance import compare_systems,document_counts,paired_bootstrap
+
+SAMPLES = 2000
+
+
+def systems():
+    """
+    Returns:
+       (refs,noisy,better) the reference documents, noisy predictions and
+       predictions of a clearly better system (less noise)
+    """
+    refs,noisy = generate_corpus(80,noise=0.4,seed=0)
+    _,better   = generate_corpus(80,noise=0.05,seed=0)
+    return refs,noisy,better
+
+
+def results_items(results):
+    for view,keys in results.items():
+        for key,modes in keys.items():
+            for mode,averages in modes.items():
+                for average,result in averages.items():
+                    yield (view,key,mode,average),result
+
+
+def test_identical_systems():
+    refs,noisy,_ = systems()
+    for _,result in results_items(compare_systems(noisy,noisy,refs,samples=SAMPLES,seed=1)):
+        assert result['delta'] == 0. and result['ci_delta'] == (0.,0.)
+        assert result['p_value'] == 1.
+
+
+def test_better_system():
+    refs,noisy,better = systems()
+    results = compare_systems(noisy,better,refs,samples=SAMPLES,seed=2)
+    for name,result in results_items(results):
+        assert result['delta'] > 0,name
+        assert result['p_value'] < 0.05,(name,result['p_value'])
+        low,high = result['ci_delta']
+        assert 0 < low <= high,name
+    #the observed scores are those of the evaluation
+    scores_a,scores_b = eval_views(noisy,refs),eval_views(better,refs)
+    for (view,key,mode,average),result in results_items(results):
+        for scores,system in ((scores_a,'a'),(scores_b,'b')):
+            expected = scores[view][key]['micro'][mode]['f'] if average == 'micro' else scores[view][key][mode]['f']
+            assert math.isclose(result[system],expected,rel_tol=1e-12),(view,key,mode,average)
+
+
+def test_seed():
+    refs,noisy,better = systems()
+    names,counts = document_counts(noisy,better,refs)
+    first  = paired_bootstrap(names,counts,samples=SAMPLES,seed=3)
+    assert paired_bootstrap(names,counts,samples=SAMPLES,seed=3) == first
+    #the resamples are the same whatever the batch size
+    assert paired_bootstrap(names,counts,samples=SAMPLES,seed=3,batch_size=7) == first
+    assert paired_bootstrap(names,counts,samples=SAMPLES,seed=4) != first
+
+
+if __name__ == '__main__':
+    for name,test in list(globals().items()):
+        if name.startswith('test_'):
+            test()
+            print(name,'ok')
@@ -1,40 +1,70 @@
 #This script pretty prints the json data files for manual inspection
 
+from document import Corpus
 
 
+def as_corpus(dataset):
+    """
+    Args:
+       dataset : a Corpus or a list of documents in the json dataset format
+    Returns:
+       Corpus
+    """
+    return dataset if isinstance(dataset,Corpus) else Corpus.from_dicts(dataset)
 
-def view_dataset(annotations):
-    for document in annotations:
-        for parag in document['tokens']:
-            for token in parag:
-                print(f"{token['idx']}\t{token['str']}\t{token['arg']}")
+
+def view_dataset(dataset):
+    for document in as_corpus(dataset):
+        strs,tags = document.vocabs.strs,document.vocabs.tags
+        for start,end in document.paragraphs():
+            for i in range(start,end):
+                print(f"{document.token_idx[i]}\t{strs[document.token_str[i]]}\t{tags[document.token_tag[i]]}")
             print()
-        for rel in document['rels']:
-            print(f"{tuple(rel['src'])}\t{rel['name']}\t{tuple(rel['tgt'])}")
+        for src,tgt,label in document.rels() or [ ]:
+            print(f"{src}\t{label}\t{tgt}")
         print()
 
-def view_stats(annotations):
-    ndocs   = len(annotations)
+def view_stats(dataset):
+    corpus  = as_corpus(dataset)
+    ndocs   = len(corpus)
     nparags = 0
     ntokens = 0
-    for document in annotations:
-        nparags += len(document)
-        for parag in document['tokens']:
-            ntokens += len(parag)
+    for document in corpus:
+        nparags += len(document.paragraphs())
+        ntokens += len(document)
     print(f"""
     num tokens     = {ntokens}
     num parags     = {nparags}
     num documents  = {ndocs}
 """)
+    try:
+        stats = corpus.graph().stats()
+    except ImportError:     #numpy is missing
+        return
+    def distribution(counts):
+        return ' '.join(f'{value}:{count}' for value,count in counts.items())
+    print(f"""    num spans      = {stats['spans']}
+    num relations  = {stats['relations']} ({distribution(stats['relation_labels'])})
+    num trees      = {stats['trees']}
+    in-degrees     = {distribution(stats['in_degree'])}
+    tree depths    = {distribution(stats['tree_depth'])}
+""")
 
         
 if __name__ == '__main__':
-    import json
-    import sys
-
-    with open(sys.argv[1]) as infile:
-        annotations = json.loads(infile.read())
-        view_dataset(annotations)
-        print('-'*80)
-        view_stats(annotations)
+    import argparse
+    from dataset_io import parse_selection
+    parser = argparse.ArgumentParser(
+                    prog='python view_data.py [data_file]',
+                    description='Pretty prints a dataset file for manual inspection.')
+    parser.add_argument('data_file',help="json, json-lines or columnar corpus directory")
+    parser.add_argument('--doc',default=None,type=int,help="prints a single document, read from the file offset index (the offsets are recorded in a <file>.idx sidecar on first use)")
+    parser.add_argument('--range',default=None,metavar='A:B',help="prints the documents A to B (excluded), read from the file offset index")
+    args = parser.parse_args()
+
+    selection = parse_selection(args.doc,args.range)
+    corpus    = Corpus.load(args.data_file,selection)
+    view_dataset(corpus)
+    print('-'*80)
+    view_stats(corpus)
         